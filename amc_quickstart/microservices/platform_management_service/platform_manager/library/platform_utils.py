@@ -15,13 +15,15 @@
 import boto3
 from boto3.dynamodb.types import TypeDeserializer
 
+type_deserializer = TypeDeserializer()
+
 
 class PlatformUtilities():
 
     @staticmethod
     ## DynamoDB serialzation
     def _deserializeDyanmoDBItem(item):
-        return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+        return {k: type_deserializer.deserialize(value=v) for k, v in item.items()}
 
     @staticmethod
     ## DynamoDB scan with pagination
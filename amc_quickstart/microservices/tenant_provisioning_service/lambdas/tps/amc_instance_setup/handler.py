@@ -23,8 +23,10 @@ from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 logger = Logger(service="AddAMCInstance", level="INFO")
 logger.info('Get State Machine ARN env variable!')
 STATE_MACHINE_ARN = os.environ['STATE_MACHINE_ARN']
+type_deserializer = TypeDeserializer()
+
 def deserializeDyanmoDBItem(item):
-    return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+    return {k: type_deserializer.deserialize(value=v) for k, v in item.items()}
 
 # Serialize JSON object for Decimal
 def default(obj):
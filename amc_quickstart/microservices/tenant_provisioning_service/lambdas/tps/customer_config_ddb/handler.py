@@ -27,8 +27,10 @@ from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 
+type_deserializer = TypeDeserializer()
+
 def deserializeDyanmoDBItem(item):
-    return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+    return {k: type_deserializer.deserialize(value=v) for k, v in item.items()}
 
 def pushToSNSTopic(snsTopicArn, subject, message):
     client = boto3.client('sns')
@@ -0,0 +1,183 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: asyncio version of the AMC API interface.
+# Requests are sent with the pooled urllib3 client of wfm_amc_api_request from a shared thread pool, so the endpoint
+# rate limits and the retries on 429 and 5xx responses apply to them as well. Paginated results are returned with async
+# generators and the bulk methods send one request per workflow or execution concurrently, at most max_concurrency
+# at a time for each interface.
+#
+# Usage from a lambda handler:
+#   amc_api = AsyncAMCAPIInterface(logger, config)
+#   workflows = run(amc_api.get_workflows_by_id(['workflow-1', 'workflow-2']))
+#   executions = run(collect(amc_api.iter_executions(min_creation_time='2022-01-01T00:00:00')))
+
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+from amc_api_interface import wfm_amc_api_request
+
+DEFAULT_MAX_CONCURRENCY = 5
+DEFAULT_REQUEST_WORKERS = 10
+
+# the thread pool is shared by every interface of the lambda container, its size matches the urllib3 pool size
+executor = ThreadPoolExecutor(max_workers=int(os.environ.get('AMC_API_REQUEST_WORKERS', DEFAULT_REQUEST_WORKERS)))
+
+
+class AMCAPIRequestError(Exception):
+    def __init__(self, status, url, body):
+        super().__init__('AMC API request {} failed with status {}: {}'.format(url, status, body))
+        self.status = status
+        self.url = url
+        self.body = body
+
+
+# runs a coroutine to completion from synchronous code such as a lambda handler
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+# returns every item of an async generator as a list
+async def collect(async_iterable):
+    return [item async for item in async_iterable]
+
+
+class AsyncAMCAPIInterface:
+    def __init__(self, logger, config, max_concurrency=DEFAULT_MAX_CONCURRENCY):
+        self.logger = logger
+        self.config = config
+        self.max_concurrency = max_concurrency
+        self.semaphores = {}
+
+    # the semaphore belongs to the event loop it is used from, every call to run() has its own loop
+    def get_semaphore(self):
+        loop = asyncio.get_event_loop()
+        if loop not in self.semaphores:
+            self.semaphores = {loop: asyncio.Semaphore(self.max_concurrency)}
+        return self.semaphores[loop]
+
+    # sends a request and returns the status code and the decoded response body
+    async def request(self, request_method, url, request_body=''):
+        async with self.get_semaphore():
+            response = await asyncio.get_event_loop().run_in_executor(
+                executor, wfm_amc_api_request.send_request_with_retry, self.config, request_method, url, request_body)
+        body = json.loads(response.data.decode("utf-8")) if response.data else {}
+        return response.status, body
+
+    # yields the executions of the endpoint page by page, filtered by creation time and/or workflow id
+    async def iter_executions(self, min_creation_time=None, workflow_id=None):
+        parameters = {}
+        if min_creation_time is not None:
+            parameters['minCreationTime'] = min_creation_time
+        if workflow_id is not None:
+            parameters['workflowId'] = workflow_id
+
+        next_token = None
+        while True:
+            if next_token is not None:
+                parameters['nextToken'] = next_token
+            url = "{}/workflowExecutions/?{}".format(self.config['AMC']['amcApiEndpoint'], urlencode(parameters))
+            status, body = await self.request('GET', url)
+            if status != 200 or 'executions' not in body:
+                raise AMCAPIRequestError(status, url, body)
+
+            for execution in body['executions']:
+                yield execution
+
+            next_token = body.get('nextToken')
+            if next_token is None:
+                return
+
+    # returns the execution or None if it could not be received
+    async def get_execution(self, workflow_execution_id):
+        url = "{}/workflowExecutions/{}".format(self.config['AMC']['amcApiEndpoint'], workflow_execution_id)
+        status, body = await self.request('GET', url)
+        if status != 200:
+            self.logger.error('Failed to Receive Execution Status for Workflow Execution ID {}: {} {}'.format(
+                workflow_execution_id, status, body))
+            return None
+        return body
+
+    # returns a dictionary of workflowExecutionId to execution for the executions that were received
+    async def get_executions(self, workflow_execution_ids):
+        executions = await asyncio.gather(*[self.get_execution(workflow_execution_id) for workflow_execution_id in
+                                            workflow_execution_ids])
+        return {workflow_execution_id: execution for workflow_execution_id, execution in
+                zip(workflow_execution_ids, executions) if execution is not None}
+
+    # returns the workflow definition or None if it does not exist or could not be received
+    async def get_workflow(self, workflow_id):
+        url = "{}/workflows/{}".format(self.config['AMC']['amcApiEndpoint'], workflow_id)
+        status, body = await self.request('GET', url)
+        if status != 200:
+            if status != 404:
+                self.logger.error('Failed to receive workflow {}: {} {}'.format(workflow_id, status, body))
+            return None
+        return body
+
+    # returns a dictionary of workflowId to workflow definition for the workflows that were received
+    async def get_workflows_by_id(self, workflow_ids):
+        workflows = await asyncio.gather(*[self.get_workflow(workflow_id) for workflow_id in workflow_ids])
+        return {workflow_id: workflow for workflow_id, workflow in zip(workflow_ids, workflows) if
+                workflow is not None}
+
+    def get_result(self, status, url, message, body):
+        return {
+            'statusCode': status,
+            'message': message,
+            'endpointUrl': url,
+            'body': body
+        }
+
+    # creates a workflow, by default an existing workflow with the same id is updated instead, returns None on failure
+    async def create_workflow(self, payload, update_if_already_exists=True):
+        url = "{}/workflows".format(self.config['AMC']['amcApiEndpoint'])
+        status, body = await self.request('POST', url, json.dumps(payload))
+        if status == 200:
+            return self.get_result(status, url, 'Successfully created workflow {}'.format(payload['workflowId']), body)
+
+        if update_if_already_exists and body.get('message') == "Workflow with ID {} already exists.".format(
+                payload['workflowId']):
+            return await self.update_workflow(payload)
+
+        self.logger.error('Failed to create workflow {}: {} {}'.format(payload['workflowId'], status, body))
+        return None
+
+    # updates an existing workflow, returns None on failure
+    async def update_workflow(self, payload):
+        url = "{}/workflows/{}".format(self.config['AMC']['amcApiEndpoint'], payload['workflowId'])
+        status, body = await self.request('PUT', url, json.dumps(payload))
+        if status == 200:
+            return self.get_result(status, url, 'Successfully updated workflow {}'.format(payload['workflowId']), body)
+
+        self.logger.error('Failed to update workflow {}: {} {}'.format(payload['workflowId'], status, body))
+        return None
+
+    # deletes an existing workflow, returns None on failure
+    async def delete_workflow(self, payload):
+        url = "{}/workflows/{}".format(self.config['AMC']['amcApiEndpoint'], payload['workflowId'])
+        status, body = await self.request('DELETE', url, json.dumps(payload))
+        if status == 200:
+            return self.get_result(status, url, 'Successfully deleted workflow {} for customerId {}'.format(
+                payload['workflowId'], self.config['customerId']), body)
+
+        self.logger.error('Failed to delete workflow {}: {} {}'.format(payload['workflowId'], status, body))
+        return None
+
+    # creates (or updates) several workflows concurrently, the results are returned in the order of the payloads
+    async def create_workflows(self, payloads, update_if_already_exists=True):
+        return await asyncio.gather(*[self.create_workflow(payload, update_if_already_exists) for payload in
+                                      payloads])
@@ -16,15 +16,11 @@
 # Updated: 4-7-2021
 
 import json
-import calendar
-from dateutil.relativedelta import relativedelta
 import logging
-from boto3 import Session
-import urllib3
 from urllib.parse import urlencode
-from botocore.auth import SigV4Auth
-from botocore.awsrequest import AWSRequest
 from datetime import datetime, timedelta
+from amc_api_interface import wfm_amc_api_request
+from wfm import wfm_parameter_functions
 
 # This class will create HTTP Request for the AMC API Endpoint
 class AMCAPIInterface:
@@ -32,55 +28,10 @@ class AMCAPIInterface:
         self.logger = logging
         self.config = config
 
-    # gets the value between parenteses as an integer
-    def get_offset_value(self, offset_string):
-        return int(offset_string.split('(')[1].split(')')[0])
-
-    # gets the full date based on an offset from the current date(positive or negative)
-    def get_current_date_with_offset(self, offset_in_days):
-        return ((datetime.today() + timedelta(days=offset_in_days)).strftime('%Y-%m-%dT00:00:00'))
-
-    # gets the curent date based on an offset in number of months (positive or negative)
-    def get_current_date_with_month_offset(self, offset_in_months):
-        return (datetime.today() + relativedelta(months=offset_in_months))
-
-    # gets the last day of a month
-    def get_last_day_of_month(self, date):
-        return calendar.monthrange(date.year, date.month)[1]
-
     # Detects if a function is being used in place of a staitc date for timewindowstart or timewindow end
     # and generates the date value as a string in a formation that AMC will accept
-    def process_parameter_functions(self, parameter):
-        if parameter.upper() == 'NOW()':
-            return datetime.today().strftime('%Y-%m-%dT%H:%M:%S')
-
-        if "TODAY(" in parameter.upper():
-            return self.get_current_date_with_offset(self.get_offset_value(parameter))
-
-        if "LASTDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            last_day_of_previous_month = self.get_last_day_of_month(date_with_month_offset)
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month,
-                                    last_day_of_previous_month,
-                                    date_with_month_offset.hour, date_with_month_offset.minute).strftime(
-                '%Y-%m-%dT00:00:00')
-            return return_value
-
-        if "FIRSTDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month, 1,
-                                    date_with_month_offset.hour,
-                                    date_with_month_offset.minute).strftime('%Y-%m-%dT00:00:00')
-            return return_value
-
-        if "FIFTEENTHDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month, 15,
-                                    date_with_month_offset.hour,
-                                    date_with_month_offset.minute).strftime('%Y-%m-%dT00:00:00')
-            return return_value
-        # if no conditions are met, return the parameter unchanged
-        return parameter
+    def process_parameter_functions(self, parameter, now=None):
+        return wfm_parameter_functions.process_parameter_functions(parameter, now)
 
     # rounds a time to the nearest hour, this is used when running an execution based on a campaign's start or end
     # dates, if a campaing's start or end time was not ending with 00 minutes, the date must be rounded to the
@@ -108,12 +59,7 @@ class AMCAPIInterface:
 
     # Gets the sigV4 signed header value based on the customers endpointurl, request type, and body
     def get_signed_headers(self, request_method, request_endpoint_url, request_body):
-        config = self.config
-        # Generate signed http headers for Sigv4
-        AWS_REGION = config['AMC']['amcInstanceRegion']
-        request = AWSRequest(method=request_method.upper(), url=request_endpoint_url, data=request_body)
-        SigV4Auth(Session().get_credentials(), "execute-api", AWS_REGION).add_auth(request)
-        return dict(request.headers.items())
+        return wfm_amc_api_request.get_signed_headers(self.config, request_method, request_endpoint_url, request_body)
 
     # returns all workflows for the AMC endpoint
     def get_workflows(self):
@@ -126,10 +72,7 @@ class AMCAPIInterface:
         request_body = ''
         receivedWorkFlows = False
         workflowIdList = []
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
 
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
         if AMC_API_RESPONSE.status == 200:
@@ -171,10 +114,7 @@ class AMCAPIInterface:
 
         url = "{}/workflowExecutions/?workflowId={}".format(config['AMC']['amcApiEndpoint'], workflowId)
 
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -207,10 +147,7 @@ class AMCAPIInterface:
         request_method = 'GET'
         request_body = ''
         url = "{}/workflowExecutions/{}".format(config['AMC']['amcApiEndpoint'], workflowExecutionId)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -234,6 +171,8 @@ class AMCAPIInterface:
             logger.error(returnValue)
             return None
 
+        return returnValue
+
     # Returns all executions for the Endpoint created after a specified creation time in %Y-%m-%dT00:00:00 format
     def get_execution_status_by_minimum_create_time(self, minCreationTime):
         config = self.config
@@ -253,10 +192,7 @@ class AMCAPIInterface:
             receivedExecutionStatus = False
             url = "{}/workflowExecutions/?{}".format(config['AMC']['amcApiEndpoint'], urlencode(
                 {'minCreationTime': minCreationTime, "nextToken": AMC_API_RESPONSE_DICTIONARY['nextToken']}))
-            AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                             headers=self.get_signed_headers(request_method, url,
-                                                                                             request_body),
-                                                             body=request_body)
+            AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
             AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
             statuses[url] = AMC_API_RESPONSE.status
 
@@ -291,10 +227,7 @@ class AMCAPIInterface:
         message = ''
         request_method = 'POST'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -338,10 +271,7 @@ class AMCAPIInterface:
         url = "{}/workflows/{}".format(config['AMC']['amcApiEndpoint'], payload['workflowId'])
         request_method = 'PUT'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -376,10 +306,7 @@ class AMCAPIInterface:
         url = "{}/workflows/{}".format(config['AMC']['amcApiEndpoint'], payload['workflowId'])
         request_method = 'DELETE'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         logger.info('Workflow delete response {}'.format(AMC_API_RESPONSE))
@@ -416,10 +343,7 @@ class AMCAPIInterface:
         request_method = 'GET'
         request_body = ''
         logger.info('get workflow request URL: {}'.format(url))
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         logger.info('response data: {}'.format(AMC_API_RESPONSE.data))
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
         logger.info('get workflow response {}'.format(AMC_API_RESPONSE))
@@ -450,24 +374,13 @@ class AMCAPIInterface:
         message = ''
 
         # Process the parameters to enable now() and today() functions
-        if "parameterValues" in payload:
-            for parameter in payload['parameterValues']:
-                payload['parameterValues'][parameter] = self.process_parameter_functions(
-                    payload['parameterValues'][parameter])
-                logger.info("updated parameter {} to {}".format(parameter, payload['parameterValues'][parameter]))
-
-        payload['timeWindowStart'] = self.process_parameter_functions(payload['timeWindowStart'])
-        logger.info("updated parameter timeWindowStart to {}".format(payload['timeWindowStart']))
-        payload['timeWindowEnd'] = self.process_parameter_functions(payload['timeWindowEnd'])
-        logger.info("updated parameter timeWindowEnd to {}".format(payload['timeWindowEnd']))
+        wfm_parameter_functions.process_payload_parameters(payload)
+        logger.info("updated parameters {}".format(payload))
 
         url = "{}/workflowExecutions".format(config['AMC']['amcApiEndpoint'])
         request_method = 'POST'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -500,10 +413,7 @@ class AMCAPIInterface:
 
         request_method = 'DELETE'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         logger.info(
@@ -542,10 +452,7 @@ class AMCAPIInterface:
         request_method = 'GET'
         request_body = ''
         logger.info('get workflow request URL: {}'.format(url))
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=self.get_signed_headers(request_method, url,
-                                                                                         request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         logger.info('response data: {}'.format(AMC_API_RESPONSE.data))
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
@@ -587,11 +494,7 @@ class AMCAPIInterface:
             url = "{}/schedules/{}".format(config['AMC']['amcApiEndpoint'], schedule_id)
             request_method = 'DELETE'
             request_body = json.dumps(payload)
-            AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                             headers=self.get_signed_headers(config, request_method,
-                                                                                             url,
-                                                                                             request_body),
-                                                             body=request_body)
+            AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
             AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
             logger.info('schedule delete response {}'.format(AMC_API_RESPONSE))
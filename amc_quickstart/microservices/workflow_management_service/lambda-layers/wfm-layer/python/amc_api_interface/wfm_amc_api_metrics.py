@@ -0,0 +1,220 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: CloudWatch metrics for the requests sent to AMC API endpoints.
+# wfm_amc_api_request records every request by customer, endpoint, HTTP method and API operation. The values are
+# aggregated in memory and written as CloudWatch Embedded Metric Format documents, latencies and payload sizes as
+# Values/Counts histograms so CloudWatch can compute percentiles from them. The documents are written to stdout as
+# JSON lines the way the aws_lambda_powertools Metrics utility writes them, the powertools Logger nests its records in
+# a message attribute which EMF does not read.
+# The metrics are written when the lambda handler decorated with log_amc_api_metrics returns and at least every
+# AMC_API_METRICS_FLUSH_SECONDS while it runs, setting AMC_API_METRICS_ENABLED to false turns them off.
+#
+#   @wfm_amc_api_metrics.log_amc_api_metrics
+#   def lambda_handler(event, context):
+
+import functools
+import json
+import os
+import re
+import threading
+import time
+
+DEFAULT_NAMESPACE = 'AMC/WorkflowManagement'
+DEFAULT_FLUSH_SECONDS = 60
+# EMF accepts at most 100 distinct values for a metric in one document
+MAX_HISTOGRAM_VALUES = 100
+
+DIMENSIONS = ['CustomerId', 'Endpoint', 'Method', 'Operation']
+DIMENSION_SETS = [DIMENSIONS, ['Endpoint']]
+
+# ids in the URL path are replaced so that every workflow or execution is reported under the same operation
+ID_PATH_SEGMENT = '{id}'
+
+metrics_lock = threading.Lock()
+request_metrics = {}
+last_flush_time = time.monotonic()
+
+
+def is_enabled():
+    return os.environ.get('AMC_API_METRICS_ENABLED', 'true').lower() == 'true'
+
+
+# the API operation of a request URL, for example GET workflowExecutions/{id}
+def get_operation(endpoint, url):
+    path = url[len(endpoint):] if url.startswith(endpoint) else re.sub('^[a-z]+://[^/]*', '', url)
+    segments = [segment for segment in path.split('?')[0].split('/') if segment != '']
+    if len(segments) == 0:
+        return '/'
+    return '/'.join([segments[0]] + [ID_PATH_SEGMENT for segment in segments[1:]])
+
+
+# rounds a value to two significant digits so that a histogram has a bounded number of distinct values
+def get_histogram_value(value):
+    if value <= 0:
+        return 0
+    return float('{:.2g}'.format(value))
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = {}
+
+    def add(self, value):
+        value = get_histogram_value(value)
+        self.counts[value] = self.counts.get(value, 0) + 1
+
+    def is_full(self):
+        return len(self.counts) >= MAX_HISTOGRAM_VALUES
+
+    def get_metric_value(self):
+        values = sorted(self.counts)
+        return {'Values': values, 'Counts': [self.counts[value] for value in values]}
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.latency = Histogram()
+        self.rate_limit_wait = Histogram()
+        self.request_bytes = Histogram()
+        self.response_bytes = Histogram()
+        self.requests = 0
+        self.retries = 0
+        self.errors = 0
+        self.status_codes = {}
+
+    def is_full(self):
+        return self.latency.is_full() or self.rate_limit_wait.is_full() or self.request_bytes.is_full() or \
+               self.response_bytes.is_full()
+
+    def get_status_class_counts(self):
+        status_class_counts = {'Status2xx': 0, 'Status4xx': 0, 'Status429': 0, 'Status5xx': 0}
+        for status, count in self.status_codes.items():
+            if status == 429:
+                status_class_counts['Status429'] += count
+            elif 200 <= status < 300:
+                status_class_counts['Status2xx'] += count
+            elif 400 <= status < 500:
+                status_class_counts['Status4xx'] += count
+            elif status >= 500:
+                status_class_counts['Status5xx'] += count
+        return status_class_counts
+
+
+def get_metrics_key(config, request_method, url):
+    endpoint = config['AMC']['amcApiEndpoint']
+    return config.get('customerId', ''), endpoint, request_method.upper(), get_operation(endpoint, url)
+
+
+def get_payload_size(payload):
+    if payload is None:
+        return 0
+    if isinstance(payload, str):
+        return len(payload.encode('utf-8'))
+    return len(payload)
+
+
+# records a request sent to an AMC endpoint, status is None when no response was received
+def record_request(config, request_method, url, status, latency_seconds, rate_limit_wait_seconds, request_body,
+                   response_body):
+    if not is_enabled():
+        return
+    key = get_metrics_key(config, request_method, url)
+    with metrics_lock:
+        metrics = request_metrics.setdefault(key, RequestMetrics())
+        metrics.requests += 1
+        metrics.latency.add(latency_seconds * 1000)
+        metrics.rate_limit_wait.add(rate_limit_wait_seconds * 1000)
+        metrics.request_bytes.add(get_payload_size(request_body))
+        if status is None:
+            metrics.errors += 1
+        else:
+            metrics.status_codes[status] = metrics.status_codes.get(status, 0) + 1
+            metrics.response_bytes.add(get_payload_size(response_body))
+        flush_key = key if metrics.is_full() else None
+    if flush_key is not None:
+        flush([flush_key])
+    elif time.monotonic() - last_flush_time > int(os.environ.get('AMC_API_METRICS_FLUSH_SECONDS',
+                                                                   DEFAULT_FLUSH_SECONDS)):
+        flush()
+
+
+def record_retry(config, request_method, url):
+    if not is_enabled():
+        return
+    with metrics_lock:
+        request_metrics.setdefault(get_metrics_key(config, request_method, url), RequestMetrics()).retries += 1
+
+
+def get_emf_document(key, metrics, namespace):
+    customer_id, endpoint, method, operation = key
+    metric_values = {
+        'AmcApiRequests': (metrics.requests, 'Count'),
+        'AmcApiRetries': (metrics.retries, 'Count'),
+        'AmcApiErrors': (metrics.errors, 'Count')
+    }
+    for name, histogram, unit in [('AmcApiLatency', metrics.latency, 'Milliseconds'),
+                                  ('AmcApiRateLimitWait', metrics.rate_limit_wait, 'Milliseconds'),
+                                  ('AmcApiRequestBytes', metrics.request_bytes, 'Bytes'),
+                                  ('AmcApiResponseBytes', metrics.response_bytes, 'Bytes')]:
+        if len(histogram.counts) > 0:
+            metric_values[name] = (histogram.get_metric_value(), unit)
+    for status_class, count in metrics.get_status_class_counts().items():
+        metric_values['AmcApi{}'.format(status_class)] = (count, 'Count')
+
+    document = {
+        '_aws': {
+            'Timestamp': int(time.time() * 1000),
+            'CloudWatchMetrics': [{
+                'Namespace': namespace,
+                'Dimensions': DIMENSION_SETS,
+                'Metrics': [{'Name': name, 'Unit': unit} for name, (value, unit) in metric_values.items()]
+            }]
+        },
+        'CustomerId': customer_id,
+        'Endpoint': re.sub('^[a-z]+://', '', endpoint).split('/')[0],
+        'Method': method,
+        'Operation': operation,
+        # the individual status codes are kept as a property for CloudWatch Logs Insights queries
+        'StatusCodes': {str(status): count for status, count in sorted(metrics.status_codes.items())}
+    }
+    for name, (value, unit) in metric_values.items():
+        document[name] = value
+    return document
+
+
+# writes the recorded metrics of the given keys (all keys by default) and removes them
+def flush(keys=None):
+    global last_flush_time
+    with metrics_lock:
+        if keys is None:
+            keys = list(request_metrics)
+            last_flush_time = time.monotonic()
+        flushed_metrics = [(key, request_metrics.pop(key)) for key in keys if key in request_metrics]
+
+    namespace = os.environ.get('AMC_API_METRICS_NAMESPACE', DEFAULT_NAMESPACE)
+    for key, metrics in flushed_metrics:
+        print(json.dumps(get_emf_document(key, metrics, namespace), separators=(',', ':')))
+
+
+# writes the AMC API metrics recorded during the invocation when the handler returns or raises
+def log_amc_api_metrics(lambda_handler):
+    @functools.wraps(lambda_handler)
+    def decorate(event, context):
+        try:
+            return lambda_handler(event, context)
+        finally:
+            flush()
+
+    return decorate
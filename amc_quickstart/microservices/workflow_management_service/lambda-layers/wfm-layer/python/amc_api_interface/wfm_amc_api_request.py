@@ -0,0 +1,130 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Sends SigV4 signed requests to AMC API endpoints.
+# All requests made by a lambda container share one urllib3 connection pool and one set of credentials, and requests
+# to the same AMC endpoint are spaced out so that concurrent callers stay under the endpoint's request rate.
+# send_request_with_retry retries throttled (429) and server error (5xx) responses with exponential backoff and full
+# jitter so that callers retrying at the same time do not send their retries together.
+# Every request and retry is recorded with wfm_amc_api_metrics.
+
+import os
+import random
+import threading
+import time
+import urllib3
+from boto3 import Session
+from botocore.auth import SigV4Auth
+from botocore.awsrequest import AWSRequest
+from amc_api_interface import wfm_amc_api_metrics
+
+DEFAULT_REQUESTS_PER_SECOND = 5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_MAX_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 0.5
+RETRY_MAX_DELAY_SECONDS = 8
+RETRYABLE_STATUS_CODES = [429, 500, 502, 503, 504]
+
+# the pool keeps connections to each endpoint open between requests and invocations, maxsize is per endpoint host
+http = urllib3.PoolManager(maxsize=int(os.environ.get('AMC_API_HTTP_POOL_SIZE', DEFAULT_POOL_SIZE)))
+
+credentials = None
+credentials_lock = threading.Lock()
+
+rate_limiters = {}
+rate_limiters_lock = threading.Lock()
+
+
+class RequestRateLimiter:
+    def __init__(self, requests_per_second):
+        self.interval_seconds = 1 / requests_per_second
+        self.next_request_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    # waits until the next request can be sent to the endpoint
+    def acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            request_time = max(now, self.next_request_time)
+            self.next_request_time = request_time + self.interval_seconds
+        if request_time > now:
+            time.sleep(request_time - now)
+
+
+def get_credentials():
+    global credentials
+    with credentials_lock:
+        if credentials is None:
+            # the credentials returned by the session refresh themselves when they expire
+            credentials = Session().get_credentials()
+    return credentials
+
+
+# the request rate can be set per customer with AMC.amcApiRequestsPerSecond in the customer config record
+def get_rate_limiter(config):
+    endpoint = config['AMC']['amcApiEndpoint']
+    with rate_limiters_lock:
+        if endpoint not in rate_limiters:
+            requests_per_second = float(config['AMC'].get('amcApiRequestsPerSecond', os.environ.get(
+                'AMC_API_REQUESTS_PER_SECOND', DEFAULT_REQUESTS_PER_SECOND)))
+            rate_limiters[endpoint] = RequestRateLimiter(requests_per_second)
+        return rate_limiters[endpoint]
+
+
+def get_signed_headers(config, request_method, request_endpoint_url, request_body):
+    # Generate signed http headers for Sigv4
+    request = AWSRequest(method=request_method.upper(), url=request_endpoint_url, data=request_body)
+    SigV4Auth(get_credentials(), "execute-api", config['AMC']['amcInstanceRegion']).add_auth(request)
+    return dict(request.headers.items())
+
+
+# sends a request to the customer's AMC endpoint and returns the urllib3 response
+def send_request(config, request_method, url, request_body=''):
+    wait_start_time = time.monotonic()
+    get_rate_limiter(config).acquire()
+    request_start_time = time.monotonic()
+    response = None
+    try:
+        # the request is signed after waiting for the rate limiter so the signature is not stale when it is sent
+        response = http.request(request_method, url,
+                                headers=get_signed_headers(config, request_method, url, request_body),
+                                body=request_body)
+        return response
+    finally:
+        wfm_amc_api_metrics.record_request(
+            config, request_method, url, response.status if response is not None else None,
+            time.monotonic() - request_start_time, request_start_time - wait_start_time, request_body,
+            response.data if response is not None else None)
+
+
+def get_retry_delay(response, attempt):
+    delay = random.uniform(0, min(RETRY_MAX_DELAY_SECONDS, RETRY_BASE_DELAY_SECONDS * (2 ** attempt)))
+    retry_after = response.headers.get('Retry-After')
+    if retry_after is not None and retry_after.isdigit():
+        delay = max(delay, min(int(retry_after), RETRY_MAX_DELAY_SECONDS))
+    return delay
+
+
+# sends a request and retries it while the endpoint throttles or fails, the last response is returned
+def send_request_with_retry(config, request_method, url, request_body='', max_attempts=None):
+    if max_attempts is None:
+        max_attempts = int(os.environ.get('AMC_API_MAX_ATTEMPTS', DEFAULT_MAX_ATTEMPTS))
+    attempt = 0
+    while True:
+        response = send_request(config, request_method, url, request_body)
+        attempt += 1
+        if response.status not in RETRYABLE_STATUS_CODES or attempt >= max_attempts:
+            return response
+        wfm_amc_api_metrics.record_retry(config, request_method, url)
+        time.sleep(get_retry_delay(response, attempt))
@@ -0,0 +1,160 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+import pytest
+from botocore.stub import Stubber, ANY
+
+from wfm import wfm_admission_control
+
+NOW = 1700000000.0
+SETTINGS = {'capacity': Decimal(10), 'maximumRate': Decimal(2), 'minimumRate': Decimal('0.1')}
+
+
+def get_bucket_item(available_tokens, refill_rate, last_refill_time=NOW):
+    return {
+        'bucketId': {'S': 'customer#c1#submissions'},
+        'availableTokens': {'N': str(available_tokens)},
+        'bucketCapacity': {'N': '10'},
+        'refillRate': {'N': str(refill_rate)},
+        'lastRefillTime': {'N': str(last_refill_time)},
+        'throttleCount': {'N': '0'}
+    }
+
+
+def add_get_item(stubber, item=None):
+    stubber.add_response('get_item', {'Item': item} if item is not None else {},
+                         {'TableName': 'admission', 'Key': {'bucketId': 'customer#c1#submissions'},
+                          'ConsistentRead': True})
+
+
+def add_update_item(stubber, expression_attribute_values):
+    stubber.add_response('update_item', {}, {
+        'TableName': 'admission',
+        'Key': {'bucketId': 'customer#c1#submissions'},
+        'UpdateExpression': ANY,
+        'ConditionExpression': ANY,
+        'ExpressionAttributeValues': expression_attribute_values
+    })
+
+
+def add_conditional_check_failed(stubber):
+    stubber.add_client_error('update_item', service_error_code='ConditionalCheckFailedException')
+
+
+@pytest.fixture
+def controller(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setattr(wfm_admission_control.time, 'time', lambda: NOW)
+    controller = wfm_admission_control.AdmissionController(MagicMock(), 'admission')
+    with Stubber(controller.table.meta.client) as stubber:
+        controller.stubber = stubber
+        yield controller
+        stubber.assert_no_pending_responses()
+
+
+class TestAcquire:
+
+    @staticmethod
+    def test_new_bucket_is_created_full(controller):
+        add_get_item(controller.stubber)
+        controller.stubber.add_response('put_item', {})
+        add_update_item(controller.stubber, {
+            ':tokens': Decimal('6'), ':now': Decimal(str(NOW)), ':capacity': Decimal('10'), ':rate': Decimal('2'),
+            ':previous': Decimal(str(NOW))})
+
+        assert controller.acquire('customer#c1#submissions', 4, SETTINGS) == 4
+
+    @staticmethod
+    def test_tokens_refill_at_the_refill_rate(controller):
+        add_get_item(controller.stubber, get_bucket_item(0, '1.5', NOW - 2))
+        add_update_item(controller.stubber, {
+            ':tokens': Decimal('0'), ':now': Decimal(str(NOW)), ':capacity': Decimal('10'), ':rate': Decimal('1.5'),
+            ':previous': Decimal(str(NOW - 2))})
+
+        assert controller.acquire('customer#c1#submissions', 5, SETTINGS) == 3
+
+    @staticmethod
+    def test_concurrent_update_is_retried(controller):
+        add_get_item(controller.stubber, get_bucket_item(10, 2))
+        add_conditional_check_failed(controller.stubber)
+        add_get_item(controller.stubber, get_bucket_item(8, 2))
+        add_update_item(controller.stubber, {
+            ':tokens': Decimal('0'), ':now': Decimal(str(NOW)), ':capacity': Decimal('10'), ':rate': Decimal('2'),
+            ':previous': Decimal(str(NOW))})
+
+        assert controller.acquire('customer#c1#submissions', 10, SETTINGS) == 8
+
+    @staticmethod
+    def test_no_tokens_are_granted_when_every_attempt_fails(controller):
+        for _ in range(wfm_admission_control.MAX_CONDITIONAL_UPDATE_ATTEMPTS):
+            add_get_item(controller.stubber, get_bucket_item(10, 2))
+            add_conditional_check_failed(controller.stubber)
+
+        assert controller.acquire('customer#c1#submissions', 1, SETTINGS) == 0
+
+
+class TestThrottle:
+
+    @staticmethod
+    def test_refill_rate_is_halved_and_bucket_emptied(controller):
+        add_get_item(controller.stubber, get_bucket_item(5, 2))
+        add_update_item(controller.stubber, {
+            ':zero': Decimal('0'), ':rate': Decimal('1.0'), ':now': Decimal(str(NOW)), ':one': Decimal('1'),
+            ':previous': Decimal('2')})
+
+        assert controller.throttle('customer#c1#submissions', SETTINGS) == Decimal(1)
+
+    @staticmethod
+    def test_refill_rate_does_not_drop_below_the_minimum(controller):
+        add_get_item(controller.stubber, get_bucket_item(0, '0.15'))
+        add_update_item(controller.stubber, {
+            ':zero': Decimal('0'), ':rate': Decimal('0.1'), ':now': Decimal(str(NOW)), ':one': Decimal('1'),
+            ':previous': Decimal('0.15')})
+
+        assert controller.throttle('customer#c1#submissions', SETTINGS) == Decimal('0.1')
+
+    @staticmethod
+    def test_exhausted_attempts_are_logged(controller):
+        for _ in range(wfm_admission_control.MAX_CONDITIONAL_UPDATE_ATTEMPTS):
+            add_get_item(controller.stubber, get_bucket_item(0, 2))
+            add_conditional_check_failed(controller.stubber)
+
+        assert controller.throttle('customer#c1#submissions', SETTINGS) is None
+        controller.logger.error.assert_called_once()
+
+
+class TestRecover:
+
+    @staticmethod
+    def test_refill_rate_grows_linearly(controller):
+        add_get_item(controller.stubber, get_bucket_item(0, '0.5'))
+        add_update_item(controller.stubber, {':rate': Decimal('0.8'), ':previous': Decimal('0.5')})
+
+        assert controller.recover('customer#c1#submissions', SETTINGS, 3) == Decimal('0.8')
+
+    @staticmethod
+    def test_refill_rate_is_capped_at_the_maximum(controller):
+        add_get_item(controller.stubber, get_bucket_item(0, '1.9'))
+        add_update_item(controller.stubber, {':rate': Decimal('2'), ':previous': Decimal('1.9')})
+
+        assert controller.recover('customer#c1#submissions', SETTINGS, 5) == Decimal(2)
+
+    @staticmethod
+    def test_bucket_at_the_maximum_is_not_updated(controller):
+        add_get_item(controller.stubber, get_bucket_item(0, 2))
+
+        assert controller.recover('customer#c1#submissions', SETTINGS) == Decimal(2)
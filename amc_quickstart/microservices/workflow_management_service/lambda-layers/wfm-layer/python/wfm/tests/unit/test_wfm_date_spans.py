@@ -0,0 +1,86 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+from wfm import wfm_date_spans
+
+
+def get_spans(start_date, end_date, window_size, step, granularity):
+    return [(span['timeWindowStart'], span['timeWindowEnd']) for span in
+            wfm_date_spans.iter_date_spans(start_date, end_date, window_size, step, granularity)]
+
+
+class TestIterDateSpans:
+
+    @staticmethod
+    def test_tumbling_daily_spans():
+        assert get_spans(datetime(2024, 1, 1), datetime(2024, 1, 4), 1, 1, wfm_date_spans.GRANULARITY_DAY) == [
+            ('2024-01-01T00:00:00', '2024-01-02T00:00:00'),
+            ('2024-01-02T00:00:00', '2024-01-03T00:00:00'),
+            ('2024-01-03T00:00:00', '2024-01-04T00:00:00')]
+
+    @staticmethod
+    def test_sliding_hourly_spans():
+        assert get_spans(datetime(2024, 1, 1), datetime(2024, 1, 1, 4), 2, 1, wfm_date_spans.GRANULARITY_HOUR) == [
+            ('2024-01-01T00:00:00', '2024-01-01T02:00:00'),
+            ('2024-01-01T01:00:00', '2024-01-01T03:00:00'),
+            ('2024-01-01T02:00:00', '2024-01-01T04:00:00')]
+
+    @staticmethod
+    def test_monthly_spans_do_not_drift_after_a_clamped_month_end():
+        assert get_spans(datetime(2024, 1, 31), datetime(2024, 5, 1), 1, 1, wfm_date_spans.GRANULARITY_MONTH) == [
+            ('2024-01-31T00:00:00', '2024-02-29T00:00:00'),
+            ('2024-02-29T00:00:00', '2024-03-31T00:00:00'),
+            ('2024-03-31T00:00:00', '2024-04-30T00:00:00')]
+
+    @staticmethod
+    def test_no_spans_when_the_range_is_shorter_than_the_window():
+        assert get_spans(datetime(2024, 1, 1), datetime(2024, 1, 2, 12), 2, 1, wfm_date_spans.GRANULARITY_DAY) == []
+
+    @staticmethod
+    def test_span_count_matches_the_spans():
+        spans = get_spans(datetime(2023, 1, 1), datetime(2024, 1, 1), 7, 3, wfm_date_spans.GRANULARITY_HOUR)
+        span_count, _ = wfm_date_spans.get_span_count(datetime(2023, 1, 1), datetime(2024, 1, 1), 7, 3,
+                                                      wfm_date_spans.GRANULARITY_HOUR)
+        assert len(spans) == span_count
+
+
+class TestGetSpanCount:
+
+    @staticmethod
+    def test_tumbling_spans_ending_exactly_on_the_end_date():
+        assert wfm_date_spans.get_span_count(datetime(2024, 1, 1), datetime(2024, 1, 7), 2, 2,
+                                             wfm_date_spans.GRANULARITY_DAY) == (3, True)
+        assert wfm_date_spans.get_span_count(datetime(2024, 1, 31), datetime(2024, 4, 30), 1, 1,
+                                             wfm_date_spans.GRANULARITY_MONTH) == (3, True)
+
+    @staticmethod
+    def test_tumbling_spans_not_ending_on_the_end_date():
+        # the end date is not a multiple of the step from the start date
+        assert wfm_date_spans.get_span_count(datetime(2024, 1, 1), datetime(2024, 1, 8), 2, 2,
+                                             wfm_date_spans.GRANULARITY_DAY) == (3, False)
+        # the end date is not on a unit boundary
+        assert wfm_date_spans.get_span_count(datetime(2024, 1, 1), datetime(2024, 1, 7, 1), 2, 2,
+                                             wfm_date_spans.GRANULARITY_DAY) == (3, False)
+        assert wfm_date_spans.get_span_count(datetime(2024, 1, 31), datetime(2024, 4, 29), 1, 1,
+                                             wfm_date_spans.GRANULARITY_MONTH) == (2, False)
+
+
+class TestIterDateSpanChunks:
+
+    @staticmethod
+    def test_spans_are_chunked():
+        chunks = list(wfm_date_spans.iter_date_span_chunks(iter(range(7)), 3))
+        assert chunks == [[0, 1, 2], [3, 4, 5], [6]]
@@ -0,0 +1,76 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import MagicMock
+
+import pytest
+
+from wfm import wfm_execution_queue
+
+
+# a queue that fails the first send of the given entry ids, or every send when the failure is the sender's fault
+class Queue:
+    def __init__(self, failing_ids, sender_fault=False):
+        self.failing_ids = set(failing_ids)
+        self.sender_fault = sender_fault
+        self.requests = []
+
+    def send_message_batch(self, QueueUrl, Entries):
+        self.requests.append([entry['Id'] for entry in Entries])
+        response = {'Successful': [], 'Failed': []}
+        for entry in Entries:
+            if entry['Id'] in self.failing_ids:
+                if not self.sender_fault:
+                    self.failing_ids.remove(entry['Id'])
+                response['Failed'].append({'Id': entry['Id'], 'SenderFault': self.sender_fault, 'Code': 'Error'})
+                continue
+            response['Successful'].append({'Id': entry['Id'], 'MessageId': 'message-{}'.format(entry['Id'])})
+        return response
+
+
+def get_entries(groups):
+    return [{'Id': '{}{}'.format(group, index), 'MessageGroupId': group, 'MessageBody': ''} for group in groups for
+            index in range(3)]
+
+
+@pytest.fixture
+def producer(monkeypatch):
+    monkeypatch.setenv('AWS_DEFAULT_REGION', 'us-east-1')
+    monkeypatch.setattr(wfm_execution_queue, 'RETRY_BASE_DELAY_SECONDS', 0)
+    return wfm_execution_queue.ExecutionQueueProducer(MagicMock())
+
+
+class TestSendMessageBatch:
+
+    @staticmethod
+    def test_later_entries_of_a_retried_group_are_resent_in_order(producer):
+        queue = Queue(failing_ids=['a1'])
+        producer.sqs = queue
+
+        result = producer.send_message_batch('queue', get_entries(['a', 'b']))
+
+        assert queue.requests == [['a0', 'a1', 'a2', 'b0', 'b1', 'b2'], ['a1', 'a2']]
+        assert sorted(success['Id'] for success in result['Successful']) == ['a0', 'a1', 'a2', 'b0', 'b1', 'b2']
+        assert result['Failed'] == []
+
+    @staticmethod
+    def test_sender_faults_are_not_retried(producer):
+        queue = Queue(failing_ids=['a1'], sender_fault=True)
+        producer.sqs = queue
+
+        result = producer.send_message_batch('queue', get_entries(['a']))
+
+        assert queue.requests == [['a0', 'a1', 'a2']]
+        assert [failure['Id'] for failure in result['Failed']] == ['a1']
+        assert sorted(success['Id'] for success in result['Successful']) == ['a0', 'a2']
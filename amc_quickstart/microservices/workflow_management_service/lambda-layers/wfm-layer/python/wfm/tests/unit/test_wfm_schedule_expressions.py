@@ -0,0 +1,135 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from datetime import datetime
+
+import pytest
+
+from wfm import wfm_schedule_expressions
+
+
+def get_fire_times(expression, after, count):
+    schedule_expression = wfm_schedule_expressions.parse_schedule_expression(expression)
+    fire_times = []
+    for _ in range(count):
+        after = schedule_expression.get_next_fire_time(after)
+        fire_times.append(after)
+    return fire_times
+
+
+class TestParseField:
+
+    @staticmethod
+    def test_ranges_and_steps():
+        assert wfm_schedule_expressions.parse_field('0-30/10', 0, 59) == {0, 10, 20, 30}
+        assert wfm_schedule_expressions.parse_field('5/15', 0, 59) == {5, 20, 35, 50}
+        assert wfm_schedule_expressions.parse_field('*/6', 0, 23) == {0, 6, 12, 18}
+        assert wfm_schedule_expressions.parse_field('1,3,10-12', 1, 31) == {1, 3, 10, 11, 12}
+
+    @staticmethod
+    def test_names():
+        assert wfm_schedule_expressions.parse_field('JAN,mar-may', 1, 12, wfm_schedule_expressions.MONTH_NAMES) == {
+            1, 3, 4, 5}
+        assert wfm_schedule_expressions.parse_field('MON-FRI', 1, 7, wfm_schedule_expressions.DAY_NAMES) == {
+            2, 3, 4, 5, 6}
+
+    @staticmethod
+    @pytest.mark.parametrize('field', ['60', '10-5', '*/0', 'FOO'])
+    def test_invalid_fields(field):
+        with pytest.raises(ValueError):
+            wfm_schedule_expressions.parse_field(field, 0, 59)
+
+
+class TestDayOptions:
+
+    @staticmethod
+    def test_last_day_of_month():
+        assert get_fire_times('cron(0 12 L * ? *)', datetime(2024, 1, 15), 3) == [
+            datetime(2024, 1, 31, 12), datetime(2024, 2, 29, 12), datetime(2024, 3, 31, 12)]
+
+    @staticmethod
+    def test_last_weekday_of_month():
+        # 2024-03-31 is a Sunday and 2024-08-31 is a Saturday
+        assert get_fire_times('cron(0 12 LW * ? *)', datetime(2024, 3, 1), 1) == [datetime(2024, 3, 29, 12)]
+        assert get_fire_times('cron(0 12 LW * ? *)', datetime(2024, 8, 1), 1) == [datetime(2024, 8, 30, 12)]
+
+    @staticmethod
+    def test_nearest_weekday():
+        # 2024-06-15 is a Saturday and 2024-09-01 is a Sunday, the nearest weekday does not leave the month
+        assert get_fire_times('cron(0 12 15W * ? *)', datetime(2024, 6, 1), 1) == [datetime(2024, 6, 14, 12)]
+        assert get_fire_times('cron(0 12 1W * ? *)', datetime(2024, 8, 31), 1) == [datetime(2024, 9, 2, 12)]
+        assert get_fire_times('cron(0 12 31W * ? *)', datetime(2024, 8, 1), 1) == [datetime(2024, 8, 30, 12)]
+
+    @staticmethod
+    def test_last_day_of_week_is_every_saturday():
+        assert get_fire_times('cron(0 12 ? * L *)', datetime(2024, 1, 1), 3) == [
+            datetime(2024, 1, 6, 12), datetime(2024, 1, 13, 12), datetime(2024, 1, 20, 12)]
+
+    @staticmethod
+    def test_last_weekday_occurrence_of_month():
+        assert get_fire_times('cron(0 12 ? * 6L *)', datetime(2024, 1, 1), 2) == [
+            datetime(2024, 1, 26, 12), datetime(2024, 2, 23, 12)]
+        assert get_fire_times('cron(0 12 ? * FRIL *)', datetime(2024, 1, 1), 1) == [datetime(2024, 1, 26, 12)]
+
+    @staticmethod
+    def test_nth_weekday_occurrence_of_month():
+        assert get_fire_times('cron(0 12 ? * 2#1 *)', datetime(2024, 1, 1, 12), 2) == [
+            datetime(2024, 2, 5, 12), datetime(2024, 3, 4, 12)]
+        assert get_fire_times('cron(0 12 ? * MON#3 *)', datetime(2024, 1, 1), 1) == [datetime(2024, 1, 15, 12)]
+
+
+class TestGetNextFireTime:
+
+    @staticmethod
+    def test_next_fire_time_is_after_the_given_time():
+        assert get_fire_times('cron(0/15 * * * ? *)', datetime(2024, 1, 1, 10, 15, 30), 2) == [
+            datetime(2024, 1, 1, 10, 30), datetime(2024, 1, 1, 10, 45)]
+
+    @staticmethod
+    def test_month_end_rollover():
+        assert get_fire_times('cron(0 0 31 * ? *)', datetime(2024, 1, 31, 0, 0), 2) == [
+            datetime(2024, 3, 31), datetime(2024, 5, 31)]
+        assert get_fire_times('custom(D * 23)', datetime(2024, 2, 29, 23, 0), 1) == [datetime(2024, 3, 1, 23)]
+
+    @staticmethod
+    def test_year_rollover():
+        assert get_fire_times('cron(30 23 31 DEC ? *)', datetime(2024, 12, 31, 23, 30), 1) == [
+            datetime(2025, 12, 31, 23, 30)]
+        assert get_fire_times('custom(H * *)', datetime(2024, 12, 31, 23, 59), 1) == [datetime(2025, 1, 1)]
+
+    @staticmethod
+    def test_expression_that_does_not_fire_again():
+        schedule_expression = wfm_schedule_expressions.parse_schedule_expression('cron(0 0 1 1 ? 2020)')
+        assert schedule_expression.get_next_fire_time(datetime(2024, 1, 1)) is None
+
+
+class TestCustomExpressions:
+
+    @staticmethod
+    def test_weekly_weekday_mapping():
+        # custom weekdays start at 0 for Monday, 2024-01-01 is a Monday
+        assert get_fire_times('custom(W 0 8)', datetime(2024, 1, 1, 8), 1) == [datetime(2024, 1, 8, 8)]
+        assert get_fire_times('custom(W 2 8)', datetime(2024, 1, 1), 1) == [datetime(2024, 1, 3, 8)]
+        assert get_fire_times('custom(W 6 8)', datetime(2024, 1, 1), 1) == [datetime(2024, 1, 7, 8)]
+
+    @staticmethod
+    def test_monthly():
+        assert get_fire_times('custom(M 15 2)', datetime(2024, 1, 15, 2), 2) == [
+            datetime(2024, 2, 15, 2), datetime(2024, 3, 15, 2)]
+
+    @staticmethod
+    @pytest.mark.parametrize('expression', ['custom(X 1 1)', 'custom(W 7 8)', 'cron(0 12 * * ?)', 'rate(1 hour)'])
+    def test_invalid_expressions(expression):
+        with pytest.raises(ValueError):
+            wfm_schedule_expressions.parse_schedule_expression(expression)
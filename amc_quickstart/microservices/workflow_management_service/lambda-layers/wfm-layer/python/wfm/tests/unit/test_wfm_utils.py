@@ -0,0 +1,170 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import threading
+import time
+from decimal import Decimal
+from unittest.mock import MagicMock
+
+from wfm import wfm_utils
+
+EXECUTION = {
+    'workflowId': 'workflow-1',
+    'timeWindowStart': '2024-01-01T00:00:00',
+    'timeWindowEnd': '2024-01-02T00:00:00',
+    'timeWindowTimeZone': 'America/New_York',
+    'timeWindowType': 'EXPLICIT',
+    'parameterValues': {'campaignId': '1', 'lookback': Decimal('7')}
+}
+CONFIG = {
+    'customerId': 'customer-1',
+    'AMC': {'WFM': {'syncWorkflowStatuses': {'amcWorkflowExecutionTrackingDynamoDBTableName': 'tracking'}}}
+}
+
+
+class PageReader:
+    def __init__(self, execution_status, page_count=None):
+        self.execution_status = execution_status
+        self.page_count = page_count
+        self.pages_read = 0
+        self.finished = threading.Event()
+
+    # page_count=None reads pages until the reader is stopped
+    def paginate(self):
+        try:
+            while self.page_count is None or self.pages_read < self.page_count:
+                self.pages_read += 1
+                yield {'Items': [{'executionStatus': {'S': self.execution_status},
+                                  'executionId': {'S': str(self.pages_read)}}]}
+        finally:
+            self.finished.set()
+
+
+def get_utils(page_readers):
+    utils = wfm_utils.Utils(MagicMock())
+    paginator = MagicMock()
+    paginator.paginate.side_effect = lambda **query_arguments: page_readers[
+        query_arguments['ExpressionAttributeValues'][':executionStatus']['S']].paginate()
+    utils.get_dynamodb_client = MagicMock(return_value=MagicMock(**{'get_paginator.return_value': paginator}))
+    return utils
+
+
+class TestGetWorkflowExecutionsMulti:
+
+    @staticmethod
+    def test_all_statuses_are_read():
+        page_readers = {'FAILED': PageReader('FAILED', 3), 'REJECTED': PageReader('REJECTED', 2)}
+        executions = list(get_utils(page_readers).get_workflow_executions_multi(CONFIG,
+                                                                                statuses=['FAILED', 'REJECTED']))
+
+        assert sorted((execution['executionStatus'], execution['executionId']) for execution in executions) == [
+            ('FAILED', '1'), ('FAILED', '2'), ('FAILED', '3'), ('REJECTED', '1'), ('REJECTED', '2')]
+
+    @staticmethod
+    def test_pages_read_ahead_are_bounded():
+        page_readers = {'FAILED': PageReader('FAILED')}
+        executions = get_utils(page_readers).get_workflow_executions_multi(CONFIG, statuses=['FAILED'])
+        next(executions)
+        time.sleep(0.5)
+
+        # the page being yielded, the queued pages and the page waiting to be queued
+        assert page_readers['FAILED'].pages_read <= wfm_utils.MAX_BUFFERED_PAGES_PER_QUERY + 2
+        executions.close()
+
+    @staticmethod
+    def test_query_threads_stop_when_the_caller_stops_iterating():
+        page_readers = {'FAILED': PageReader('FAILED'), 'REJECTED': PageReader('REJECTED')}
+        executions = get_utils(page_readers).get_workflow_executions_multi(CONFIG, statuses=['FAILED', 'REJECTED'])
+        next(executions)
+        executions.close()
+
+        for page_reader in page_readers.values():
+            assert page_reader.finished.wait(timeout=5)
+
+
+class TestGetExecutionIdentity:
+
+    @staticmethod
+    def test_identity_ignores_the_execution_status_and_id():
+        utils = wfm_utils.Utils(MagicMock())
+        execution = dict(EXECUTION, executionId='execution-1', executionStatus='FAILED', createTime='2024-01-02')
+        assert utils.get_execution_identity(execution) == utils.get_execution_identity(EXECUTION)
+
+    @staticmethod
+    def test_identity_does_not_depend_on_the_parameter_order():
+        utils = wfm_utils.Utils(MagicMock())
+        execution = dict(EXECUTION, parameterValues={'lookback': Decimal('7'), 'campaignId': '1'})
+        assert utils.get_execution_identity(execution) == utils.get_execution_identity(EXECUTION)
+
+    @staticmethod
+    def test_missing_values_match_the_amc_defaults():
+        utils = wfm_utils.Utils(MagicMock())
+        execution = dict(EXECUTION, parameterValues={})
+        del execution['timeWindowType']
+        del execution['parameterValues']
+        assert utils.get_execution_identity(execution) == utils.get_execution_identity(
+            dict(EXECUTION, parameterValues={}))
+
+    @staticmethod
+    def test_different_requests_have_different_identities():
+        utils = wfm_utils.Utils(MagicMock())
+        identities = {
+            utils.get_execution_identity(EXECUTION),
+            utils.get_execution_identity(dict(EXECUTION, workflowId='workflow-2')),
+            utils.get_execution_identity(dict(EXECUTION, timeWindowEnd='2024-01-03T00:00:00')),
+            utils.get_execution_identity(dict(EXECUTION, timeWindowTimeZone='UTC')),
+            utils.get_execution_identity(dict(EXECUTION, timeWindowType='MOST_RECENT_DAY')),
+            utils.get_execution_identity(dict(EXECUTION, parameterValues={'campaignId': '2', 'lookback': Decimal('7')}))
+        }
+        assert len(identities) == 6
+
+    @staticmethod
+    def test_duplicate_executions_are_deduplicated_with_a_set():
+        utils = wfm_utils.Utils(MagicMock())
+        executions = [
+            dict(EXECUTION, executionId='execution-1', executionStatus='FAILED'),
+            dict(EXECUTION, executionId='execution-2', executionStatus='REJECTED'),
+            dict(EXECUTION, executionId='execution-3', executionStatus='FAILED', workflowId='workflow-2')
+        ]
+        assert len({utils.get_execution_identity(execution) for execution in executions}) == 2
+
+
+# returns the entries of each PublishBatch request sent for the messages
+def publish_message_batch(monkeypatch, messages):
+    sns_client = MagicMock(**{'publish_batch.return_value': {'Successful': [], 'Failed': []}})
+    monkeypatch.setattr(wfm_utils, 'sns_client', sns_client)
+    wfm_utils.Utils(MagicMock()).sns_publish_message_batch('topic', messages)
+    return [call.kwargs['PublishBatchRequestEntries'] for call in sns_client.publish_batch.call_args_list]
+
+
+class TestSnsPublishMessageBatch:
+
+    @staticmethod
+    def test_string_messages_are_sent_as_they_are(monkeypatch):
+        batches = publish_message_batch(monkeypatch, [('digest', 'line 1\nline 2'), ('record', {'a': 1})])
+
+        assert batches == [[{'Id': '0', 'Message': 'line 1\nline 2', 'Subject': 'digest'},
+                            {'Id': '1', 'Message': '{"a": 1}', 'Subject': 'record'}]]
+
+    @staticmethod
+    def test_batches_stay_within_the_request_limits(monkeypatch):
+        large_message = 'x' * (wfm_utils.SNS_MAX_BATCH_BYTES // 3)
+        batches = publish_message_batch(monkeypatch, [('large', large_message)] * 4 + [
+            ('small', 'y')] * 12)
+
+        assert [len(batch) for batch in batches] == [2, 10, 4]
+        assert [entry['Id'] for batch in batches for entry in batch] == [str(index) for index in range(16)]
+        for batch in batches:
+            assert sum(len(entry['Message']) + len(entry['Subject']) for entry in batch) <= \
+                   wfm_utils.SNS_MAX_BATCH_BYTES
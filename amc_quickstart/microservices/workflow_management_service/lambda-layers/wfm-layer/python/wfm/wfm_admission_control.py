@@ -0,0 +1,244 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Token bucket admission control for AMC workflow execution submissions.
+# Buckets are stored in a DynamoDB table and updated with conditional writes so that several
+# concurrently running consumers share the same budget. The refill rate of each customer bucket adapts to
+# throttling (429) responses from the AMC workflowExecutions endpoint: it is halved on every throttle
+# and grows back linearly with every successful submission.
+
+import boto3
+import os
+import time
+from decimal import Decimal
+from botocore.exceptions import ClientError
+
+DEFAULT_CUSTOMER_SUBMISSIONS_PER_SECOND = 2
+DEFAULT_CUSTOMER_BURST_CAPACITY = 10
+DEFAULT_MINIMUM_SUBMISSIONS_PER_SECOND = 0.1
+DEFAULT_GLOBAL_SUBMISSIONS_PER_SECOND = 10
+DEFAULT_GLOBAL_BURST_CAPACITY = 50
+
+# multiplicative decrease applied to the refill rate on a throttle and additive increase applied on success
+THROTTLE_RATE_FACTOR = Decimal('0.5')
+SUCCESS_RATE_INCREMENT = Decimal('0.1')
+
+MAX_CONDITIONAL_UPDATE_ATTEMPTS = 5
+
+
+class AdmissionController:
+    def __init__(self, logger, table_name):
+        self.logger = logger
+        self.table = boto3.resource('dynamodb').Table(table_name)
+
+    @staticmethod
+    def get_customer_bucket_id(customer_id):
+        return 'customer#{}#submissions'.format(customer_id)
+
+    @staticmethod
+    def get_global_bucket_id():
+        return 'global#submissions'
+
+    # reads the per customer bucket settings from the customer config record, falling back to the defaults
+    def get_customer_bucket_settings(self, customer_config):
+        settings = {}
+        if 'admissionControl' in customer_config['AMC']['WFM']:
+            settings = customer_config['AMC']['WFM']['admissionControl']
+
+        return {
+            'capacity': Decimal(str(settings.get('burstCapacity', DEFAULT_CUSTOMER_BURST_CAPACITY))),
+            'maximumRate': Decimal(str(settings.get('submissionsPerSecond', DEFAULT_CUSTOMER_SUBMISSIONS_PER_SECOND))),
+            'minimumRate': Decimal(
+                str(settings.get('minimumSubmissionsPerSecond', DEFAULT_MINIMUM_SUBMISSIONS_PER_SECOND)))
+        }
+
+    # global bucket settings are shared by all customers and are configured on the consuming lambda function
+    def get_global_bucket_settings(self):
+        return {
+            'capacity': Decimal(os.environ.get('GLOBAL_SUBMISSION_BURST_CAPACITY', str(DEFAULT_GLOBAL_BURST_CAPACITY))),
+            'maximumRate': Decimal(
+                os.environ.get('GLOBAL_SUBMISSIONS_PER_SECOND', str(DEFAULT_GLOBAL_SUBMISSIONS_PER_SECOND))),
+            'minimumRate': Decimal(str(DEFAULT_MINIMUM_SUBMISSIONS_PER_SECOND))
+        }
+
+    def get_bucket(self, bucket_id, settings):
+        response = self.table.get_item(Key={'bucketId': bucket_id}, ConsistentRead=True)
+        if 'Item' in response:
+            return response['Item']
+
+        # first use of the bucket, create it full so the first burst is admitted immediately
+        bucket = {
+            'bucketId': bucket_id,
+            'availableTokens': settings['capacity'],
+            'bucketCapacity': settings['capacity'],
+            'refillRate': settings['maximumRate'],
+            'lastRefillTime': Decimal(str(round(time.time(), 3))),
+            'throttleCount': 0
+        }
+        try:
+            self.table.put_item(Item=bucket, ConditionExpression='attribute_not_exists(bucketId)')
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                raise
+            # another consumer created the bucket first, use its values
+            return self.table.get_item(Key={'bucketId': bucket_id}, ConsistentRead=True)['Item']
+        return bucket
+
+    # takes up to tokens_requested tokens from a bucket and returns the number of tokens granted
+    def acquire(self, bucket_id, tokens_requested, settings):
+        if tokens_requested <= 0:
+            return 0
+
+        for attempt in range(MAX_CONDITIONAL_UPDATE_ATTEMPTS):
+            bucket = self.get_bucket(bucket_id, settings)
+            now = Decimal(str(round(time.time(), 3)))
+            refill_rate = min(max(bucket['refillRate'], settings['minimumRate']), settings['maximumRate'])
+            elapsed_seconds = max(now - bucket['lastRefillTime'], Decimal(0))
+            tokens = min(settings['capacity'], bucket['availableTokens'] + (elapsed_seconds * refill_rate))
+            tokens_granted = min(int(tokens), tokens_requested)
+
+            try:
+                self.table.update_item(
+                    Key={'bucketId': bucket_id},
+                    UpdateExpression='SET availableTokens = :tokens, lastRefillTime = :now, bucketCapacity = :capacity, refillRate = :rate',
+                    ConditionExpression='lastRefillTime = :previous',
+                    ExpressionAttributeValues={
+                        ':tokens': tokens - tokens_granted,
+                        ':now': now,
+                        ':capacity': settings['capacity'],
+                        ':rate': refill_rate,
+                        ':previous': bucket['lastRefillTime']
+                    }
+                )
+                self.logger.info('bucket {} granted {} of {} requested tokens, refill rate {}/s'.format(
+                    bucket_id, tokens_granted, tokens_requested, refill_rate))
+                return tokens_granted
+
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                self.logger.info('bucket {} was updated concurrently, retrying attempt {}'.format(bucket_id, attempt + 1))
+
+        self.logger.info('unable to acquire tokens from bucket {} after {} attempts'.format(
+            bucket_id, MAX_CONDITIONAL_UPDATE_ATTEMPTS))
+        return 0
+
+    # returns tokens that were acquired but not used, the bucket capacity is enforced on the next acquire
+    def release(self, bucket_id, tokens):
+        if tokens <= 0:
+            return
+        self.table.update_item(
+            Key={'bucketId': bucket_id},
+            UpdateExpression='ADD availableTokens :tokens',
+            ConditionExpression='attribute_exists(bucketId)',
+            ExpressionAttributeValues={':tokens': tokens}
+        )
+
+    # halves the refill rate and empties the bucket so that no further submissions are admitted until it refills
+    def throttle(self, bucket_id, settings):
+        for attempt in range(MAX_CONDITIONAL_UPDATE_ATTEMPTS):
+            bucket = self.get_bucket(bucket_id, settings)
+            refill_rate = max(bucket['refillRate'] * THROTTLE_RATE_FACTOR, settings['minimumRate'])
+            try:
+                self.table.update_item(
+                    Key={'bucketId': bucket_id},
+                    UpdateExpression='SET availableTokens = :zero, refillRate = :rate, lastRefillTime = :now, lastThrottleTime = :now ADD throttleCount :one',
+                    ConditionExpression='refillRate = :previous',
+                    ExpressionAttributeValues={
+                        ':zero': Decimal(0),
+                        ':rate': refill_rate,
+                        ':now': Decimal(str(round(time.time(), 3))),
+                        ':one': 1,
+                        ':previous': bucket['refillRate']
+                    }
+                )
+                self.logger.info('bucket {} throttled, refill rate reduced to {}/s'.format(bucket_id, refill_rate))
+                return refill_rate
+
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                self.logger.info('bucket {} was updated concurrently, retrying attempt {}'.format(bucket_id, attempt + 1))
+
+        self.logger.error('unable to throttle bucket {} after {} attempts, the refill rate was not reduced'.format(
+            bucket_id, MAX_CONDITIONAL_UPDATE_ATTEMPTS))
+        return None
+
+    # grows the refill rate back towards the configured maximum, returns the new refill rate
+    def recover(self, bucket_id, settings, successful_submissions=1):
+        for attempt in range(MAX_CONDITIONAL_UPDATE_ATTEMPTS):
+            bucket = self.get_bucket(bucket_id, settings)
+            if bucket['refillRate'] >= settings['maximumRate']:
+                return bucket['refillRate']
+            refill_rate = min(bucket['refillRate'] + (SUCCESS_RATE_INCREMENT * successful_submissions),
+                              settings['maximumRate'])
+            try:
+                self.table.update_item(
+                    Key={'bucketId': bucket_id},
+                    UpdateExpression='SET refillRate = :rate',
+                    ConditionExpression='refillRate = :previous',
+                    ExpressionAttributeValues={
+                        ':rate': refill_rate,
+                        ':previous': bucket['refillRate']
+                    }
+                )
+                return refill_rate
+
+            except ClientError as e:
+                if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+                    raise
+                self.logger.info('bucket {} was updated concurrently, retrying attempt {}'.format(bucket_id, attempt + 1))
+
+        self.logger.info('unable to recover the refill rate of bucket {} after {} attempts'.format(
+            bucket_id, MAX_CONDITIONAL_UPDATE_ATTEMPTS))
+        return None
+
+    # returns the number of executions that can be submitted for a customer right now
+    # executions_available is the number of free concurrent execution slots for the customer, the result is further
+    # limited by the customer and global submission rate buckets
+    def admit(self, customer_config, executions_available):
+        if executions_available <= 0:
+            return 0
+
+        customer_bucket_id = self.get_customer_bucket_id(customer_config['customerId'])
+        customer_settings = self.get_customer_bucket_settings(customer_config)
+        customer_tokens = self.acquire(customer_bucket_id, executions_available, customer_settings)
+        if customer_tokens == 0:
+            return 0
+
+        global_tokens = self.acquire(self.get_global_bucket_id(), customer_tokens, self.get_global_bucket_settings())
+        if global_tokens < customer_tokens:
+            self.release(customer_bucket_id, customer_tokens - global_tokens)
+
+        self.logger.info('customerId {} admitted {} of {} available executions'.format(
+            customer_config['customerId'], global_tokens, executions_available))
+        return global_tokens
+
+    # hands back admitted executions that were not submitted
+    def release_unused(self, customer_config, unused_executions):
+        if unused_executions <= 0:
+            return
+        self.release(self.get_customer_bucket_id(customer_config['customerId']), unused_executions)
+        self.release(self.get_global_bucket_id(), unused_executions)
+
+    # throttling is reported per AMC instance so only the customer bucket adapts, the global bucket keeps a fixed rate
+    def record_throttle(self, customer_config):
+        self.throttle(self.get_customer_bucket_id(customer_config['customerId']),
+                      self.get_customer_bucket_settings(customer_config))
+
+    def record_success(self, customer_config, successful_submissions=1):
+        if successful_submissions <= 0:
+            return
+        self.recover(self.get_customer_bucket_id(customer_config['customerId']),
+                     self.get_customer_bucket_settings(customer_config), successful_submissions)
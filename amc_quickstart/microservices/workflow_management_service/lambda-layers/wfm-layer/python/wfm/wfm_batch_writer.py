@@ -0,0 +1,176 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Rate controlled DynamoDB writer that runs several BatchWriteItem streams in parallel.
+# The write rate (in write capacity units per second) is shared by all streams. It grows while batches are fully
+# processed and is halved when DynamoDB returns UnprocessedItems or throttles a request, the capacity used by each
+# item is learned from the ConsumedCapacity returned with every batch.
+
+import boto3
+import threading
+import time
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+
+DYNAMODB_MAX_BATCH_SIZE = 25
+DEFAULT_MAX_WORKERS = 4
+DEFAULT_INITIAL_UNITS_PER_SECOND = 200
+DEFAULT_MINIMUM_UNITS_PER_SECOND = 25
+DEFAULT_MAXIMUM_UNITS_PER_SECOND = 4000
+DEFAULT_MAX_ATTEMPTS = 8
+
+# additive increase after a fully processed batch, multiplicative decrease when items are not processed
+RATE_INCREASE_FACTOR = 0.1
+RATE_DECREASE_FACTOR = 0.5
+RETRY_BASE_DELAY_SECONDS = 0.05
+RETRY_MAX_DELAY_SECONDS = 2
+
+THROTTLING_ERROR_CODES = ['ProvisionedThroughputExceededException', 'ThrottlingException',
+                          'RequestLimitExceeded']
+
+# writers can be created from several threads, boto3 client creation is not thread safe so one client is shared
+dynamodb_resource_client = None
+dynamodb_resource_client_lock = threading.Lock()
+
+
+def get_dynamodb_resource_client():
+    global dynamodb_resource_client
+    with dynamodb_resource_client_lock:
+        if dynamodb_resource_client is None:
+            # the resource client serializes python types so items can be passed as they are given to table.put_item
+            dynamodb_resource_client = boto3.resource('dynamodb').meta.client
+    return dynamodb_resource_client
+
+
+class WriteRateLimiter:
+    def __init__(self, initial_units_per_second, minimum_units_per_second, maximum_units_per_second):
+        self.units_per_second = initial_units_per_second
+        self.minimum_units_per_second = minimum_units_per_second
+        self.maximum_units_per_second = maximum_units_per_second
+        self.increment = max(initial_units_per_second * RATE_INCREASE_FACTOR, 1)
+        self.next_send_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    # waits until the requested number of capacity units can be written at the current rate
+    def acquire(self, units):
+        with self.lock:
+            now = time.monotonic()
+            send_time = max(now, self.next_send_time)
+            self.next_send_time = send_time + (units / self.units_per_second)
+        if send_time > now:
+            time.sleep(send_time - now)
+
+    def increase(self):
+        with self.lock:
+            self.units_per_second = min(self.units_per_second + self.increment, self.maximum_units_per_second)
+
+    def decrease(self):
+        with self.lock:
+            self.units_per_second = max(self.units_per_second * RATE_DECREASE_FACTOR, self.minimum_units_per_second)
+
+
+class AdaptiveBatchWriter:
+    def __init__(self, logger, table_name, max_workers=DEFAULT_MAX_WORKERS,
+                 initial_units_per_second=DEFAULT_INITIAL_UNITS_PER_SECOND,
+                 minimum_units_per_second=DEFAULT_MINIMUM_UNITS_PER_SECOND,
+                 maximum_units_per_second=DEFAULT_MAXIMUM_UNITS_PER_SECOND, max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.logger = logger
+        self.table_name = table_name
+        self.max_workers = max_workers
+        self.max_attempts = max_attempts
+        self.rate_limiter = WriteRateLimiter(initial_units_per_second, minimum_units_per_second,
+                                             maximum_units_per_second)
+        self.client = get_dynamodb_resource_client()
+        self.units_per_item = 1.0
+        self.consumed_capacity_units = 0
+        self.lock = threading.Lock()
+
+    def record_consumed_capacity(self, consumed_capacity, items_written):
+        units = sum(capacity.get('CapacityUnits', 0) for capacity in consumed_capacity)
+        with self.lock:
+            self.consumed_capacity_units += units
+            if items_written > 0 and units > 0:
+                # smooth the estimate so a single large item does not stall the writer
+                self.units_per_item = (self.units_per_item + (units / items_written)) / 2
+
+    # writes up to 25 items, returns the items that could not be written after max_attempts
+    def write_batch(self, items):
+        pending_items = items
+        attempt = 0
+        while len(pending_items) > 0 and attempt < self.max_attempts:
+            if attempt > 0:
+                time.sleep(min(RETRY_BASE_DELAY_SECONDS * (2 ** attempt), RETRY_MAX_DELAY_SECONDS))
+            attempt += 1
+            self.rate_limiter.acquire(len(pending_items) * self.units_per_item)
+
+            try:
+                response = self.client.batch_write_item(
+                    RequestItems={self.table_name: [{'PutRequest': {'Item': item}} for item in pending_items]},
+                    ReturnConsumedCapacity='TOTAL'
+                )
+            except ClientError as e:
+                if e.response['Error']['Code'] not in THROTTLING_ERROR_CODES:
+                    raise
+                self.logger.info('batch write to table {} throttled, attempt {}'.format(self.table_name, attempt))
+                self.rate_limiter.decrease()
+                continue
+
+            unprocessed_items = [request['PutRequest']['Item'] for request in
+                                 response.get('UnprocessedItems', {}).get(self.table_name, [])]
+            self.record_consumed_capacity(response.get('ConsumedCapacity', []),
+                                          len(pending_items) - len(unprocessed_items))
+            if len(unprocessed_items) > 0:
+                self.logger.info('{} unprocessed items for table {}, attempt {}'.format(
+                    len(unprocessed_items), self.table_name, attempt))
+                self.rate_limiter.decrease()
+            else:
+                self.rate_limiter.increase()
+            pending_items = unprocessed_items
+
+        return pending_items
+
+    def put_items(self, items):
+        batches = [items[i:i + DYNAMODB_MAX_BATCH_SIZE] for i in range(0, len(items), DYNAMODB_MAX_BATCH_SIZE)]
+        failed_items = []
+        status_codes = [200]
+        messages = []
+        if len(batches) > 0:
+            with ThreadPoolExecutor(max_workers=max(1, min(self.max_workers, len(batches)))) as executor:
+                futures = [executor.submit(self.write_batch, batch) for batch in batches]
+                for batch, future in zip(batches, futures):
+                    try:
+                        failed_items += future.result()
+                    except Exception as e:
+                        message = 'writing batch of {} items to table {} failed with error {}'.format(
+                            len(batch), self.table_name, e)
+                        self.logger.error(message)
+                        messages.append(message)
+                        failed_items += batch
+
+        if len(failed_items) > 0:
+            status_codes.append(500)
+
+        self.logger.info('wrote {} of {} items to table {}, consumed {} capacity units, write rate {} units/s'.format(
+            len(items) - len(failed_items), len(items), self.table_name, self.consumed_capacity_units,
+            self.rate_limiter.units_per_second))
+
+        return {
+            'statusCode': max(status_codes),
+            'itemsWritten': len(items) - len(failed_items),
+            'itemsFailed': len(failed_items),
+            'failedItems': failed_items,
+            'consumedCapacityUnits': self.consumed_capacity_units,
+            'unitsPerSecond': self.rate_limiter.units_per_second,
+            'messages': messages
+        }
@@ -0,0 +1,177 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Per container cache of customer config records.
+# Records are kept for CUSTOMER_CONFIG_CACHE_TTL_SECONDS and are looked up by customerId, missing keys are read with
+# BatchGetItem and the whole table is only scanned when every config is requested. The CustomerConfigTrigger writes the
+# sequence number of the last customer config stream record it handled to the CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER
+# SSM parameter, every container compares it with the version it loaded its records under and drops them when it changed.
+
+import boto3
+import copy
+import os
+import threading
+import time
+
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_VERSION_CHECK_INTERVAL_SECONDS = 10
+
+# the sync checkpoint is written by SyncWorkflowStatuses on every sync, changes to it alone do not invalidate the caches
+SYNC_CHECKPOINT_ATTRIBUTE_PATH = ['AMC', 'WFM', 'syncWorkflowStatuses']
+
+ssm_client = None
+ssm_client_lock = threading.Lock()
+
+caches = {}
+caches_lock = threading.Lock()
+
+
+def get_ssm_client():
+    global ssm_client
+    with ssm_client_lock:
+        if ssm_client is None:
+            ssm_client = boto3.client('ssm')
+    return ssm_client
+
+
+def remove_sync_checkpoint(config):
+    config = copy.deepcopy(config)
+    parent = config
+    for key in SYNC_CHECKPOINT_ATTRIBUTE_PATH[:-1]:
+        parent = parent.get(key) if isinstance(parent, dict) else None
+    if isinstance(parent, dict):
+        parent.pop(SYNC_CHECKPOINT_ATTRIBUTE_PATH[-1], None)
+    return config
+
+
+# returns True if a customer config stream record changes anything that is read from the cache
+def is_cache_relevant_change(old_config, new_config):
+    if old_config is None or new_config is None:
+        return True
+    return remove_sync_checkpoint(old_config) != remove_sync_checkpoint(new_config)
+
+
+def publish_cache_version(parameter_name, version):
+    get_ssm_client().put_parameter(Name=parameter_name, Value=str(version), Type='String', Overwrite=True)
+
+
+class CustomerConfigCache:
+    def __init__(self, utils, table_name, ttl_seconds=DEFAULT_TTL_SECONDS, version_parameter_name=None,
+                 version_check_interval_seconds=DEFAULT_VERSION_CHECK_INTERVAL_SECONDS):
+        self.utils = utils
+        self.logger = utils.logger
+        self.table_name = table_name
+        self.ttl_seconds = ttl_seconds
+        self.version_parameter_name = version_parameter_name
+        self.version_check_interval_seconds = version_check_interval_seconds
+        self.version = None
+        self.next_version_check_time = 0
+        # customerId -> (expiry time, config), a config of None records a customerId that does not exist
+        self.entries = {}
+        self.all_customers_expiry_time = 0
+        self.lock = threading.Lock()
+
+    def check_version(self):
+        if self.version_parameter_name is None:
+            return
+        now = time.monotonic()
+        if now < self.next_version_check_time:
+            return
+        self.next_version_check_time = now + self.version_check_interval_seconds
+
+        try:
+            version = get_ssm_client().get_parameter(Name=self.version_parameter_name)['Parameter']['Value']
+        except Exception as e:
+            # the TTL still bounds how stale a record can be when the version can not be read
+            self.logger.error('unable to read customer config cache version {} error {}'.format(
+                self.version_parameter_name, e))
+            return
+
+        if version != self.version:
+            if self.version is not None:
+                self.logger.info('customer config cache version changed from {} to {}, clearing {} records'.format(
+                    self.version, version, len(self.entries)))
+            self.version = version
+            self.invalidate()
+
+    def invalidate(self, customer_ids=None):
+        with self.lock:
+            if customer_ids is None:
+                self.entries = {}
+            else:
+                for customer_id in customer_ids:
+                    self.entries.pop(customer_id, None)
+            self.all_customers_expiry_time = 0
+
+    def store(self, customer_ids, configs, expiry_time):
+        with self.lock:
+            for customer_id in customer_ids:
+                self.entries[customer_id] = (expiry_time, configs.get(customer_id))
+
+    # returns the configs found for the customerIds, reading the ones that are not cached with BatchGetItem
+    def get_many(self, customer_ids):
+        self.check_version()
+        now = time.monotonic()
+        configs = {}
+        missing_customer_ids = []
+        with self.lock:
+            for customer_id in dict.fromkeys(customer_ids):
+                entry = self.entries.get(customer_id)
+                if entry is not None and entry[0] > now:
+                    if entry[1] is not None:
+                        configs[customer_id] = entry[1]
+                else:
+                    missing_customer_ids.append(customer_id)
+
+        if len(missing_customer_ids) > 0:
+            loaded_configs = self.utils.dynamodb_batch_get_customer_config_records(self.table_name,
+                                                                                   missing_customer_ids)
+            self.store(missing_customer_ids, loaded_configs, now + self.ttl_seconds)
+            configs.update(loaded_configs)
+
+        return {customer_id: copy.deepcopy(configs[customer_id]) for customer_id in customer_ids if
+                customer_id in configs}
+
+    def get(self, customer_id):
+        return self.get_many([customer_id]).get(customer_id)
+
+    # returns every customer config, the table is scanned at most once per TTL
+    def get_all(self):
+        self.check_version()
+        now = time.monotonic()
+        with self.lock:
+            if self.all_customers_expiry_time > now:
+                return {customer_id: copy.deepcopy(entry[1]) for customer_id, entry in self.entries.items() if
+                        entry[1] is not None}
+
+        configs = self.utils.dynamodb_get_customer_config_records(self.table_name)
+        with self.lock:
+            self.entries = {customer_id: (now + self.ttl_seconds, configs[customer_id]) for customer_id in configs}
+            self.all_customers_expiry_time = now + self.ttl_seconds
+        return copy.deepcopy(configs)
+
+
+# returns the cache for the customer config table, one cache is shared by every caller in the lambda container
+def get_customer_config_cache(utils, table_name=None):
+    if table_name is None:
+        table_name = os.environ['CUSTOMERS_DYNAMODB_TABLE']
+    with caches_lock:
+        if table_name not in caches:
+            caches[table_name] = CustomerConfigCache(
+                utils, table_name,
+                ttl_seconds=int(os.environ.get('CUSTOMER_CONFIG_CACHE_TTL_SECONDS', DEFAULT_TTL_SECONDS)),
+                version_parameter_name=os.environ.get('CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER'),
+                version_check_interval_seconds=int(os.environ.get('CUSTOMER_CONFIG_CACHE_VERSION_CHECK_SECONDS',
+                                                                  DEFAULT_VERSION_CHECK_INTERVAL_SECONDS)))
+        return caches[table_name]
@@ -0,0 +1,89 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Generates sliding and tumbling date spans for backfilling AMC workflow executions.
+# Span number i starts at origin + (i * step) and ends at origin + (i * step) + window, both are calculated from the origin
+# rather than from the previous span so calendar month windows do not drift when a month end is clamped
+# (e.g. Jan 31 -> Feb 28 -> Mar 28). Spans are yielded lazily so multi-year hourly ranges can be streamed in chunks.
+
+from datetime import timedelta
+from dateutil.relativedelta import relativedelta
+
+GRANULARITY_HOUR = 'hour'
+GRANULARITY_DAY = 'day'
+GRANULARITY_MONTH = 'month'
+GRANULARITIES = [GRANULARITY_HOUR, GRANULARITY_DAY, GRANULARITY_MONTH]
+
+WINDOW_TYPE_SLIDING = 'sliding'
+WINDOW_TYPE_TUMBLING = 'tumbling'
+
+FIXED_UNIT_DELTAS = {
+    GRANULARITY_HOUR: timedelta(hours=1),
+    GRANULARITY_DAY: timedelta(days=1)
+}
+
+
+def get_offset(units, granularity):
+    if granularity == GRANULARITY_MONTH:
+        return relativedelta(months=units)
+    return FIXED_UNIT_DELTAS[granularity] * units
+
+
+def format_date(value):
+    # equivalent to strftime('%Y-%m-%dT%H:%M:%S') without the format string parsing on every call
+    return value.replace(tzinfo=None, microsecond=0).isoformat()
+
+
+# returns the number of whole granularity units between start_date and end_date and
+# whether end_date falls exactly on a unit boundary
+def get_units_between(start_date, end_date, granularity):
+    if granularity == GRANULARITY_MONTH:
+        units = (end_date.year - start_date.year) * 12 + (end_date.month - start_date.month)
+        if start_date + relativedelta(months=units) > end_date:
+            units -= 1
+        return units, start_date + relativedelta(months=units) == end_date
+
+    unit_delta = FIXED_UNIT_DELTAS[granularity]
+    return (end_date - start_date) // unit_delta, (end_date - start_date) % unit_delta == timedelta(0)
+
+
+# returns the number of spans that fit between start_date and end_date and
+# whether the last span ends exactly on end_date
+def get_span_count(start_date, end_date, window_size, step, granularity):
+    units, on_boundary = get_units_between(start_date, end_date, granularity)
+    if units < window_size:
+        return 0, False
+    return ((units - window_size) // step) + 1, on_boundary and (units - window_size) % step == 0
+
+
+def iter_date_spans(start_date, end_date, window_size, step, granularity=GRANULARITY_DAY):
+    span_count, _ = get_span_count(start_date, end_date, window_size, step, granularity)
+
+    for i in range(span_count):
+        yield {
+            "timeWindowStart": format_date(start_date + get_offset(i * step, granularity)),
+            "timeWindowEnd": format_date(start_date + get_offset((i * step) + window_size, granularity))
+        }
+
+
+# yields lists of up to chunk_size spans
+def iter_date_span_chunks(spans, chunk_size):
+    chunk = []
+    for span in spans:
+        chunk.append(span)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
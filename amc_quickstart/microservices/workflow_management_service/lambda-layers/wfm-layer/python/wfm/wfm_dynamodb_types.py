@@ -0,0 +1,60 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Fast deserialization of DynamoDB attribute values into python types.
+# Produces the same values as boto3's TypeDeserializer but dispatches directly on the type tag instead of creating a
+# deserializer and looking up a method for every attribute. Numbers are returned as Decimal like boto3 does, or as
+# int and float when native_numbers is set.
+
+from boto3.dynamodb.types import Binary, DYNAMODB_CONTEXT
+
+
+def to_decimal(value):
+    return DYNAMODB_CONTEXT.create_decimal(value)
+
+
+def to_native_number(value):
+    if '.' in value or 'e' in value or 'E' in value:
+        return float(value)
+    return int(value)
+
+
+def deserialize_value(value, native_numbers=False):
+    for tag, data in value.items():
+        if tag == 'S':
+            return data
+        if tag == 'N':
+            return to_native_number(data) if native_numbers else to_decimal(data)
+        if tag == 'M':
+            return {key: deserialize_value(item, native_numbers) for key, item in data.items()}
+        if tag == 'L':
+            return [deserialize_value(item, native_numbers) for item in data]
+        if tag == 'BOOL':
+            return data
+        if tag == 'NULL':
+            return None
+        if tag == 'SS':
+            return set(data)
+        if tag == 'NS':
+            return set(to_native_number(item) if native_numbers else to_decimal(item) for item in data)
+        if tag == 'B':
+            return Binary(data)
+        if tag == 'BS':
+            return set(Binary(item) for item in data)
+        raise TypeError('DynamoDB type {} is not supported'.format(tag))
+    raise TypeError('Value must be a nonempty dictionary whose key is a valid DynamoDB type')
+
+
+def deserialize_item(item, native_numbers=False):
+    return {key: deserialize_value(value, native_numbers) for key, value in item.items()}
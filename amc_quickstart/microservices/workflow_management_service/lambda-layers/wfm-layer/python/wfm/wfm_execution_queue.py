@@ -0,0 +1,248 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: High throughput producer for the customer AMC workflow execution SQS queues.
+# Messages are sent with send_message_batch in batches of 10 and entries reported as Failed by SQS are retried with a
+# backoff. The message groups are spread over up to max_workers lanes that are sent concurrently, the batches of a lane
+# are sent one after the other so that the messages of a group reach the queue in the order of the payloads.
+# The message group of each execution is chosen by a strategy. SQS FIFO queues deliver the messages of a group in order
+# and only one batch of a group is in flight at a time, so spreading executions over several groups lets the consumer
+# receive from the groups in parallel. Executions of the same workflow always share a group and keep their order.
+#   single        every execution is sent to the amcworkflows group (the order of all executions is kept)
+#   workflow      one group per workflowId
+#   workflowHash  the workflowId is hashed into a fixed number of groups
+# The strategy is set with AMC.WFM.executionQueueMessageGroupStrategy in the customer config record or the
+# EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY environment variable, a MessageGroupId in the payload takes precedence.
+# AMC.WFM.executionQueueConsumptionMode selects how the queue of a customer is consumed, by the scheduled poller of the
+# WorkflowExecutionQueueConsumer (schedule, the default) or by an SQS event source mapping (eventSource).
+# The event source mapping of a customer is disabled while the customer has no free execution slots, so the messages
+# are not received and returned over and over until they reach the maximum receive count of the queue, and enabled
+# again by the scheduled poller once executions are available.
+
+import boto3
+from botocore.exceptions import ClientError
+import hashlib
+import json
+import os
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+SQS_MAX_BATCH_SIZE = 10
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_MAX_SEND_ATTEMPTS = 4
+RETRY_BASE_DELAY_SECONDS = 0.2
+DEFAULT_MESSAGE_GROUP_ID = 'amcworkflows'
+DEFAULT_MESSAGE_GROUP_STRATEGY = 'single'
+DEFAULT_MESSAGE_GROUP_COUNT = 8
+MESSAGE_GROUP_STRATEGIES = ['single', 'workflow', 'workflowHash']
+SQS_MAX_MESSAGE_GROUP_ID_LENGTH = 128
+SCHEDULE_CONSUMPTION_MODE = 'schedule'
+EVENT_SOURCE_CONSUMPTION_MODE = 'eventSource'
+
+# queue urls and arns are cached for the lifetime of the lambda container so they are looked up once per queue
+queue_urls = {}
+queue_arns = {}
+
+
+def get_queue_url(sqs, queue_name):
+    if queue_name not in queue_urls:
+        queue_urls[queue_name] = sqs.get_queue_url(QueueName=queue_name)['QueueUrl']
+    return queue_urls[queue_name]
+
+
+def get_queue_arn(sqs, queue_name):
+    if queue_name not in queue_arns:
+        queue_arns[queue_name] = sqs.get_queue_attributes(QueueUrl=get_queue_url(sqs, queue_name),
+                                                          AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+    return queue_arns[queue_name]
+
+
+def get_event_source_mapping(lambda_client, queue_arn, function_name):
+    mappings = lambda_client.list_event_source_mappings(EventSourceArn=queue_arn, FunctionName=function_name)
+    if len(mappings['EventSourceMappings']) == 0:
+        return None
+    return mappings['EventSourceMappings'][0]
+
+
+# enables or disables the event source mapping of a queue, returns True when the state of the mapping was changed.
+# A mapping that is being created or updated can not be changed, it is left as it is and changed on a later call
+def set_event_source_mapping_enabled(lambda_client, queue_arn, function_name, enabled):
+    mapping = get_event_source_mapping(lambda_client, queue_arn, function_name)
+    if mapping is None or mapping['State'] != ('Disabled' if enabled else 'Enabled'):
+        return False
+    try:
+        lambda_client.update_event_source_mapping(UUID=mapping['UUID'], Enabled=enabled)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceInUseException':
+            raise
+        return False
+    return True
+
+
+def get_message_group_strategy(customer_config):
+    wfm_config = customer_config['AMC'].get('WFM', {})
+    strategy = wfm_config.get('executionQueueMessageGroupStrategy', os.environ.get(
+        'EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY', DEFAULT_MESSAGE_GROUP_STRATEGY))
+    group_count = int(wfm_config.get('executionQueueMessageGroupCount', os.environ.get(
+        'EXECUTION_QUEUE_MESSAGE_GROUP_COUNT', DEFAULT_MESSAGE_GROUP_COUNT)))
+    if strategy not in MESSAGE_GROUP_STRATEGIES:
+        strategy = DEFAULT_MESSAGE_GROUP_STRATEGY
+    return strategy, max(1, group_count)
+
+
+def get_consumption_mode(customer_config):
+    return customer_config['AMC'].get('WFM', {}).get('executionQueueConsumptionMode', SCHEDULE_CONSUMPTION_MODE)
+
+
+def get_message_group_id(payload, strategy, group_count):
+    if 'MessageGroupId' in payload:
+        return payload['MessageGroupId']
+    if strategy == 'workflow':
+        return payload['workflowId'][:SQS_MAX_MESSAGE_GROUP_ID_LENGTH]
+    if strategy == 'workflowHash':
+        shard = int(hashlib.md5(payload['workflowId'].encode('utf-8')).hexdigest(), 16) % group_count
+        return '{}-{}'.format(DEFAULT_MESSAGE_GROUP_ID, shard)
+    return DEFAULT_MESSAGE_GROUP_ID
+
+
+class ExecutionQueueProducer:
+    def __init__(self, logger, max_workers=DEFAULT_MAX_WORKERS, max_send_attempts=DEFAULT_MAX_SEND_ATTEMPTS):
+        self.logger = logger
+        self.max_workers = max_workers
+        self.max_send_attempts = max_send_attempts
+        self.sqs = boto3.client('sqs')
+
+    def get_queue_url(self, queue_name):
+        return get_queue_url(self.sqs, queue_name)
+
+    def build_message(self, customer_id, payload, strategy=DEFAULT_MESSAGE_GROUP_STRATEGY,
+                      group_count=DEFAULT_MESSAGE_GROUP_COUNT):
+        message_group_id = get_message_group_id(payload, strategy, group_count)
+
+        return {
+            'Id': str(uuid.uuid4()),
+            'MessageBody': json.dumps({"customerId": customer_id, "payload": payload}),
+            'MessageGroupId': message_group_id,
+            'MessageAttributes': {
+                'customerId': {
+                    'StringValue': customer_id,
+                    'DataType': 'String'
+                },
+                'workflowId': {
+                    'StringValue': payload['workflowId'],
+                    'DataType': 'String'
+                }
+            }
+        }
+
+    # sends up to 10 entries, retrying the entries that SQS reports as failed when the failure is not the sender's fault.
+    # A retried entry is sent again together with the later entries of its message group, in their original order, so
+    # the messages of a FIFO group are not queued out of order. The later entries keep their deduplication id, SQS
+    # drops the copies of the ones that were already queued
+    def send_message_batch(self, queue_url, entries):
+        successful = {}
+        failed = {}
+        entries_to_send = entries
+        attempt = 1
+        while len(entries_to_send) > 0:
+            response = self.sqs.send_message_batch(QueueUrl=queue_url, Entries=entries_to_send)
+            for success in response.get('Successful', []):
+                successful[success['Id']] = success
+            failures = {failure['Id']: failure for failure in response.get('Failed', [])}
+
+            retried_groups = set()
+            retry_entries = []
+            for entry in entries_to_send:
+                failure = failures.get(entry['Id'])
+                if failure is not None and (failure['SenderFault'] or attempt >= self.max_send_attempts):
+                    # an entry queued by an earlier attempt stays successful
+                    if entry['Id'] not in successful:
+                        failed[entry['Id']] = failure
+                    continue
+                if failure is not None:
+                    retried_groups.add(entry.get('MessageGroupId'))
+                if entry.get('MessageGroupId') in retried_groups:
+                    retry_entries.append(entry)
+            entries_to_send = retry_entries
+
+            if len(entries_to_send) > 0:
+                self.logger.info('retrying {} entries, attempt {}'.format(len(entries_to_send), attempt + 1))
+                time.sleep(RETRY_BASE_DELAY_SECONDS * (2 ** (attempt - 1)))
+                attempt += 1
+
+        return {'Successful': list(successful.values()), 'Failed': list(failed.values())}
+
+    # splits the messages into at most max_workers lanes, every message of a message group is in the same lane
+    def get_lanes(self, messages):
+        groups = {}
+        for message in messages:
+            groups.setdefault(message['MessageGroupId'], []).append(message)
+
+        lanes = [[] for _ in range(min(self.max_workers, len(groups)))]
+        for index, group_messages in enumerate(groups.values()):
+            lanes[index % len(lanes)] += group_messages
+        return lanes
+
+    def send_lane(self, queue_url, messages):
+        return [self.send_message_batch(queue_url, messages[i:i + SQS_MAX_BATCH_SIZE]) for i in
+                range(0, len(messages), SQS_MAX_BATCH_SIZE)]
+
+    # sends a list of execution payloads to a customer's execution queue and returns a summary of the results
+    def send_payloads(self, customer_config, payloads):
+        customer_id = customer_config['customerId']
+        queue_url = self.get_queue_url(customer_config['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'])
+
+        strategy, group_count = get_message_group_strategy(customer_config)
+        messages = [self.build_message(customer_id, payload, strategy, group_count) for payload in payloads]
+        # the responses report the index of their payload so callers can tell which payloads were not sent
+        payload_indexes = {message['Id']: index for index, message in enumerate(messages)}
+        lanes = self.get_lanes(messages)
+
+        with ThreadPoolExecutor(max_workers=max(1, len(lanes))) as executor:
+            lane_results = list(executor.map(lambda lane: self.send_lane(queue_url, lane), lanes))
+        batch_results = [batch_result for lane_result in lane_results for batch_result in lane_result]
+
+        responses = []
+        response_codes = [200]
+        messages_sent_successfully = 0
+        messages_failed_to_send = 0
+        for batch_result in batch_results:
+            for response in batch_result['Successful']:
+                messages_sent_successfully += 1
+                responses.append({
+                    "HTTPStatusCode": 200,
+                    "MessageId": response['MessageId'],
+                    "PayloadIndex": payload_indexes[response['Id']]
+                })
+            for response in batch_result['Failed']:
+                messages_failed_to_send += 1
+                responses.append({
+                    "HTTPStatusCode": 500,
+                    "ErrorCode": response['Code'],
+                    "MessageId": "",
+                    "PayloadIndex": payload_indexes[response['Id']]
+                })
+                response_codes.append(500)
+
+        self.logger.info('customerId: {} messages sent: {} messages failed: {}'.format(
+            customer_id, messages_sent_successfully, messages_failed_to_send))
+
+        return {
+            "customerId": customer_id,
+            "messages_failed_to_send": messages_failed_to_send,
+            "messages_sent_successfully": messages_sent_successfully,
+            "statusCode": max(response_codes),
+            "responses": responses
+        }
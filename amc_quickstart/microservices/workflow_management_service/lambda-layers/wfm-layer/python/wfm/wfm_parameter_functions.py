@@ -0,0 +1,101 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Resolves the parameter functions that can be used in place of static values in workflow payloads.
+#   NOW()                        current date and time
+#   TODAY(n)                     current date offset by n days
+#   FIRSTDAYOFOFFSETMONTH(n)     first day of the month n months from the current month
+#   LASTDAYOFOFFSETMONTH(n)      last day of the month n months from the current month
+#   FIFTEENTHDAYOFOFFSETMONTH(n) 15th day of the month n months from the current month
+# Each parameter string is parsed once and cached, and the value of a function is cached for each reference time.
+# Every value in a payload, or in a batch of payloads, is resolved against the same reference time so that all the
+# values are consistent with each other.
+
+import calendar
+import re
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+from functools import lru_cache
+
+FUNCTION_NOW = 'NOW'
+FUNCTION_TODAY = 'TODAY'
+FUNCTION_FIRST_DAY_OF_OFFSET_MONTH = 'FIRSTDAYOFOFFSETMONTH'
+FUNCTION_LAST_DAY_OF_OFFSET_MONTH = 'LASTDAYOFOFFSETMONTH'
+FUNCTION_FIFTEENTH_DAY_OF_OFFSET_MONTH = 'FIFTEENTHDAYOFOFFSETMONTH'
+
+PARAMETER_FUNCTION_PATTERN = re.compile(
+    r'(FIRSTDAYOFOFFSETMONTH|LASTDAYOFOFFSETMONTH|FIFTEENTHDAYOFOFFSETMONTH|TODAY)\(\s*([+-]?\d+)\s*\)', re.IGNORECASE)
+
+PAYLOAD_PARAMETERS = ['timeWindowStart', 'timeWindowEnd']
+
+
+def get_reference_time():
+    return datetime.today()
+
+
+# returns (function name, offset) for a parameter function or None for a static value
+@lru_cache(maxsize=4096)
+def parse_parameter(parameter):
+    if parameter.upper() == 'NOW()':
+        return FUNCTION_NOW, 0
+    match = PARAMETER_FUNCTION_PATTERN.search(parameter)
+    if match is None:
+        return None
+    return match.group(1).upper(), int(match.group(2))
+
+
+def format_date(year, month, day):
+    return '{:04d}-{:02d}-{:02d}T00:00:00'.format(year, month, day)
+
+
+@lru_cache(maxsize=1024)
+def evaluate_parameter_function(function_name, offset, now):
+    if function_name == FUNCTION_NOW:
+        return now.strftime('%Y-%m-%dT%H:%M:%S')
+
+    if function_name == FUNCTION_TODAY:
+        offset_date = now + timedelta(days=offset)
+        return format_date(offset_date.year, offset_date.month, offset_date.day)
+
+    offset_month = now + relativedelta(months=offset)
+    if function_name == FUNCTION_FIRST_DAY_OF_OFFSET_MONTH:
+        return format_date(offset_month.year, offset_month.month, 1)
+    if function_name == FUNCTION_LAST_DAY_OF_OFFSET_MONTH:
+        return format_date(offset_month.year, offset_month.month,
+                           calendar.monthrange(offset_month.year, offset_month.month)[1])
+    return format_date(offset_month.year, offset_month.month, 15)
+
+
+# Detects if a function is being used in place of a static value and returns the value as a string in a format that
+# AMC will accept, any other value is returned unchanged
+def process_parameter_functions(parameter, now=None):
+    # static values are returned without being parsed so they do not fill the parse cache
+    if not isinstance(parameter, str) or '(' not in parameter:
+        return parameter
+    parsed_parameter = parse_parameter(parameter)
+    if parsed_parameter is None:
+        return parameter
+    return evaluate_parameter_function(parsed_parameter[0], parsed_parameter[1], now or get_reference_time())
+
+
+# resolves the parameter functions in the parameterValues, timeWindowStart and timeWindowEnd of a payload
+def process_payload_parameters(payload, now=None):
+    now = now or get_reference_time()
+    if 'parameterValues' in payload:
+        for parameter in payload['parameterValues']:
+            payload['parameterValues'][parameter] = process_parameter_functions(payload['parameterValues'][parameter], now)
+    for parameter in PAYLOAD_PARAMETERS:
+        if parameter in payload:
+            payload[parameter] = process_parameter_functions(payload[parameter], now)
+    return payload
@@ -0,0 +1,224 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Parses and evaluates the schedule expressions stored in the AMCWorkflowSchedules table.
+# Supports EventBridge cron expressions, cron(Minutes Hours Day-of-month Month Day-of-week Year) including the
+# L, W and # day options, and the WFM custom expressions:
+#   custom(H * *)  every hour
+#   custom(D * 14) every day at 14:00 UTC
+#   custom(W 2 8)  every week on weekday 2 (0 is Monday) at 08:00 UTC
+#   custom(M 15 2) every month on day 15 at 02:00 UTC
+# All times are naive UTC datetimes with minute resolution.
+
+import calendar
+import re
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+
+MINIMUM_YEAR = 1970
+MAXIMUM_YEAR = 2199
+
+MONTH_NAMES = {'JAN': 1, 'FEB': 2, 'MAR': 3, 'APR': 4, 'MAY': 5, 'JUN': 6, 'JUL': 7, 'AUG': 8, 'SEP': 9, 'OCT': 10,
+               'NOV': 11, 'DEC': 12}
+# EventBridge numbers the days of the week from 1 (Sunday) to 7 (Saturday)
+DAY_NAMES = {'SUN': 1, 'MON': 2, 'TUE': 3, 'WED': 4, 'THU': 5, 'FRI': 6, 'SAT': 7}
+
+CUSTOM_EXPRESSION_PATTERN = re.compile(r'^custom\(\s*([HDWM])\s+(\S+)\s+(\S+)\s*\)$', re.IGNORECASE)
+CRON_EXPRESSION_PATTERN = re.compile(r'^cron\((.*)\)$', re.IGNORECASE)
+
+
+def get_cron_day_of_week(value):
+    # python weekdays start at 0 for Monday
+    return ((value.weekday() + 1) % 7) + 1
+
+
+def parse_value(value, names):
+    value = value.upper()
+    if value in names:
+        return names[value]
+    if not value.isdigit():
+        raise ValueError('invalid value {}'.format(value))
+    return int(value)
+
+
+# returns the set of values matched by a cron field, e.g. "0-30/10" returns {0, 10, 20, 30}
+def parse_field(field, minimum, maximum, names=None):
+    names = names or {}
+    values = set()
+    for part in field.split(','):
+        step = 1
+        if '/' in part:
+            part, step_value = part.split('/', 1)
+            step = int(step_value)
+            if step < 1:
+                raise ValueError('invalid step in {}'.format(field))
+
+        if part in ['*', '?']:
+            start, end = minimum, maximum
+        elif '-' in part:
+            start_value, end_value = part.split('-', 1)
+            start, end = parse_value(start_value, names), parse_value(end_value, names)
+        else:
+            start = parse_value(part, names)
+            # "5/15" starts at 5 and repeats until the maximum
+            end = maximum if step > 1 else start
+
+        if start < minimum or end > maximum or start > end:
+            raise ValueError('{} is out of range {}-{}'.format(field, minimum, maximum))
+        values.update(range(start, end + 1, step))
+    return values
+
+
+def get_nearest_weekday(year, month, day):
+    last_day = calendar.monthrange(year, month)[1]
+    day = min(day, last_day)
+    weekday = date(year, month, day).weekday()
+    if weekday == 5:
+        # Saturday moves to Friday, or to Monday if that would leave the month
+        return day - 1 if day > 1 else day + 2
+    if weekday == 6:
+        # Sunday moves to Monday, or to Friday if that would leave the month
+        return day + 1 if day < last_day else day - 2
+    return day
+
+
+# returns a function that checks whether a date matches the day of month field
+def parse_day_of_month(field):
+    if field in ['*', '?']:
+        return None
+    if field == 'L':
+        return lambda value: value.day == calendar.monthrange(value.year, value.month)[1]
+    if field == 'LW':
+        return lambda value: value.day == get_nearest_weekday(value.year, value.month, 31)
+    if field.endswith('W'):
+        day = int(field[:-1])
+        if day < 1 or day > 31:
+            raise ValueError('{} is out of range 1-31'.format(field))
+        return lambda value: value.day == get_nearest_weekday(value.year, value.month, day)
+
+    days = parse_field(field, 1, 31)
+    return lambda value: value.day in days
+
+
+# returns a function that checks whether a date matches the day of week field
+def parse_day_of_week(field):
+    if field in ['*', '?']:
+        return None
+    if field == 'L':
+        # the last day of the week, every Saturday
+        return lambda value: get_cron_day_of_week(value) == 7
+    if field.endswith('L'):
+        # the last occurrence of the weekday in the month, e.g. 6L is the last Friday
+        day_of_week = parse_value(field[:-1], DAY_NAMES)
+        return lambda value: (get_cron_day_of_week(value) == day_of_week and
+                              value.day + 7 > calendar.monthrange(value.year, value.month)[1])
+    if '#' in field:
+        # the nth occurrence of the weekday in the month, e.g. 2#1 is the first Monday
+        day_of_week_value, occurrence_value = field.split('#', 1)
+        day_of_week = parse_value(day_of_week_value, DAY_NAMES)
+        occurrence = int(occurrence_value)
+        return lambda value: get_cron_day_of_week(value) == day_of_week and (value.day - 1) // 7 + 1 == occurrence
+
+    days_of_week = parse_field(field, 1, 7, DAY_NAMES)
+    return lambda value: get_cron_day_of_week(value) in days_of_week
+
+
+class ScheduleExpression:
+    def __init__(self, expression, minutes, hours, months, years, day_of_month=None, day_of_week=None):
+        self.expression = expression
+        self.minutes = sorted(minutes)
+        self.hours = sorted(hours)
+        self.months = months
+        self.years = years
+        self.day_of_month = day_of_month
+        self.day_of_week = day_of_week
+
+    def day_matches(self, value):
+        if self.day_of_month is not None and not self.day_of_month(value):
+            return False
+        if self.day_of_week is not None and not self.day_of_week(value):
+            return False
+        return True
+
+    def matches(self, value):
+        return (value.minute in self.minutes and value.hour in self.hours and value.month in self.months and
+                value.year in self.years and self.day_matches(value))
+
+    # returns the first fire time after the given time, or None if the expression does not fire again
+    def get_next_fire_time(self, after):
+        start = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = start.date()
+        last_day = date(max(self.years), 12, 31)
+        while day <= last_day:
+            if day.year not in self.years:
+                day = date(day.year + 1, 1, 1)
+            elif day.month not in self.months:
+                day = date(day.year + 1, 1, 1) if day.month == 12 else date(day.year, day.month + 1, 1)
+            else:
+                if self.day_matches(day):
+                    for hour in self.hours:
+                        for minute in self.minutes:
+                            fire_time = datetime(day.year, day.month, day.day, hour, minute)
+                            if fire_time >= start:
+                                return fire_time
+                day += timedelta(days=1)
+        return None
+
+
+def parse_cron_expression(expression, fields):
+    if len(fields) != 6:
+        raise ValueError('cron expressions must have 6 fields: {}'.format(expression))
+    minutes, hours, day_of_month, month, day_of_week, year = fields
+    return ScheduleExpression(
+        expression,
+        minutes=parse_field(minutes, 0, 59),
+        hours=parse_field(hours, 0, 23),
+        months=parse_field(month, 1, 12, MONTH_NAMES),
+        years=parse_field(year, MINIMUM_YEAR, MAXIMUM_YEAR),
+        day_of_month=parse_day_of_month(day_of_month.upper()),
+        day_of_week=parse_day_of_week(day_of_week.upper())
+    )
+
+
+def parse_custom_expression(expression, frequency, day, hour):
+    all_hours = range(0, 24)
+    all_months = range(1, 13)
+    all_years = range(MINIMUM_YEAR, MAXIMUM_YEAR + 1)
+    if frequency == 'H':
+        return ScheduleExpression(expression, [0], all_hours, all_months, all_years)
+    if frequency == 'D':
+        return ScheduleExpression(expression, [0], parse_field(hour, 0, 23), all_months, all_years)
+    if frequency == 'W':
+        days_of_week = {(weekday + 1) % 7 + 1 for weekday in parse_field(day, 0, 6)}
+        return ScheduleExpression(expression, [0], parse_field(hour, 0, 23), all_months, all_years,
+                                  day_of_week=lambda value: get_cron_day_of_week(value) in days_of_week)
+    days = parse_field(day, 1, 31)
+    return ScheduleExpression(expression, [0], parse_field(hour, 0, 23), all_months, all_years,
+                              day_of_month=lambda value: value.day in days)
+
+
+# parsed expressions are cached since the same expressions are evaluated on every scheduler tick
+@lru_cache(maxsize=1024)
+def parse_schedule_expression(expression):
+    normalized_expression = ' '.join(expression.split())
+
+    match = CRON_EXPRESSION_PATTERN.match(normalized_expression)
+    if match is not None:
+        return parse_cron_expression(normalized_expression, match.group(1).split())
+
+    match = CUSTOM_EXPRESSION_PATTERN.match(normalized_expression)
+    if match is not None:
+        return parse_custom_expression(normalized_expression, match.group(1).upper(), match.group(2), match.group(3))
+
+    raise ValueError('unsupported schedule expression {}'.format(expression))
@@ -0,0 +1,227 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Maintains the sparse next fire time index on the AMCWorkflowSchedules table.
+# Enabled schedules run by the CustomScheduler carry nextFireTime and scheduleShard attributes, the next-fire-time-index
+# is keyed on both so the due schedules of a shard are found with a single range query on nextFireTime <= now. When a
+# schedule is run its nextFireTime is advanced with a conditional update, so a schedule is only run once for each fire
+# time. Disabled schedules do not have the attributes so they are not part of the index.
+# The functions take a client created from the DynamoDB resource (see wfm_batch_writer.get_dynamodb_resource_client) so
+# items and conditions use python types and the client can be shared by several threads.
+
+import hashlib
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from wfm import wfm_schedule_expressions
+
+NEXT_FIRE_TIME_INDEX_NAME = 'next-fire-time-index'
+NEXT_FIRE_TIME_ATTRIBUTE = 'nextFireTime'
+SCHEDULE_SHARD_ATTRIBUTE = 'scheduleShard'
+# spreads the schedules over several index partitions so a large number of schedules firing at once can be read in parallel
+SCHEDULE_SHARD_COUNT = 8
+FIRE_TIME_FORMAT = '%Y-%m-%dT%H:%M:%S'
+
+
+def normalize_schedule_expression(schedule_expression):
+    return ' '.join(schedule_expression.split())
+
+
+# returns True if the schedule is run by the CustomScheduler, cron schedules have their own EventBridge rule when the
+# legacy schedules are enabled
+def is_custom_scheduler_schedule(schedule, legacy_eventbridge_schedules=False):
+    schedule_expression = normalize_schedule_expression(schedule.get('ScheduleExpression', ''))
+    if schedule.get('State', 'ENABLED') != 'ENABLED':
+        return False
+    if schedule_expression.startswith('cron('):
+        return not legacy_eventbridge_schedules
+    return schedule_expression.startswith('custom(')
+
+
+def get_schedule_shard(schedule):
+    schedule_key = '{}#{}'.format(schedule['customerId'], schedule['Name'])
+    return str(int(hashlib.md5(schedule_key.encode('utf-8')).hexdigest(), 16) % SCHEDULE_SHARD_COUNT)
+
+
+def get_next_fire_time(schedule_expression, after):
+    next_fire_time = wfm_schedule_expressions.parse_schedule_expression(schedule_expression).get_next_fire_time(after)
+    if next_fire_time is None:
+        return None
+    return next_fire_time.strftime(FIRE_TIME_FORMAT)
+
+
+# returns the nextFireTime the schedule should have, the current value is kept unless the schedule's expression or
+# state changed so rewriting a schedule does not move its next run
+def get_schedule_next_fire_time(schedule, previous_schedule, now, logger):
+    current_next_fire_time = schedule.get(NEXT_FIRE_TIME_ATTRIBUTE)
+    if current_next_fire_time is not None and (previous_schedule is None or (
+            previous_schedule.get('ScheduleExpression') == schedule.get('ScheduleExpression') and
+            previous_schedule.get('State', 'ENABLED') == schedule.get('State', 'ENABLED'))):
+        return current_next_fire_time
+
+    try:
+        return get_next_fire_time(schedule['ScheduleExpression'], now)
+    except ValueError as e:
+        logger.error('schedule {} for customerId {} is not valid: {}'.format(schedule['Name'], schedule['customerId'], e))
+        return None
+
+
+# returns the index attributes the schedule should have, a value of None means the attribute should be removed
+def get_schedule_index_attributes(schedule, previous_schedule, now, logger, legacy_eventbridge_schedules=False):
+    index_attributes = {
+        NEXT_FIRE_TIME_ATTRIBUTE: None,
+        SCHEDULE_SHARD_ATTRIBUTE: None
+    }
+    if not is_custom_scheduler_schedule(schedule, legacy_eventbridge_schedules):
+        return index_attributes
+
+    next_fire_time = get_schedule_next_fire_time(schedule, previous_schedule, now, logger)
+    if next_fire_time is not None:
+        index_attributes[NEXT_FIRE_TIME_ATTRIBUTE] = next_fire_time
+        index_attributes[SCHEDULE_SHARD_ATTRIBUTE] = get_schedule_shard(schedule)
+    return index_attributes
+
+
+# sets or removes the index attributes so they match the schedule's expression and state, the update is skipped when
+# the attributes are already correct so the stream record created by the update does not cause another update
+def update_schedule_index(dynamodb_client, table_name, schedule, now, logger, previous_schedule=None,
+                          legacy_eventbridge_schedules=False):
+    index_attributes = get_schedule_index_attributes(schedule, previous_schedule, now, logger,
+                                                     legacy_eventbridge_schedules)
+    changed_attributes = {name: value for name, value in index_attributes.items() if schedule.get(name) != value}
+    if len(changed_attributes) == 0:
+        return None
+
+    attribute_names = {}
+    attribute_values = {}
+    set_expressions = []
+    remove_expressions = []
+    for index, (name, value) in enumerate(changed_attributes.items()):
+        attribute_names['#attribute{}'.format(index)] = name
+        if value is None:
+            remove_expressions.append('#attribute{}'.format(index))
+        else:
+            attribute_values[':value{}'.format(index)] = value
+            set_expressions.append('#attribute{0} = :value{0}'.format(index))
+
+    update_expression = ''
+    if len(set_expressions) > 0:
+        update_expression += 'SET {} '.format(', '.join(set_expressions))
+    if len(remove_expressions) > 0:
+        update_expression += 'REMOVE {}'.format(', '.join(remove_expressions))
+
+    update_arguments = {
+        'TableName': table_name,
+        'Key': {'customerId': schedule['customerId'], 'Name': schedule['Name']},
+        'UpdateExpression': update_expression.strip(),
+        # the schedule may have been changed since the image was read, a later stream record will update it
+        'ConditionExpression': Attr('ScheduleExpression').eq(schedule['ScheduleExpression']),
+        'ExpressionAttributeNames': attribute_names
+    }
+    if len(attribute_values) > 0:
+        update_arguments['ExpressionAttributeValues'] = attribute_values
+
+    try:
+        response = dynamodb_client.update_item(**update_arguments)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.info('schedule {} for customerId {} changed before its index attributes were updated'.format(
+            schedule['Name'], schedule['customerId']))
+        return None
+
+    logger.info('schedule {} for customerId {} index attributes updated {}'.format(
+        schedule['Name'], schedule['customerId'], changed_attributes))
+    return response
+
+
+# moves the schedule's nextFireTime to its first fire time after the given time, returns False if another
+# invocation already advanced it so the schedule is only run by the invocation that advanced it
+def advance_next_fire_time(dynamodb_client, table_name, schedule, after, logger):
+    update_arguments = {
+        'TableName': table_name,
+        'Key': {'customerId': schedule['customerId'], 'Name': schedule['Name']},
+        'ConditionExpression': Attr(NEXT_FIRE_TIME_ATTRIBUTE).eq(schedule[NEXT_FIRE_TIME_ATTRIBUTE]),
+        'ExpressionAttributeNames': {'#nextFireTime': NEXT_FIRE_TIME_ATTRIBUTE}
+    }
+    try:
+        next_fire_time = get_next_fire_time(schedule['ScheduleExpression'], after)
+    except ValueError as e:
+        logger.error('schedule {} for customerId {} is not valid: {}'.format(schedule['Name'], schedule['customerId'], e))
+        return False
+
+    if next_fire_time is None:
+        # the expression does not fire again, remove the schedule from the index
+        update_arguments['UpdateExpression'] = 'REMOVE #nextFireTime, #shard'
+        update_arguments['ExpressionAttributeNames']['#shard'] = SCHEDULE_SHARD_ATTRIBUTE
+    else:
+        update_arguments['UpdateExpression'] = 'SET #nextFireTime = :nextFireTime'
+        update_arguments['ExpressionAttributeValues'] = {':nextFireTime': next_fire_time}
+
+    try:
+        dynamodb_client.update_item(**update_arguments)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.info('schedule {} for customerId {} was already advanced'.format(schedule['Name'], schedule['customerId']))
+        return False
+    return True
+
+
+# puts back the nextFireTime a schedule had before advance_next_fire_time moved it past the given time, used when the
+# run could not be sent so the schedule is run again by the next tick. Returns False if the schedule was changed since
+def restore_next_fire_time(dynamodb_client, table_name, schedule, after, logger):
+    update_arguments = {
+        'TableName': table_name,
+        'Key': {'customerId': schedule['customerId'], 'Name': schedule['Name']},
+        'UpdateExpression': 'SET #nextFireTime = :previousNextFireTime, #shard = :shard',
+        'ExpressionAttributeNames': {'#nextFireTime': NEXT_FIRE_TIME_ATTRIBUTE, '#shard': SCHEDULE_SHARD_ATTRIBUTE},
+        'ExpressionAttributeValues': {
+            ':previousNextFireTime': schedule[NEXT_FIRE_TIME_ATTRIBUTE],
+            ':shard': schedule[SCHEDULE_SHARD_ATTRIBUTE]
+        }
+    }
+    next_fire_time = get_next_fire_time(schedule['ScheduleExpression'], after)
+    if next_fire_time is None:
+        update_arguments['ConditionExpression'] = Attr(NEXT_FIRE_TIME_ATTRIBUTE).not_exists() & Attr(
+            'ScheduleExpression').eq(schedule['ScheduleExpression'])
+    else:
+        update_arguments['ConditionExpression'] = Attr(NEXT_FIRE_TIME_ATTRIBUTE).eq(next_fire_time)
+
+    try:
+        dynamodb_client.update_item(**update_arguments)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+        logger.info('schedule {} for customerId {} changed before its nextFireTime was restored'.format(
+            schedule['Name'], schedule['customerId']))
+        return False
+    return True
+
+
+# updates the index attributes on every schedule, used to add schedules created before the index existed
+def rebuild_schedule_index(dynamodb_client, table_name, now, logger, legacy_eventbridge_schedules=False):
+    schedules_updated = 0
+    scan_arguments = {'TableName': table_name}
+    while True:
+        response = dynamodb_client.scan(**scan_arguments)
+        for schedule in response.get('Items', []):
+            if update_schedule_index(dynamodb_client, table_name, schedule, now, logger,
+                                     legacy_eventbridge_schedules=legacy_eventbridge_schedules) is not None:
+                schedules_updated += 1
+        if 'LastEvaluatedKey' not in response:
+            break
+        scan_arguments['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+    logger.info('schedule index rebuilt, {} schedules updated'.format(schedules_updated))
+    return schedules_updated
@@ -22,8 +22,30 @@ from aws_lambda_powertools import Logger
 import time
 from datetime import date, timedelta, datetime, timezone
 import re
-import calendar
-from dateutil.relativedelta import relativedelta
+import hashlib
+import queue
+import threading
+from dateutil.parser import parse
+from wfm import wfm_dynamodb_types, wfm_parameter_functions
+
+# boto3 client creation is not thread safe so the shared dynamodb and sns clients are created once under a lock,
+# the clients themselves can be used from several threads
+dynamodb_client = None
+dynamodb_client_lock = threading.Lock()
+sns_client = None
+sns_client_lock = threading.Lock()
+
+# PublishBatch accepts up to 10 messages per request and at most 256 KB for all of the messages of a request together
+SNS_MAX_BATCH_SIZE = 10
+SNS_MAX_BATCH_BYTES = 262144
+
+# pages read ahead by each get_workflow_executions_multi query thread before it waits for the caller
+MAX_BUFFERED_PAGES_PER_QUERY = 2
+QUEUE_PUT_TIMEOUT_SECONDS = 0.1
+
+# attributes that identify a workflow execution request, two executions with the same values request the same report
+EXECUTION_IDENTITY_ATTRIBUTES = ['workflowId', 'timeWindowStart', 'timeWindowEnd', 'timeWindowTimeZone',
+                                 'timeWindowType', 'parameterValues']
 
 
 class Utils:
@@ -52,8 +74,46 @@ class Utils:
         return rounded_time
 
 
-    def deseralize_dynamodb_item(self, item):
-        return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+    # native_numbers returns numbers as int and float instead of Decimal
+    def deseralize_dynamodb_item(self, item, native_numbers=False):
+        return wfm_dynamodb_types.deserialize_item(item, native_numbers)
+
+    # parses the ISO-8601 timestamps returned by the AMC API (e.g. 2022-08-01T12:30:00Z) without dateutil,
+    # fromisoformat does not accept a Z suffix before python 3.11 so it is replaced with the equivalent offset
+    # and dateutil is only used for values that fromisoformat cannot parse
+    def parse_iso_datetime(self, value):
+        try:
+            if value.endswith('Z'):
+                return datetime.fromisoformat(value[:-1] + '+00:00')
+            return datetime.fromisoformat(value)
+        except ValueError:
+            return parse(value)
+
+    def get_dynamodb_client(self):
+        global dynamodb_client
+        with dynamodb_client_lock:
+            if dynamodb_client is None:
+                dynamodb_client = boto3.client('dynamodb')
+        return dynamodb_client
+
+    def get_sns_client(self):
+        global sns_client
+        with sns_client_lock:
+            if sns_client is None:
+                sns_client = boto3.client('sns')
+        return sns_client
+
+    # returns a hash of the attributes that identify an execution request so executions can be compared with set lookups
+    # timeWindowType defaults to EXPLICIT and missing parameterValues are treated as empty, matching the AMC defaults
+    def get_execution_identity(self, execution):
+        identity = {attribute: execution.get(attribute) for attribute in EXECUTION_IDENTITY_ATTRIBUTES}
+        if identity['timeWindowType'] is None:
+            identity['timeWindowType'] = 'EXPLICIT'
+        if identity['parameterValues'] is None:
+            identity['parameterValues'] = {}
+        canonical_identity = json.dumps(identity, sort_keys=True, separators=(',', ':'),
+                                        default=self.json_encoder_default)
+        return hashlib.sha256(canonical_identity.encode('utf-8')).hexdigest()
 
 
     def get_cloudformation_rule_names(self, cloudwatch_rule_name_prefix):
@@ -94,7 +154,7 @@ class Utils:
             if 'Items' in page:
                 for item in page['Items']:
                     dynamodb_item = self.deseralize_dynamodb_item(item)
-                    dynamodb_records.append(dynamodb_item.copy())
+                    dynamodb_records.append(dynamodb_item)
         return dynamodb_records
 
     def get_all_dynamodb_table_names(self):
@@ -173,7 +233,40 @@ class Utils:
                 for item in page['Items']:
                     customer_config_item = self.deseralize_dynamodb_item(item)
                     # add the client config dictionary to our array
-                    customer_configs[customer_config_item['customerId']] = customer_config_item.copy()
+                    customer_configs[customer_config_item['customerId']] = customer_config_item
+        return customer_configs
+
+    # gets the customer config records for a list of customer ids with BatchGetItem instead of scanning the whole table
+    def dynamodb_batch_get_customer_config_records(self, dynamodb_table_name, customer_ids):
+        customer_configs = {}
+        dynamodb = boto3.client('dynamodb')
+
+        # BatchGetItem accepts up to 100 keys per request
+        unique_customer_ids = list(dict.fromkeys(customer_ids))
+        for index in range(0, len(unique_customer_ids), 100):
+            request_items = {
+                dynamodb_table_name: {
+                    'Keys': [{'customerId': {'S': customer_id}} for customer_id in
+                             unique_customer_ids[index:index + 100]],
+                    'ConsistentRead': False
+                }
+            }
+            attempt = 0
+            while request_items:
+                if attempt > 0:
+                    time.sleep(min(0.1 * (2 ** attempt), 2))
+                response = dynamodb.batch_get_item(RequestItems=request_items)
+                for item in response.get('Responses', {}).get(dynamodb_table_name, []):
+                    customer_config_item = self.deseralize_dynamodb_item(item)
+                    customer_configs[customer_config_item['customerId']] = customer_config_item
+                # retry any keys that were not processed because of throughput limits
+                request_items = response.get('UnprocessedKeys', {})
+                attempt += 1
+
+        missing_customer_ids = [customer_id for customer_id in unique_customer_ids if customer_id not in customer_configs]
+        if len(missing_customer_ids) > 0:
+            self.logger.info('customer config records not found for customerIds {}'.format(missing_customer_ids))
+
         return customer_configs
 
 
@@ -218,46 +311,12 @@ class Utils:
         else:
             return False
 
-    def get_offset_value(self, offset_string):
-        return int(offset_string.split('(')[1].split(')')[0])
-
-    def get_current_date_with_offset(self, offset_in_days):
-        return ((datetime.today() + timedelta(days=offset_in_days)).strftime('%Y-%m-%dT00:00:00'))
-
-    def get_current_date_with_month_offset(self, offset_in_months):
-        return (datetime.today() + relativedelta(months=offset_in_months))
-
-    def get_last_day_of_month(self, date):
-        return calendar.monthrange(date.year, date.month)[1]
-
-    def process_parameter_functions(self, parameter):
-        if parameter.upper() == 'NOW()':
-            return datetime.today().strftime('%Y-%m-%dT%H:%M:%S')
-
-        if "TODAY(" in parameter.upper():
-            return self.get_current_date_with_offset(self.get_offset_value(parameter))
-
-        if "LASTDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            last_day_of_previous_month = self.get_last_day_of_month(date_with_month_offset)
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month, last_day_of_previous_month,
-                                   date_with_month_offset.hour, date_with_month_offset.minute).strftime('%Y-%m-%dT00:00:00')
-            return return_value
-
-        if "FIRSTDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month, 1, date_with_month_offset.hour,
-                                   date_with_month_offset.minute).strftime('%Y-%m-%dT00:00:00')
-            return return_value
-
-        if "FIFTEENTHDAYOFOFFSETMONTH(" in parameter.upper():
-            date_with_month_offset = self.get_current_date_with_month_offset(self.get_offset_value(parameter))
-            return_value = datetime(date_with_month_offset.year, date_with_month_offset.month, 15, date_with_month_offset.hour,
-                                   date_with_month_offset.minute).strftime('%Y-%m-%dT00:00:00')
-            return return_value
-        # if no conditions are met, return the parameter unchanged
-        return parameter
+    def process_parameter_functions(self, parameter, now=None):
+        return wfm_parameter_functions.process_parameter_functions(parameter, now)
 
+    # Process the parameters to enable now() and today() functions, pass the same now to every payload of a batch
+    def process_payload_parameters(self, payload_item, now=None):
+        return wfm_parameter_functions.process_payload_parameters(payload_item, now)
 
     def dynamodb_put_item(self, table_name, item):
         dynamodb = boto3.resource('dynamodb')
@@ -298,15 +357,17 @@ class Utils:
         }
 
 
-    def dynamodb_delete_item(self, table_name, item):
+    # deletes an item by its key, or by the key attributes of a full item when only the item is given
+    def dynamodb_delete_item(self, table_name, item=None, key=None):
         dynamodb = boto3.resource('dynamodb')
         table = dynamodb.Table(table_name)
-        key_schema = table.key_schema
-        self.logger.info('key schema {}'.format(key_schema))
-        item_key = {}
-
-        for key in key_schema:
-            item_key[key] = item[key]
+        item_key = key
+        if item_key is None:
+            key_schema = table.key_schema
+            self.logger.info('key schema {}'.format(key_schema))
+            item_key = {}
+            for key_attribute in key_schema:
+                item_key[key_attribute['AttributeName']] = item[key_attribute['AttributeName']]
 
         self.logger.info(f'attempting delete item from table {table_name} with key {item_key}')
         response = table.delete_item(Key=item_key)
@@ -316,108 +377,150 @@ class Utils:
 
     def dynamodb_get_workflow_executions(self, config, *, execution_status=None, workflow_id=None, minimum_create_date_string=None,
                               max_items=None, workflow_id_to_exclude=None):
-
-        # self.logger.info('execution_status:{} workflow_id:{} minimum_create_date_string:{} max_items:{}'.format(execution_status,workflow_id,minimum_create_date_string,max_items))
-        # Set up a DynamoDB Connection
-        dynamodb = boto3.client('dynamodb')
-
-        # Get the name of the tracking table from an environment variable
-        AMC_EXEUCTION_TRACKING_DYNAMODB_TABLE = config['AMC']['WFM']['syncWorkflowStatuses'][
-            'amcWorkflowExecutionTrackingDynamoDBTableName']
-
-        workflowExecutions = []
-
-        # Set up a DynamoDB Connection
-        dynamodb = boto3.client('dynamodb')
-
-        # We want to get the whole table for all configs so we pagniate in case there is large number of items
-        paginator = dynamodb.get_paginator('query')
-        query_filter = {}
-        key_conditions = {}
-
-        key_conditions['customerId'] = {
-            'AttributeValueList': [
-                {
-                    'S': config['customerId']
-                },
-            ],
-            'ComparisonOperator': 'EQ'
-        }
+        execution_statuses = None
+        if execution_status is not None:
+            execution_statuses = [execution_status]
+
+        return list(self.get_workflow_executions_multi(config, statuses=execution_statuses, workflow_ids=workflow_id,
+                                                       workflow_ids_to_exclude=workflow_id_to_exclude,
+                                                       minimum_create_date_string=minimum_create_date_string,
+                                                       max_items=max_items))
+
+    @staticmethod
+    def get_in_filter_expression(attribute_name, values, value_prefix, expression_attribute_values):
+        # the IN operator accepts up to 100 operands so longer lists are split into several IN conditions
+        conditions = []
+        for chunk_start in range(0, len(values), 100):
+            value_names = []
+            for index, value in enumerate(values[chunk_start:chunk_start + 100]):
+                value_name = ':{}{}'.format(value_prefix, chunk_start + index)
+                expression_attribute_values[value_name] = {'S': value}
+                value_names.append(value_name)
+            conditions.append('{} IN ({})'.format(attribute_name, ', '.join(value_names)))
+        return '({})'.format(' OR '.join(conditions))
+
+    def get_workflow_executions_query_arguments(self, config, execution_status, workflow_ids, workflow_ids_to_exclude,
+                                                minimum_create_date_string, max_items, projection):
+        expression_attribute_names = {'#customerId': 'customerId'}
+        expression_attribute_values = {':customerId': {'S': config['customerId']}}
+        key_condition_expression = '#customerId = :customerId'
 
         if execution_status is not None:
-            key_conditions['executionStatus'] = {
-                'AttributeValueList': [
-                    {
-                        'S': execution_status
-                    }
-                ],
-                'ComparisonOperator': 'EQ'
-            }
+            expression_attribute_names['#executionStatus'] = 'executionStatus'
+            expression_attribute_values[':executionStatus'] = {'S': execution_status}
+            key_condition_expression += ' AND #executionStatus = :executionStatus'
 
+        filter_expressions = []
         if minimum_create_date_string is not None:
-            query_filter['createTime'] = {
-                'AttributeValueList': [
-                    {'S': minimum_create_date_string}
-
-                ],
-                'ComparisonOperator': 'GE'
-            }
-
-        if workflow_id is not None:
-            if type(workflow_id) == str:
-                workflow_id = [workflow_id]
-            if type(workflow_id) == list:
-                for workflow_id_to_include in workflow_id:
-                    query_filter['workflowId'] = {
-                        'AttributeValueList': [
-                            {'S': workflow_id_to_include}
-
-                        ],
-                        'ComparisonOperator': 'EQ'
-                    }
-
-        if workflow_id_to_exclude is not None:
-            if type(workflow_id_to_exclude) == str:
-                workflow_id_to_exclude = [workflow_id_to_exclude]
-
-            if type(workflow_id_to_exclude) == list :
-                for workflow_id_item_to_exclude in workflow_id_to_exclude:
-                    query_filter['workflowId'] = {
-                        'AttributeValueList': [
-                            {'S': workflow_id_item_to_exclude}
-
-                        ],
-                        'ComparisonOperator': 'NE'
-                    }
-
-        pagination_config = {'PageSize': 1000}
+            expression_attribute_names['#createTime'] = 'createTime'
+            expression_attribute_values[':minimumCreateTime'] = {'S': minimum_create_date_string}
+            filter_expressions.append('#createTime >= :minimumCreateTime')
+
+        if len(workflow_ids) > 0 or len(workflow_ids_to_exclude) > 0:
+            expression_attribute_names['#workflowId'] = 'workflowId'
+        if len(workflow_ids) > 0:
+            filter_expressions.append(self.get_in_filter_expression('#workflowId', workflow_ids, 'workflowId',
+                                                                    expression_attribute_values))
+        if len(workflow_ids_to_exclude) > 0:
+            filter_expressions.append('NOT {}'.format(
+                self.get_in_filter_expression('#workflowId', workflow_ids_to_exclude, 'excludedWorkflowId',
+                                              expression_attribute_values)))
+
+        query_arguments = {
+            'TableName': config['AMC']['WFM']['syncWorkflowStatuses']['amcWorkflowExecutionTrackingDynamoDBTableName'],
+            'IndexName': 'executionStatus-workflowId-index',
+            'ConsistentRead': False,
+            'KeyConditionExpression': key_condition_expression,
+            'ScanIndexForward': False,
+            'PaginationConfig': {'PageSize': 1000}
+        }
 
         if max_items is not None:
-            pagination_config['max_items'] = max_items
-
-        response_iterator = paginator.paginate(
-            TableName=AMC_EXEUCTION_TRACKING_DYNAMODB_TABLE,
-            IndexName='executionStatus-workflowId-index',
-            Select='ALL_PROJECTED_ATTRIBUTES',
-            ConsistentRead=False,
-            ReturnConsumedCapacity='INDEXES',
-            KeyConditions=key_conditions,
-            QueryFilter=query_filter,
-            ScanIndexForward=False,
-            PaginationConfig=pagination_config
-        )
-
-        # Iterate over each page from the iterator
-        for page in response_iterator:
-            # deseralize each "item" (or record) into a client config dictionary
-            if 'Items' in page:
-                for item in page['Items']:
-                    workflowExecution = self.deseralize_dynamodb_item(item)
-                    # add the client config dictionary to our array
-                    workflowExecutions.append(workflowExecution.copy())
-        # self.logger.info('workflowExecutions count: {}'.format(len(workflowExecutions)))
-        return (workflowExecutions)
+            query_arguments['PaginationConfig']['MaxItems'] = max_items
+
+        if len(filter_expressions) > 0:
+            query_arguments['FilterExpression'] = ' AND '.join(filter_expressions)
+
+        if projection is not None:
+            # only attributes projected into the executionStatus-workflowId-index can be returned
+            projection_names = []
+            for index, attribute in enumerate(projection):
+                expression_attribute_names['#projection{}'.format(index)] = attribute
+                projection_names.append('#projection{}'.format(index))
+            query_arguments['ProjectionExpression'] = ', '.join(projection_names)
+        else:
+            query_arguments['Select'] = 'ALL_PROJECTED_ATTRIBUTES'
+
+        query_arguments['ExpressionAttributeNames'] = expression_attribute_names
+        query_arguments['ExpressionAttributeValues'] = expression_attribute_values
+        return query_arguments
+
+    # queries the execution tracking table for several execution statuses at the same time and yields each execution
+    # as soon as its page has been read. statuses=None queries all statuses in a single query, max_items applies
+    # to each status separately
+    def get_workflow_executions_multi(self, config, *, statuses=None, workflow_ids=None, workflow_ids_to_exclude=None,
+                                      minimum_create_date_string=None, max_items=None, projection=None):
+        if statuses is None:
+            statuses = [None]
+        if type(statuses) == str:
+            statuses = [statuses]
+        if workflow_ids is None:
+            workflow_ids = []
+        if type(workflow_ids) == str:
+            workflow_ids = [workflow_ids]
+        if workflow_ids_to_exclude is None:
+            workflow_ids_to_exclude = []
+        if type(workflow_ids_to_exclude) == str:
+            workflow_ids_to_exclude = [workflow_ids_to_exclude]
+
+        paginator = self.get_dynamodb_client().get_paginator('query')
+        # the queue is bounded so the query threads stop reading pages when the caller does not keep up, the stop event
+        # ends the threads when the caller stops iterating before all the pages have been read
+        pages = queue.Queue(maxsize=len(statuses) * MAX_BUFFERED_PAGES_PER_QUERY)
+        stop = threading.Event()
+
+        # returns False if the caller stopped iterating before the page could be queued
+        def put_page(page):
+            while not stop.is_set():
+                try:
+                    pages.put(page, timeout=QUEUE_PUT_TIMEOUT_SECONDS)
+                    return True
+                except queue.Full:
+                    pass
+            return False
 
+        def query_status(execution_status):
+            try:
+                query_arguments = self.get_workflow_executions_query_arguments(
+                    config, execution_status, workflow_ids, workflow_ids_to_exclude, minimum_create_date_string,
+                    max_items, projection)
+                for page in paginator.paginate(**query_arguments):
+                    if not put_page(page.get('Items', [])):
+                        return
+            except Exception as e:
+                put_page(e)
+            finally:
+                put_page(None)
+
+        threads = [threading.Thread(target=query_status, args=(execution_status,), daemon=True) for execution_status in
+                   statuses]
+        for thread in threads:
+            thread.start()
+
+        # each query thread puts None on the queue when it has finished
+        try:
+            queries_running = len(threads)
+            while queries_running > 0:
+                page = pages.get()
+                if page is None:
+                    queries_running -= 1
+                elif isinstance(page, Exception):
+                    raise page
+                else:
+                    for item in page:
+                        yield self.deseralize_dynamodb_item(item)
+        finally:
+            stop.set()
 
     def json_encoder_default(self, obj):
         if isinstance(obj, Decimal):
@@ -425,7 +528,7 @@ class Utils:
         raise TypeError("Object of type '%s' is not JSON serializable" % type(obj).__name__)
 
     def sns_publish_message(self, sns_topic_arn, subject, message):
-        client = boto3.client('sns')
+        client = self.get_sns_client()
         response = client.publish(
             TargetArn=sns_topic_arn,
             Message=json.dumps(message),
@@ -433,3 +536,32 @@ class Utils:
              MessageStructure='string'
         )
         return(response)
+
+    # publishes (subject, message) pairs to a topic with PublishBatch. A request is sent once it holds
+    # SNS_MAX_BATCH_SIZE messages or the next message would take it over SNS_MAX_BATCH_BYTES. String messages are sent
+    # as they are so email and SMS subscribers receive plain text, other messages are sent as JSON. The Id of an entry
+    # is the index of its message in messages
+    def sns_publish_message_batch(self, sns_topic_arn, messages):
+        client = self.get_sns_client()
+        batches = [[]]
+        batch_bytes = 0
+        for entry_index, (subject, message) in enumerate(messages):
+            entry = {
+                'Id': str(entry_index),
+                'Message': message if isinstance(message, str) else json.dumps(message),
+                'Subject': subject[:100]
+            }
+            entry_bytes = len(entry['Message'].encode('utf-8')) + len(entry['Subject'].encode('utf-8'))
+            if len(batches[-1]) == SNS_MAX_BATCH_SIZE or (
+                    len(batches[-1]) > 0 and batch_bytes + entry_bytes > SNS_MAX_BATCH_BYTES):
+                batches.append([])
+                batch_bytes = 0
+            batches[-1].append(entry)
+            batch_bytes += entry_bytes
+
+        responses = []
+        for batch in batches:
+            if len(batch) == 0:
+                continue
+            responses.append(client.publish_batch(TopicArn=sns_topic_arn, PublishBatchRequestEntries=batch))
+        return responses
@@ -0,0 +1,37 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Content hash of the part of a workflow record that is sent to AMC.
+# The WorkflowTableTrigger stores the hash on the workflow record once AMC accepted the definition, a change to the record
+# that leaves the hash the same (metadata, default payload, ...) does not need to be sent to AMC again, and a record that
+# has a hash is known to exist in AMC so it is updated without trying to create it first.
+
+import hashlib
+import json
+
+# the workflow attributes AMC uses, every other attribute of the record is only used by WFM
+AMC_WORKFLOW_ATTRIBUTES = ['workflowId', 'sqlQuery', 'inputParameters', 'outputGranularity',
+                           'filteredMetricsDiscriminatorColumn', 'distinctUserCountColumn', 'filteredReasonColumn']
+
+CONTENT_HASH_ATTRIBUTE = 'amcContentHash'
+
+
+def get_workflow_content_hash(workflow):
+    definition = {attribute: workflow[attribute] for attribute in AMC_WORKFLOW_ATTRIBUTES if attribute in workflow}
+    return hashlib.sha256(json.dumps(definition, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+
+# returns the workflow record without the attributes WFM adds to keep track of the AMC definition
+def remove_sync_attributes(workflow):
+    return {attribute: value for attribute, value in workflow.items() if attribute != CONTENT_HASH_ATTRIBUTE}
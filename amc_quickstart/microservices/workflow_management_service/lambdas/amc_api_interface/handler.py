@@ -20,22 +20,23 @@
 
 import boto3
 import json
-from boto3 import Session
 import os
-import urllib3
-from botocore.auth import SigV4Auth
-from botocore.awsrequest import AWSRequest
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from dateutil.parser import parse
 from dateutil.tz import gettz
 from dateutil.relativedelta import relativedelta
 import calendar
 from aws_lambda_powertools import Logger
 from wfm import wfm_utils
+from amc_api_interface import wfm_amc_api_request, wfm_amc_api_metrics
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
 
+DEFAULT_SYNC_CUSTOMERS_PER_INVOCATION = 5
+DEFAULT_IDLE_CUSTOMER_SYNC_INTERVAL_MINUTES = 60
+ACTIVE_EXECUTION_STATUSES = ['RUNNING', 'PENDING']
+
 
 def sync_workflow_statuses(event):
     # create an event that will be sent to the email-s3-file lambda
@@ -51,6 +52,92 @@ def sync_workflow_statuses(event):
     logger.info('response payload: {}'.format(lambda_invoke_response))
     return lambda_invoke_response
 
+# returns True if the customer has executions that are still running or pending in AMC
+def has_active_executions(config):
+    dynamodb = wfmutils.get_dynamodb_client()
+    try:
+        for execution_status in ACTIVE_EXECUTION_STATUSES:
+            response = dynamodb.query(
+                TableName=config['AMC']['WFM']['syncWorkflowStatuses']['amcWorkflowExecutionTrackingDynamoDBTableName'],
+                IndexName='executionStatus-workflowId-index',
+                Select='COUNT',
+                Limit=1,
+                KeyConditionExpression='customerId = :customerId AND executionStatus = :executionStatus',
+                ExpressionAttributeValues={
+                    ':customerId': {'S': config['customerId']},
+                    ':executionStatus': {'S': execution_status}
+                }
+            )
+            if response['Count'] > 0:
+                return True
+    except Exception as e:
+        # sync the customer if its executions cannot be checked
+        logger.error('unable to check active executions for customerId {} error {}'.format(config['customerId'], e))
+        return True
+    return False
+
+
+def get_minutes_since_last_sync(config):
+    last_synced_time = config['AMC']['WFM'].get('syncWorkflowStatuses', {}).get('lastSyncedTime', '')
+    if last_synced_time == '':
+        return None
+    return (datetime.now() - wfmutils.parse_iso_datetime(last_synced_time)).total_seconds() / 60
+
+
+# Customers with running or pending executions are synced on every run, idle customers are only synced once their
+# idle sync interval has passed. The customers to sync are split into shards and each shard is sent to its own
+# SyncWorkflowStatuses invocation, busy customers are placed in the first shards
+def orchestrate_sync_workflow_statuses(configs, event):
+    customers_per_invocation = int(event.get('customersPerInvocation', os.environ.get(
+        'SYNC_CUSTOMERS_PER_INVOCATION', DEFAULT_SYNC_CUSTOMERS_PER_INVOCATION)))
+    sync_all = event.get('syncAll', False)
+
+    customer_ids = list(configs.keys())
+    with ThreadPoolExecutor(max_workers=max(1, min(10, len(customer_ids)))) as executor:
+        active_customers = dict(
+            zip(customer_ids, executor.map(lambda customer_id: has_active_executions(configs[customer_id]),
+                                           customer_ids)))
+
+    busy_customer_ids = []
+    idle_customers_to_sync = []
+    skipped_customer_ids = []
+    for customer_id in customer_ids:
+        config = configs[customer_id]
+        idle_sync_interval_minutes = float(config['AMC']['WFM'].get('syncWorkflowStatuses', {}).get(
+            'idleSyncIntervalMinutes', os.environ.get('IDLE_CUSTOMER_SYNC_INTERVAL_MINUTES',
+                                                      DEFAULT_IDLE_CUSTOMER_SYNC_INTERVAL_MINUTES)))
+        minutes_since_last_sync = get_minutes_since_last_sync(config)
+
+        if sync_all or active_customers[customer_id]:
+            busy_customer_ids.append(customer_id)
+        elif minutes_since_last_sync is None or minutes_since_last_sync >= idle_sync_interval_minutes:
+            idle_customers_to_sync.append((customer_id, minutes_since_last_sync))
+        else:
+            skipped_customer_ids.append(customer_id)
+
+    # customers that have never been synced go first, then idle customers that have waited the longest
+    idle_customers_to_sync.sort(key=lambda customer: float('-inf') if customer[1] is None else -customer[1])
+    customer_ids_to_sync = busy_customer_ids + [customer[0] for customer in idle_customers_to_sync]
+
+    shards = []
+    for index in range(0, len(customer_ids_to_sync), customers_per_invocation):
+        shard = customer_ids_to_sync[index:index + customers_per_invocation]
+        invoke_lambda_response = sync_workflow_statuses({'customerId': shard})
+        shards.append({'customerIds': shard,
+                       'statusCode': invoke_lambda_response['ResponseMetadata']['HTTPStatusCode']})
+
+    logger.info('sync requested for {} busy and {} idle customers in {} shards, {} idle customers skipped'.format(
+        len(busy_customer_ids), len(idle_customers_to_sync), len(shards), len(skipped_customer_ids)))
+
+    return {
+        'statusCode': max([200] + [shard['statusCode'] for shard in shards]),
+        'busyCustomerIds': busy_customer_ids,
+        'idleCustomerIds': [customer[0] for customer in idle_customers_to_sync],
+        'skippedCustomerIds': skipped_customer_ids,
+        'shards': shards
+    }
+
+
 def getNumberOfRunningExecutions(config):
     # Set up a DynamoDB Connection
     dynamodb = boto3.client('dynamodb')
@@ -145,13 +232,6 @@ def getExecutionsByStatus(config, executionStatusFilterValue="RUNNING"):
     return (workflowExecutions)
 
 
-def getSignedHeaders(config, request_method, request_endpoint_url, request_body):
-    # Generate signed http headers for Sigv4
-    AWS_REGION = config['AMC']['amcInstanceRegion']
-    request = AWSRequest(method=request_method.upper(), url=request_endpoint_url, data=request_body)
-    SigV4Auth(Session().get_credentials(), "execute-api", AWS_REGION).add_auth(request)
-    return dict(request.headers.items())
-
 def executeWorkflow(config, event):
     payload = event['payload']
     executedWorkflow = False
@@ -159,22 +239,13 @@ def executeWorkflow(config, event):
     message = ''
 
     # Process the parameters to enable now() and today() functions
-    if "parameterValues" in payload:
-        for parameter in payload['parameterValues']:
-            payload['parameterValues'][parameter] = wfmutils.process_parameter_functions(payload['parameterValues'][parameter])
-            logger.info("updated parameter {} to {}".format(parameter, payload['parameterValues'][parameter]))
-
-    payload['timeWindowStart'] = wfmutils.process_parameter_functions(payload['timeWindowStart'])
-    logger.info("updated parameter timeWindowStart to {}".format(payload['timeWindowStart']))
-    payload['timeWindowEnd'] = wfmutils.process_parameter_functions(payload['timeWindowEnd'])
-    logger.info("updated parameter timeWindowEnd to {}".format(payload['timeWindowEnd']))
+    wfmutils.process_payload_parameters(payload)
+    logger.info("updated parameters {}".format(payload))
 
     url = "{}/workflowExecutions".format(config['AMC']['amcApiEndpoint'])
     request_method = 'POST'
     request_body = json.dumps(payload)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -207,9 +278,7 @@ def getWorkflows(config):
     request_body = ''
     receivedWorkFlows = False
     workflowIdList = []
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
 
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
     if AMC_API_RESPONSE.status == 200:
@@ -246,9 +315,7 @@ def getExecutionStatusByWorkflowId(config, workflowId):
 
     url = "{}/workflowExecutions/?workflowId={}".format(config['AMC']['amcApiEndpoint'], workflowId)
 
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -280,9 +347,7 @@ def getExecutionStatusByWorkFlowExecutionId(config, workflowExecutionId):
     request_method = 'GET'
     request_body = ''
     url = "{}/workflowExecutions/{}".format(config['AMC']['amcApiEndpoint'], workflowExecutionId)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -319,9 +384,7 @@ def createWorkflow(config, payload):
     message = ''
     request_method = 'POST'
     request_body = json.dumps(payload)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -360,9 +423,7 @@ def updateWorkflow(config, payload):
     url = "{}/workflows/{}".format(config['AMC']['amcApiEndpoint'], payload['workflowId'])
     request_method = 'PUT'
     request_body = json.dumps(payload)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -393,9 +454,7 @@ def deleteWorkflow(config, payload):
     url = "{}/workflows/{}".format(config['AMC']['amcApiEndpoint'], payload['workflowId'])
     request_method = 'DELETE'
     request_body = json.dumps(payload)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     logger.info('Workflow delete response {}'.format(AMC_API_RESPONSE))
@@ -430,9 +489,7 @@ def delete_schedules(config, payload):
         url = "{}/schedules/{}".format(config['AMC']['amcApiEndpoint'], schedule_id)
         request_method = 'DELETE'
         request_body = json.dumps(payload)
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=getSignedHeaders(config, request_method, url,
-                                                                                  request_body), body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         logger.info('schedule delete response {}'.format(AMC_API_RESPONSE))
@@ -465,9 +522,7 @@ def get_schedules(config):
     request_method = 'GET'
     request_body = ''
     logger.info('get workflow request URL: {}'.format(url))
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     logger.info('response data: {}'.format(AMC_API_RESPONSE.data))
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
@@ -501,9 +556,7 @@ def get_workflow(config, payload):
     request_method = 'GET'
     request_body = ''
     logger.info('get workflow request URL: {}'.format(url))
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     logger.info('response data: {}'.format(AMC_API_RESPONSE.data))
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
@@ -537,9 +590,7 @@ def deleteWorkflowExecution(config, payload):
 
     request_method = 'DELETE'
     request_body = json.dumps(payload)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request(config, request_method, url, request_body)
     AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     logger.info(
@@ -585,7 +636,7 @@ def update_tracking_table_with_statuses(config, statuses):
             # remove the status item as it will cause a DynamoDB error as it is a reserved word
             del record['status']
             record['customerId'] = config['customerId']
-            record['expireTimestamp'] = round((parse(record['lastUpdatedTime']) + timedelta(days=int(
+            record['expireTimestamp'] = round((wfmutils.parse_iso_datetime(record['lastUpdatedTime']) + timedelta(days=int(
                 config['AMC']['WFM']['syncWorkflowStatuses']['WorkflowStatusRecordRetentionDays']))).timestamp())
 
             logger.info('record to update workflowExecutionId:{} workflowId:{}'.format(record['workflowExecutionId'],
@@ -595,6 +646,7 @@ def update_tracking_table_with_statuses(config, statuses):
             )
 
 
+@wfm_amc_api_metrics.log_amc_api_metrics
 def lambda_handler(event, context):
     configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'])
 
@@ -644,13 +696,7 @@ def lambda_handler(event, context):
         result = get_workflow(configs[event['customerId']], event['payload'])
 
     elif (event['method'] == 'syncExecutionStatuses'):
-        responses = {}
-        for configkey in configs:
-            logger.info('getting status for customerId:{}'.format(configkey))
-
-            invokeLambdaResponse = sync_workflow_statuses({'customerId': configkey})
-            responses[configkey] = invokeLambdaResponse['ResponseMetadata']['HTTPStatusCode']
-        return (responses)
+        return orchestrate_sync_workflow_statuses(configs, event)
 
     elif (event['method'] == 'getExecutionStatus'):
         if 'workflowId' in event:
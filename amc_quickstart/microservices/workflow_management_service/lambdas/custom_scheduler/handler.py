@@ -24,8 +24,16 @@ import datetime
 import calendar
 from datetime import datetime, timedelta, date, timedelta
 import time
+from concurrent.futures import ThreadPoolExecutor
+from wfm import wfm_utils, wfm_batch_writer, wfm_execution_queue, wfm_parameter_functions, wfm_schedule_index, \
+    wfm_config_cache
 
 logger = Logger(service="WorkflowManagerService", level="INFO")
+wfmutils = wfm_utils.Utils(logger)
+execution_queue_producer = wfm_execution_queue.ExecutionQueueProducer(logger)
+customer_config_cache = wfm_config_cache.get_customer_config_cache(wfmutils)
+
+DEFAULT_DISPATCH_WORKERS = 8
 
 dynamo = boto3.resource('dynamodb')
 
@@ -35,7 +43,7 @@ logger.info('Workflow Schedule table Name: {}'.format(workflow_schedule_table))
 
 
 def deseralize_dynamodb_item(item):
-    return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+    return wfmutils.deseralize_dynamodb_item(item)
 
 
 def default(obj):
@@ -63,20 +71,14 @@ def dynamodb_get_wf_schedule_records(dynamodb_table_name, frequency=None):
         response_iterator = paginator.paginate(
             TableName=dynamodb_table_name,
             IndexName='custom-schdl-index',
-            Select='ALL_ATTRIBUTES',
-            Limit=1,
-            ConsistentRead=False,
-            ReturnConsumedCapacity='TOTAL',
-            KeyConditions={
-                'ScheduleExpression': {
-                    'AttributeValueList': [
-                        {
-                            'S': frequency
-                        },
-                    ],
-                    'ComparisonOperator': 'EQ'
-                }
-            }, PaginationConfig={'PageSize': 100})
+            KeyConditionExpression='ScheduleExpression = :scheduleExpression AND #state = :state',
+            ExpressionAttributeNames={'#state': 'State'},
+            ExpressionAttributeValues={
+                ':scheduleExpression': {'S': frequency},
+                ':state': {'S': 'ENABLED'}
+            },
+            ConsistentRead=False
+        )
     # Iterate over each page from the iterator
     for page in response_iterator:
         # deserialize each "item" (or record) into a dictionary
@@ -84,17 +86,71 @@ def dynamodb_get_wf_schedule_records(dynamodb_table_name, frequency=None):
             for item in page['Items']:
                 wf_schedule = deseralize_dynamodb_item(item)
                 # Run only "ENABLED" workflows
-                if (wf_schedule['State'] == 'ENABLED'):
+                if (wf_schedule.get('State', 'ENABLED') == 'ENABLED'):
                     workflow_schedules.append(wf_schedule)
-                    logger.info(wf_schedule)
+    logger.info('{} workflow schedules found'.format(len(workflow_schedules)))
     return workflow_schedules
 
 
-def lambda_handler(event, context):
+# sends the payloads of a customer, an error is returned as a response in which every payload failed to send
+def send_customer_payloads(customer_config, payloads):
+    try:
+        return execution_queue_producer.send_payloads(customer_config, payloads)
+    except Exception as e:
+        logger.error('unable to send {} workflow schedules for customerId {} error {}'.format(
+            len(payloads), customer_config['customerId'], e))
+        return {
+            "customerId": customer_config['customerId'],
+            "messages_failed_to_send": len(payloads),
+            "messages_sent_successfully": 0,
+            "statusCode": 500,
+            "responses": [{"HTTPStatusCode": 500, "ErrorCode": type(e).__name__, "MessageId": "",
+                           "PayloadIndex": index} for index in range(len(payloads))]
+        }
+
+
+# Sends the payloads of the schedules to their customer's execution queue, customers are sent concurrently.
+# Returns the dispatch responses and the schedules whose payload could not be sent
+def dispatch_workflow_schedules(workflow_schedules):
+    payloads_by_customer = {}
+    schedules_by_customer = {}
+    now = wfm_parameter_functions.get_reference_time()
+    for item in workflow_schedules:
+        payload = wfmutils.process_payload_parameters(item['Input']['payload'], now)
+        payloads_by_customer.setdefault(item['customerId'], []).append(payload)
+        schedules_by_customer.setdefault(item['customerId'], []).append(item)
+
+    customer_configs = customer_config_cache.get_many(list(payloads_by_customer.keys()))
+
+    responses = []
+    for customer_id in payloads_by_customer:
+        if customer_id not in customer_configs:
+            responses.append({
+                "customerId": customer_id,
+                "messages_failed_to_send": len(payloads_by_customer[customer_id]),
+                "messages_sent_successfully": 0,
+                "statusCode": 404
+            })
+
+    customer_ids = [customer_id for customer_id in payloads_by_customer if customer_id in customer_configs]
+    if len(customer_ids) > 0:
+        max_workers = int(os.environ.get('DISPATCH_WORKERS', DEFAULT_DISPATCH_WORKERS))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(customer_ids)))) as executor:
+            responses += executor.map(lambda customer_id: send_customer_payloads(
+                customer_configs[customer_id], payloads_by_customer[customer_id]), customer_ids)
+
+    failed_schedules = []
+    for response in responses:
+        # the individual message responses are not needed in the summary
+        for message_response in response.pop('responses', []):
+            if message_response['HTTPStatusCode'] != 200:
+                failed_schedules.append(schedules_by_customer[response['customerId']][message_response['PayloadIndex']])
+    return responses, failed_schedules
+
+
+def get_custom_schedule_frequency(query, utcdt):
     frequency = ''
-    utcdt = datetime.utcnow()
     hour = str(int(utcdt.hour))
-    query = event.get('query')
     if 'custom(H' in query:
         frequency = query
     elif 'custom(D' in query:
@@ -105,40 +161,146 @@ def lambda_handler(event, context):
     elif 'custom(M' in query:
         day_month = str(int(utcdt.day))
         frequency = 'custom(M {D} {H})'.format(D=day_month, H=hour)
-    print('Frequency is {}'.format(frequency))
-    
-    logger.info(frequency)
-        
+    return frequency
+
+
+def is_legacy_eventbridge_schedules():
+    # when enabled cron schedules are run by their own EventBridge rule created by the WorkflowScheduleTrigger
+    return os.environ.get('LEGACY_EVENTBRIDGE_SCHEDULES', 'false').lower() == 'true'
+
+
+# returns the tick time from the scheduled event, rounded down to the minute
+def get_tick_time(event):
+    if 'time' in event:
+        return datetime.strptime(event['time'], '%Y-%m-%dT%H:%M:%SZ').replace(second=0)
+    return datetime.utcnow().replace(second=0, microsecond=0)
+
+
+def dynamodb_get_due_wf_schedule_records(dynamodb_table_name, shard, tick_time):
+    workflow_schedules = []
+    paginator = wfmutils.get_dynamodb_client().get_paginator('query')
+    response_iterator = paginator.paginate(
+        TableName=dynamodb_table_name,
+        IndexName=wfm_schedule_index.NEXT_FIRE_TIME_INDEX_NAME,
+        KeyConditionExpression='#shard = :shard AND #nextFireTime <= :tickTime',
+        ExpressionAttributeNames={
+            '#shard': wfm_schedule_index.SCHEDULE_SHARD_ATTRIBUTE,
+            '#nextFireTime': wfm_schedule_index.NEXT_FIRE_TIME_ATTRIBUTE
+        },
+        ExpressionAttributeValues={
+            ':shard': {'S': shard},
+            ':tickTime': {'S': tick_time.strftime(wfm_schedule_index.FIRE_TIME_FORMAT)}
+        }
+    )
+    for page in response_iterator:
+        for item in page.get('Items', []):
+            workflow_schedules.append(deseralize_dynamodb_item(item))
+    return workflow_schedules
+
+
+# advances the nextFireTime of a due schedule, an error only skips this schedule so the schedules already advanced by
+# the other threads are still run. The schedule is not advanced and is returned by the next tick again
+def advance_workflow_schedule(wf_schedule, tick_time):
+    try:
+        return wfm_schedule_index.advance_next_fire_time(wfm_batch_writer.get_dynamodb_resource_client(),
+                                                         workflow_schedule_table_name, wf_schedule, tick_time, logger)
+    except Exception as e:
+        logger.error('unable to advance schedule {} for customerId {} error {}'.format(
+            wf_schedule['Name'], wf_schedule['customerId'], e))
+        return False
+
+
+# puts back the nextFireTime of the schedules that could not be sent so the next tick runs them again
+def restore_workflow_schedules(workflow_schedules, tick_time):
+    for wf_schedule in workflow_schedules:
+        logger.error('schedule {} for customerId {} was not sent, restoring its nextFireTime {}'.format(
+            wf_schedule['Name'], wf_schedule['customerId'], wf_schedule[wfm_schedule_index.NEXT_FIRE_TIME_ATTRIBUTE]))
+        try:
+            wfm_schedule_index.restore_next_fire_time(wfm_batch_writer.get_dynamodb_resource_client(),
+                                                      workflow_schedule_table_name, wf_schedule, tick_time, logger)
+        except Exception as e:
+            logger.error('unable to restore the nextFireTime of schedule {} for customerId {} error {}'.format(
+                wf_schedule['Name'], wf_schedule['customerId'], e))
+
+
+# returns the schedules with a nextFireTime at or before the tick time, each shard of the index is read in parallel.
+# A schedule is only returned if this invocation advanced its nextFireTime, schedules that were missed while the
+# scheduler was not running are run once and then advanced past the tick time
+def get_due_workflow_schedules(tick_time):
+    shards = [str(shard) for shard in range(wfm_schedule_index.SCHEDULE_SHARD_COUNT)]
+    with ThreadPoolExecutor(max_workers=len(shards)) as executor:
+        candidate_schedules = [wf_schedule for shard_schedules in executor.map(
+            lambda shard: dynamodb_get_due_wf_schedule_records(workflow_schedule_table_name, shard, tick_time), shards)
+                               for wf_schedule in shard_schedules]
+
+    workflow_schedules = []
+    if len(candidate_schedules) > 0:
+        max_workers = int(os.environ.get('DISPATCH_WORKERS', DEFAULT_DISPATCH_WORKERS))
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(candidate_schedules)))) as executor:
+            advanced = list(executor.map(lambda wf_schedule: advance_workflow_schedule(wf_schedule, tick_time),
+                                         candidate_schedules))
+        workflow_schedules = [wf_schedule for wf_schedule, is_advanced in zip(candidate_schedules, advanced)
+                              if is_advanced]
+
+    logger.info('{} workflow schedules due at {}'.format(len(workflow_schedules), tick_time))
+    return workflow_schedules
+
+
+def rebuild_schedule_index():
+    return wfm_schedule_index.rebuild_schedule_index(
+        wfm_batch_writer.get_dynamodb_resource_client(), workflow_schedule_table_name, datetime.utcnow(), logger,
+        is_legacy_eventbridge_schedules())
+
+
+# CloudFormation custom resource event sent on deploy, adds the schedules created before the next fire time index
+# existed to the index so they are run by the tick
+def on_event(event):
+    logger.info('custom resource event: {}'.format(event))
+    if event['RequestType'] in ['Create', 'Update']:
+        schedules_updated = rebuild_schedule_index()
+    else:
+        schedules_updated = 0
+    return {
+        'PhysicalResourceId': event.get('PhysicalResourceId', '{}-schedule-index'.format(workflow_schedule_table_name)),
+        'Data': {'SchedulesUpdated': schedules_updated}
+    }
+
+
+def lambda_handler(event, context):
+    if 'RequestType' in event:
+        return on_event(event)
+
+    if event.get('rebuildScheduleIndex', False):
+        return {
+            'statusCode': 200,
+            'schedulesUpdated': rebuild_schedule_index()
+        }
+
     workflow_schedules = []
+    tick = event.get('tick', False)
     try:
-        workflow_schedules = dynamodb_get_wf_schedule_records(workflow_schedule_table_name, frequency)
+        if tick:
+            tick_time = get_tick_time(event)
+            workflow_schedules = get_due_workflow_schedules(tick_time)
+        else:
+            frequency = get_custom_schedule_frequency(event.get('query'), datetime.utcnow())
+            logger.info('Frequency is {}'.format(frequency))
+            workflow_schedules = dynamodb_get_wf_schedule_records(workflow_schedule_table_name, frequency)
 
     except ClientError as e:
-        logger.info(e.response['Error']['Code'])
-        logger.info(e.response['Error']['Message'])
-    logger.info("workflow_schedules")
-    logger.info(workflow_schedules)
-    
-    client = boto3.client('lambda')
-    
+        logger.error(e.response['Error']['Code'])
+        logger.error(e.response['Error']['Message'])
+
+    dispatch_responses = []
     if len(workflow_schedules) > 0:
-        for item in workflow_schedules:
-            # Each item is dict
-            payload = {
-                'customerId': item['customerId'],
-                'payload': item['Input']['payload']
-            }
-            print(payload)
-            
-            response = client.invoke(
-                FunctionName=os.environ['EXECUTION_QUEUE_PRODUCER_LAMBA_ARN'].split(':')[-1],
-                InvocationType='Event',
-                Payload=json.dumps(payload)
-                )
-            print(response)
+        dispatch_responses, failed_schedules = dispatch_workflow_schedules(workflow_schedules)
+        if tick:
+            restore_workflow_schedules(failed_schedules, tick_time)
+    logger.info(dispatch_responses)
 
     return {
-        'statusCode': 200,
+        'statusCode': max([200] + [response['statusCode'] for response in dispatch_responses]),
         'payload': json.dumps(workflow_schedules, default=default),
+        'dispatchResponses': dispatch_responses,
         'messageId': "Success"
-    }
\ No newline at end of file
+    }
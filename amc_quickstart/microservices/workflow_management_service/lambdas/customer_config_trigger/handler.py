@@ -17,12 +17,20 @@ import json
 import os
 import re
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_config_cache, wfm_execution_queue
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
 
 
+DEFAULT_EVENT_SOURCE_BATCH_SIZE = 10
+# every receive of a message counts towards the maximum receive count, including the receives of executions that AMC
+# throttled or that had to wait for an execution slot. The consumers keep those messages invisible with a growing
+# backoff, the default allows them to wait for several hours before they are moved to the dead letter queue
+DEFAULT_EXECUTION_QUEUE_MAX_RECEIVE_COUNT = 20
+# the lowest maximum concurrency an SQS event source mapping accepts
+DEFAULT_EVENT_SOURCE_MAXIMUM_CONCURRENCY = 2
+
 sqs = boto3.client('sqs')
 ssm = boto3.client('ssm')
 ddb = boto3.client('dynamodb')
@@ -182,7 +190,8 @@ def check_sqs_queues(customer_id, item):
     # create a redrive policy object
     redrive_policy = {
         "deadLetterTargetArn": sqs_dead_letter_queue_arn,
-        "maxReceiveCount": 5
+        "maxReceiveCount": int(os.environ.get('EXECUTION_QUEUE_MAX_RECEIVE_COUNT',
+                                              DEFAULT_EXECUTION_QUEUE_MAX_RECEIVE_COUNT))
     }
 
     # if we were able to get the queue url then the execution SQS queue does exist, check it's attributes
@@ -191,8 +200,10 @@ def check_sqs_queues(customer_id, item):
         if sqs_queue_attributes != '':
             # get the ARN of the queue so we can update the queue if necessary
             sqs_queue_arn = sqs_queue_attributes['Attributes']['QueueArn']
-            # check to see if the redrive policy exists and has the dead letter queue arn specified
-            if 'RedrivePolicy' not in sqs_queue_attributes['Attributes'] or json.loads(sqs_queue_attributes['Attributes']['RedrivePolicy'])['deadLetterTargetArn'] != sqs_dead_letter_queue_arn:
+            # check to see if the redrive policy exists and has the dead letter queue arn and maximum receive count specified
+            current_redrive_policy = json.loads(sqs_queue_attributes['Attributes'].get('RedrivePolicy', '{}'))
+            if current_redrive_policy.get('deadLetterTargetArn') != sqs_dead_letter_queue_arn or int(
+                    current_redrive_policy.get('maxReceiveCount', 0)) != redrive_policy['maxReceiveCount']:
                 set_sqs_queue_attributes_response = set_sqs_queue_attributes(sqs_queue_url, {"RedrivePolicy": json.dumps(redrive_policy)})
                 responses.append(set_sqs_queue_attributes_response)
 
@@ -201,9 +212,58 @@ def check_sqs_queues(customer_id, item):
         create_sqs_dead_letter_queue_response = create_sqs_queue(queue_name, tag, json.dumps(redrive_policy))
         responses.append(create_sqs_dead_letter_queue_response)
 
+    responses.append(check_event_source_mapping(item, queue_name))
+
     return responses
 
 
+# creates, updates or disables the SQS event source mapping that submits the executions of the customer's queue with
+# the WorkflowExecutionQueueEventConsumer, depending on AMC.WFM.executionQueueConsumptionMode
+def check_event_source_mapping(item, queue_name):
+    if 'WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME' not in os.environ:
+        return ''
+    function_name = os.environ['WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME']
+    event_source_enabled = wfm_execution_queue.get_consumption_mode(
+        item) == wfm_execution_queue.EVENT_SOURCE_CONSUMPTION_MODE
+
+    try:
+        queue_url = get_sqs_queue_url(queue_name)
+        queue_arn = get_sqs_queue_attributes(queue_url)['Attributes']['QueueArn']
+        client = boto3.client('lambda')
+        event_source_mappings = client.list_event_source_mappings(EventSourceArn=queue_arn,
+                                                                  FunctionName=function_name)['EventSourceMappings']
+        if not event_source_enabled and len(event_source_mappings) == 0:
+            return ''
+
+        mapping_settings = {
+            'Enabled': event_source_enabled,
+            'BatchSize': int(item['AMC']['WFM'].get('executionQueueBatchSize', DEFAULT_EVENT_SOURCE_BATCH_SIZE)),
+            'FunctionResponseTypes': ['ReportBatchItemFailures'],
+            # caps the concurrent submissions of the customer, every message group is processed in order
+            'ScalingConfig': {'MaximumConcurrency': max(DEFAULT_EVENT_SOURCE_MAXIMUM_CONCURRENCY, int(
+                item['AMC']['WFM'].get('executionQueueMaximumConcurrency', DEFAULT_EVENT_SOURCE_MAXIMUM_CONCURRENCY)))}
+        }
+
+        if event_source_enabled:
+            # the queue visibility timeout can not be shorter than the timeout of the function it triggers
+            set_sqs_queue_attributes(queue_url, {
+                'VisibilityTimeout': os.environ.get('EVENT_SOURCE_QUEUE_VISIBILITY_TIMEOUT', '120')})
+
+        if len(event_source_mappings) == 0:
+            response = client.create_event_source_mapping(EventSourceArn=queue_arn, FunctionName=function_name,
+                                                          **mapping_settings)
+        else:
+            response = client.update_event_source_mapping(UUID=event_source_mappings[0]['UUID'],
+                                                          FunctionName=function_name, **mapping_settings)
+        logger.info('event source mapping for queue {} enabled {} response {}'.format(
+            queue_name, event_source_enabled, response))
+        return response
+
+    except Exception as e:
+        logger.error('unable to update the event source mapping for queue {} error {}'.format(queue_name, e))
+        return ''
+
+
 def create_sqs_queue(queue_name, tag, redrive_policy=''):
     logger.info('creating queue: {}'.format(queue_name))
 
@@ -231,10 +291,38 @@ def create_sqs_queue(queue_name, tag, redrive_policy=''):
     return response
 
 
+# publishes a new customer config cache version so the lambdas reading customer configs drop their cached records
+def publish_customer_config_cache_version(records):
+    changed_customer_ids = []
+    version = None
+    for record in records:
+        if 'dynamodb' not in record:
+            continue
+        old_config = wfmutils.deseralize_dynamodb_item(record['dynamodb']['OldImage']) if 'OldImage' in record[
+            'dynamodb'] else None
+        new_config = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage']) if 'NewImage' in record[
+            'dynamodb'] else None
+        if wfm_config_cache.is_cache_relevant_change(old_config, new_config):
+            changed_customer_ids.append((new_config or old_config)['customerId'])
+            version = record['dynamodb'].get('SequenceNumber', record.get('eventID'))
+
+    if len(changed_customer_ids) == 0:
+        logger.info('no cached customer config attributes changed')
+        return
+
+    wfm_config_cache.get_customer_config_cache(wfmutils).invalidate(changed_customer_ids)
+    if 'CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER' in os.environ:
+        wfm_config_cache.publish_cache_version(os.environ['CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER'], version)
+        logger.info('customer configs changed for customerIds {}, published cache version {}'.format(
+            changed_customer_ids, version))
+
+
 def lambda_handler(event, context):
 
 
     logger.info('event received {}'.format(event))
+    publish_customer_config_cache_version(event['Records'])
+
     response = {}
     for record in event['Records']:
         logger.info('dynamoDB Record: {}'.format(record))
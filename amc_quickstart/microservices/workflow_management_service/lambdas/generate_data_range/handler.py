@@ -13,53 +13,114 @@
 # limitations under the License.
 
 
-import json
+import os
 
 from dateutil.parser import parse
-from datetime import timedelta
 from aws_lambda_powertools import Logger
 
 logger = Logger(service="WorkflowLibrarySerice", level="INFO")
 
+from wfm import wfm_utils, wfm_date_spans, wfm_execution_queue
 
-def get_date_spans_sliding(days, start_date, end_date):
-    date_spans = []
+wfmutils = wfm_utils.Utils(logger)
 
-    current_span_start_date = start_date
-    current_span_end_date = current_span_start_date + timedelta(days=days)
+# spans beyond this number are not returned inline as the response would exceed the lambda response payload limit,
+# specify a customerId and payload in the event to stream them into the execution queue instead
+DEFAULT_MAX_INLINE_SPANS = 20000
+DEFAULT_QUEUE_CHUNK_SIZE = 1000
 
-    while current_span_end_date <= end_date:
-        current_span = {}
-        current_span["timeWindowStart"] = current_span_start_date.strftime('%Y-%m-%dT%H:%M:%S')
-        current_span["timeWindowEnd"] = current_span_end_date.strftime('%Y-%m-%dT%H:%M:%S')
-        current_span_start_date = current_span_start_date + timedelta(days=1)
-        current_span_end_date = current_span_start_date + timedelta(days=days)
-        date_spans.append(current_span)
 
-    return (date_spans)
+def get_window_settings(event):
+    # days is the original parameter name and is kept for existing callers
+    window_size = event.get('windowSize', event.get('days'))
+    granularity = event.get('granularity', wfm_date_spans.GRANULARITY_DAY).lower()
+    window_type = event.get('windowType', wfm_date_spans.WINDOW_TYPE_TUMBLING).lower()
 
+    # tumbling windows always advance by the window size, sliding windows advance by one unit unless a step is given
+    if window_type == wfm_date_spans.WINDOW_TYPE_TUMBLING:
+        step = window_size
+    else:
+        step = event.get('step', 1)
 
-def get_date_spans_tumbling(days, start_date, end_date, allow_overlap):
-    date_spans = []
+    return window_size, step, granularity, window_type
 
-    current_span_start_date = start_date
-    current_span_end_date = current_span_start_date + timedelta(days=days)
 
-    while current_span_end_date <= end_date:
-        current_span = {}
-        current_span["timeWindowStart"] = current_span_start_date.strftime('%Y-%m-%dT%H:%M:%S')
-        current_span["timeWindowEnd"] = current_span_end_date.strftime('%Y-%m-%dT%H:%M:%S')
-        current_span_start_date = current_span_start_date + timedelta(days=days)
-        current_span_end_date = current_span_start_date + timedelta(days=days)
-        date_spans.append(current_span)
+def validate_window_settings(window_size, step, granularity, window_type):
+    if granularity not in wfm_date_spans.GRANULARITIES:
+        return 'granularity value {} was invalid. The granularity must be one of {}'.format(
+            granularity, wfm_date_spans.GRANULARITIES)
 
-    return (date_spans)
+    if window_type not in [wfm_date_spans.WINDOW_TYPE_SLIDING, wfm_date_spans.WINDOW_TYPE_TUMBLING]:
+        return 'windowType value {} was invalid. The windowType must be sliding or tumbling'.format(window_type)
 
+    if not isinstance(window_size, int) or not window_size > 0:
+        return 'days value {} was invalid. The number of days must be an integer greater than 0'.format(window_size)
 
-def lambda_handler(event, context):
-    spans = []
+    if not isinstance(step, int) or not step > 0:
+        return 'step value {} was invalid. The step must be an integer greater than 0'.format(step)
+
+
+def get_span_payloads(spans, event):
+    payload_template = event.get('payload', {})
+    attributes_to_copy = event.get('attributesToCopy', {})
+    for span in spans:
+        payload = dict(payload_template)
+        payload.update(span)
+        payload.update(attributes_to_copy)
+        yield payload
+
+
+# sends the spans to the execution queue of each customer in chunks so the full span list is never held in memory
+def queue_spans(event, spans):
+    customers_dynamodb_table_name = os.environ['CUSTOMERS_DYNAMODB_TABLE']
+    chunk_size = int(event.get('chunkSize', os.environ.get('DEFAULT_QUEUE_CHUNK_SIZE', DEFAULT_QUEUE_CHUNK_SIZE)))
+
+    if type(event['customerId']) == list:
+        customer_ids = event['customerId']
+        customer_configs = wfmutils.dynamodb_batch_get_customer_config_records(customers_dynamodb_table_name,
+                                                                               customer_ids)
+    else:
+        customer_ids = [event['customerId']]
+        customer_configs = wfmutils.dynamodb_get_customer_config_records(customers_dynamodb_table_name,
+                                                                         event['customerId'])
+
+    execution_queue_producer = wfm_execution_queue.ExecutionQueueProducer(logger)
+    results = {customer_id: {"customerId": customer_id, "messages_sent_successfully": 0, "messages_failed_to_send": 0}
+               for customer_id in customer_configs}
+    all_response_codes = [200]
+    spans_queued = 0
+
+    for chunk in wfm_date_spans.iter_date_span_chunks(get_span_payloads(spans, event), chunk_size):
+        spans_queued += len(chunk)
+        for customer_id in customer_configs:
+            send_payloads_response = execution_queue_producer.send_payloads(customer_configs[customer_id], chunk)
+            results[customer_id]['messages_sent_successfully'] += send_payloads_response['messages_sent_successfully']
+            results[customer_id]['messages_failed_to_send'] += send_payloads_response['messages_failed_to_send']
+            all_response_codes.append(send_payloads_response['statusCode'])
+        logger.info('{} spans queued'.format(spans_queued))
+
+    # the spans of customers missing from the config table are reported as not sent
+    for customer_id in dict.fromkeys(customer_ids):
+        if customer_id not in customer_configs:
+            logger.error('customerId {} was not found in the customer config table, {} spans not queued'.format(
+                customer_id, spans_queued))
+            all_response_codes.append(404)
+            results[customer_id] = {
+                "customerId": customer_id,
+                "messages_sent_successfully": 0,
+                "messages_failed_to_send": spans_queued,
+                "statusCode": 404
+            }
+
+    return {
+        'statusCode': max(all_response_codes),
+        'spansGenerated': spans_queued,
+        'body': list(results.values())
+    }
 
-    if 'days' not in event or 'startDate' not in event or 'endDate' not in event:
+
+def lambda_handler(event, context):
+    if ('days' not in event and 'windowSize' not in event) or 'startDate' not in event or 'endDate' not in event:
         message = 'The input event must contain days, startDate and endDate'
         logger.error(message)
         return ({'statusCode': 500, "message": message})
@@ -67,9 +128,9 @@ def lambda_handler(event, context):
     start_date = parse(event['startDate'])
     end_date = parse(event['endDate'])
 
-    if not event['days'] > 0 or not isinstance(event['days'], int):
-        message = 'days value {} was invalid. The number of days must be an integer greater than 0'.format(
-            event['days'])
+    window_size, step, granularity, window_type = get_window_settings(event)
+    message = validate_window_settings(window_size, step, granularity, window_type)
+    if message is not None:
         logger.error(message)
         return ({'statusCode': 500, "message": message})
 
@@ -78,43 +139,34 @@ def lambda_handler(event, context):
         logger.error(message)
         return ({'statusCode': 500, "message": message})
 
-    if not 'windowType' in event:
-        event['windowType'] = 'tumbling'
-
-    dates_difference = end_date - start_date
-    logger.info(
-        'calcluated {} days between start_date {} and end_date {}'.format(dates_difference.days,
-                                                                          event[
-                                                                              'startDate'],
-                                                                          event['endDate']))
-    if event['windowType'].lower() == 'tumbling':
-        if (dates_difference.days % event['days']) != 0:
-            message = 'day interval {} is not possible with tumbling window and origin date {} and end date {} there would be a partial iteration {} required.'.format(
-                event['days'], event['startDate'], event['endDate'],
-                (dates_difference.days / event['days']))
-            logger.error(message)
-            return ({'statusCode': 500, "message": message})
-
-    if 'windowType' not in event:
-        logger.info('windowType was not specified in the event, setting the default value of "tumbling"')
-        event['windowType'] = 'tumbling'
-
-    if event['windowType'].lower() == 'sliding':
-        spans = get_date_spans_sliding(event['days'], start_date, end_date)
-
-    if event['windowType'].lower() == 'tumbling':
-        if 'allow_tumbling_widow_overlap' not in event:
-            logger.info('allow_tumbling_widow_overlap was not specified in the event, setting the default of False')
-            event['allow_tumbling_widow_overlap'] = False
-        spans = get_date_spans_tumbling(event['days'], start_date, end_date,
-                                        event['allow_tumbling_widow_overlap'])
+    span_count, ends_on_end_date = wfm_date_spans.get_span_count(start_date, end_date, window_size, step, granularity)
+    logger.info('calculated {} {} {} spans of {} {}(s) with a step of {} between start_date {} and end_date {}'.format(
+        span_count, window_type, granularity, window_size, granularity, step, event['startDate'], event['endDate']))
+
+    if window_type == wfm_date_spans.WINDOW_TYPE_TUMBLING and not ends_on_end_date:
+        message = '{} interval {} is not possible with tumbling window and origin date {} and end date {} there would be a partial iteration required.'.format(
+            granularity, window_size, event['startDate'], event['endDate'])
+        logger.error(message)
+        return ({'statusCode': 500, "message": message})
+
+    spans = wfm_date_spans.iter_date_spans(start_date, end_date, window_size, step, granularity)
+
+    if 'customerId' in event and 'payload' in event:
+        return queue_spans(event, spans)
+
+    max_inline_spans = int(os.environ.get('MAX_INLINE_SPANS', DEFAULT_MAX_INLINE_SPANS))
+    if span_count > max_inline_spans:
+        message = '{} spans exceeds the maximum of {} that can be returned, specify a customerId and payload to send the spans to the execution queue'.format(
+            span_count, max_inline_spans)
+        logger.error(message)
+        return ({'statusCode': 500, "message": message})
 
     # copy the values from the event into each item in the spans array
+    spans = list(spans)
     for span in spans:
         if 'attributesToCopy' in event:
             for attribute in event['attributesToCopy']:
                 span[attribute] = event['attributesToCopy'][attribute]
-    logger.info(spans)
     logger.info('{} spans generated'.format(len(spans)))
 
-    return spans
\ No newline at end of file
+    return spans
@@ -13,16 +13,40 @@
 # limitations under the License.
 
 
+import copy
 import json
 import os
 import boto3
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_execution_queue
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
 
+sqs_client = boto3.client('sqs')
+execution_queue_producer = wfm_execution_queue.ExecutionQueueProducer(logger)
+
+SQS_MAX_BATCH_SIZE = 10
+REDRIVE_RECEIVERS = int(os.environ.get('REDRIVE_RECEIVERS', 4))
+# received messages stay invisible for the rest of the redrive so the same message is not received twice
+REDRIVE_VISIBILITY_TIMEOUT_SECONDS = 600
+DEFAULT_REDRIVE_MAX_MESSAGES = 1000
+DEFAULT_REDRIVE_LOOKBACK_HOURS = 300
+
+# executions in these statuses are candidates for resubmission
+RESUBMIT_EXECUTION_STATUSES = ['FAILED', 'REJECTED', 'DELETED']
+# a candidate is not resubmitted if the same request has succeeded or is still running
+COMPLETED_OR_ACTIVE_EXECUTION_STATUSES = ['SUCCEEDED', 'RUNNING', 'PENDING']
+
+ITEMS_TO_KEEP = ['customerId', 'workflowId', 'timeWindowStart', 'timeWindowEnd', 'timeWindowTimeZone',
+                 'timeWindowType', 'parameterValues']
+
+# attributes read from the executionStatus-workflowId-index, timeWindowTimeZone is not projected into the index
+EXECUTION_ATTRIBUTES_TO_GET = ['customerId', 'executionStatus', 'workflowId', 'timeWindowStart', 'timeWindowEnd',
+                               'timeWindowType', 'parameterValues']
+
 
 def remove_dictionary_items(dictionary, itemslist):
     for item in itemslist:
@@ -39,110 +63,200 @@ def filter_dictionary_items(dictionary, itemslist):
     return new_item
 
 
-def check_if_duplicate(potential_duplicate_item, list_of_items, list_of_properties):
-    for existing_item in list_of_items:
-        item_match_count = 0
-        items_in_both_records = 0
-        for item_to_check in list_of_properties:
-
-            if item_to_check in potential_duplicate_item and item_to_check in existing_item:
-                items_in_both_records = items_in_both_records + 1
-                if potential_duplicate_item[item_to_check] == existing_item[item_to_check]:
-                    item_match_count = item_match_count + 1
-        if item_match_count == items_in_both_records:
-            return (True)
-    return False
-
-
-def consume_dead_letter_queue(customer_config_record):
-    log_messages = []
-    workflow_execution_responses = []
-    workflow_execution_response_codes = [200]
-    executions_available = 0
-    executions_submitted_count = 0
-    executions_submitted = []
-    messages_deleted = 0
-    messages_received = []
-    dlq_queue_name = ''
-    # Get the queue
-    logger.info('attemtping to consume from customer dead letter queue')
-    if 'amcWorkflowExecutionDLQSQSQueueName' in config['AMC']['WFM']:
-        dlq_queue_name = customer_config_record['AMC']['WFM']['amcWorkflowExecutionDLQSQSQueueName']
-    elif 'amcWorkflowExecutionSQSQueueName' in config['AMC']['WFM']:
-        dlq_queue_name = '{}-DLQ.fifo'.format(
-            customer_config_record['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'].split('.fifo')[0])
-
-    queue = boto3.resource('sqs').get_queue_by_name(
-        QueueName=dlq_queue_name)
-    logger.info('customerId: {} executionsAvailable: {}'.format(customer_config_record['customerId'],
-                                                                executions_available_result['executionsAvailable']))
-
-    messagesToReceive = 3
-
-    messages_received = queue.receive_messages(MessageAttributeNames=['customerId', 'workflowId'],
-                                               MaxNumberOfMessages=messagesToReceive)
-
-    messages_received_count = len(messages_received)
-    logger.info('customerId: {} sqs queue: {} messages received: {}'.format(customer_config_record['customerId'],
-                                                                            dlq_queue_name,
-                                                                            messages_received_count))
-    for message in messages_received:
-        customerId = ''
-        workflowId = ''
-        runWorkflowResponse = {}
-        runWorkflowRequest = {}
-        if message.message_attributes is not None:
-            customerId = message.message_attributes.get('customerId').get('StringValue')
-            workflowId = message.message_attributes.get('workflowId').get('StringValue')
-            logger.info(
-                'Recevied Run request from Dead letter queue for customerId: {} workflowId: {} Body: {}'.format(
-                    customerId, workflowId,
-                    message.body))
-            messageBody = json.loads(message.body)
-
-            runWorkflowRequest = {
-                'workflowId': workflowId,
-                'customerConfig': customer_config_record,
-                'amcApiEndpoint': customer_config_record['AMC']['amcApiEndpoint'],
-                'payload': messageBody['payload']
-            }
-
-            runWorkflowResponse = executeWorkflow(customer_config_record, runWorkflowRequest.copy())
-            logger.info('runWorkflowResponse:{}'.format(runWorkflowResponse))
-
-            workflow_execution_responses.append(runWorkflowResponse.copy())
-            workflow_execution_response_codes.append(runWorkflowResponse['statusCode'])
-
-            if runWorkflowResponse['statusCode'] == 200:
-                workflowExecutionId = runWorkflowResponse['body']['workflowExecutionId']
-                executions_submitted.append(
-                    {"customerId": customerId, 'workflowId:': workflowId, "executionId": workflowExecutionId,
-                     "amcApiEndpoint": customer_config_record['AMC']['amcApiEndpoint'],
-                     "statusCode": runWorkflowResponse['statusCode']})
-
-                logmessage = " Successfully submitted workflow execution for workflowId: {} workflowExecutionId: {}".format(
-                    workflowId, workflowExecutionId)
-                updateExeuctionTrackingTable(customer_config_record, runWorkflowResponse['body'])
-
-                logger.info(logmessage)
-                log_messages.append(logmessage)
-                # Let the queue know that the message is processed
-                try:
-                    message.delete()
-                    logger.info('Deleted Message for customerid {} workflowid{}'.format(customerId, workflowId))
-                    messages_deleted += 1
-
-                except Exception as ex:
-                    message = "Error occured when trying to submit workflow execution url: {} error message: {}".format(
-                        customer_config_record['AMC']['amcApiEndpoint'], ex)
-                    log_messages.append(message)
-                    logger.error(message)
+def get_dead_letter_queue_name(customer_config_record):
+    if 'amcWorkflowExecutionDLQSQSQueueName' in customer_config_record['AMC']['WFM']:
+        return customer_config_record['AMC']['WFM']['amcWorkflowExecutionDLQSQSQueueName']
+    return '{}-DLQ.fifo'.format(
+        customer_config_record['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'].split('.fifo')[0])
+
+
+# the identity of the execution a queued payload creates, the date functions of the payload are resolved the way the
+# consumer resolves them when it submits the execution. timeWindowTimeZone is not projected into the
+# executionStatus-workflowId-index so it is left out to compare the identity with the tracking table executions
+def get_payload_identity(payload):
+    resolved_payload = wfmutils.process_payload_parameters(copy.deepcopy(payload))
+    return wfmutils.get_execution_identity(remove_dictionary_items(resolved_payload, ['timeWindowTimeZone']))
+
+
+# returns the identities of the executions that succeeded or are still running within the lookback window and the
+# number of executions that are running or pending
+def get_completed_or_active_executions(customer_config_record, minimum_create_date_string):
+    execution_identities = set()
+    executions_running_or_pending = 0
+    for execution in wfmutils.get_workflow_executions_multi(
+            customer_config_record, statuses=COMPLETED_OR_ACTIVE_EXECUTION_STATUSES,
+            minimum_create_date_string=minimum_create_date_string, projection=EXECUTION_ATTRIBUTES_TO_GET):
+        execution_identities.add(wfmutils.get_execution_identity(execution))
+        if execution['executionStatus'] != 'SUCCEEDED':
+            executions_running_or_pending += 1
+    return execution_identities, executions_running_or_pending
+
+
+# the number of messages that can be redriven without more executions than the customer can run being queued on top of
+# the running and pending ones. Messages already waiting in the execution queue are left to the admission control of
+# the consumer, which only submits them once execution slots are free
+def get_redrive_capacity(customer_config_record, executions_running_or_pending):
+    return max(0, int(customer_config_record['AMC']['maximumConcurrentWorkflowExecutions']) -
+               executions_running_or_pending)
+
+
+def receive_dead_letter_messages(dlq_url, max_messages):
+    response = sqs_client.receive_message(QueueUrl=dlq_url, MaxNumberOfMessages=max_messages,
+                                          VisibilityTimeout=REDRIVE_VISIBILITY_TIMEOUT_SECONDS)
+    return response.get('Messages', [])
+
+
+def delete_dead_letter_messages(dlq_url, messages):
+    for index in range(0, len(messages), SQS_MAX_BATCH_SIZE):
+        response = sqs_client.delete_message_batch(QueueUrl=dlq_url, Entries=[
+            {'Id': str(message_index), 'ReceiptHandle': message['ReceiptHandle']} for message_index, message in
+            enumerate(messages[index:index + SQS_MAX_BATCH_SIZE])])
+        for failure in response.get('Failed', []):
+            logger.error('unable to delete dead letter queue message error {} {}'.format(failure.get('Code'),
+                                                                                        failure.get('Message')))
+
+
+def release_dead_letter_messages(dlq_url, messages):
+    for index in range(0, len(messages), SQS_MAX_BATCH_SIZE):
+        sqs_client.change_message_visibility_batch(QueueUrl=dlq_url, Entries=[
+            {'Id': str(message_index), 'ReceiptHandle': message['ReceiptHandle'], 'VisibilityTimeout': 0} for
+            message_index, message in enumerate(messages[index:index + SQS_MAX_BATCH_SIZE])])
+
+
+# drains the dead letter queue of a customer into its execution queue. Every round receives up to REDRIVE_RECEIVERS
+# batches of 10 in parallel (a FIFO queue hands each call other message groups), drops the messages whose execution
+# already succeeded or is running and the duplicates of messages redriven in the same run, and sends the rest back to
+# the execution queue with one send_message_batch per received batch. A dry run reports the counts without changing
+# the queues and is not limited by the redrive capacity, as the messages of a FIFO message group can only be received
+# once the earlier ones are deleted it only sees the messages at the head of each group.
+def redrive_dead_letter_queue(customer_config_record, dry_run=False, max_messages=DEFAULT_REDRIVE_MAX_MESSAGES,
+                              lookback_hours=DEFAULT_REDRIVE_LOOKBACK_HOURS, ignore_execution_limits=False):
+    customer_id = customer_config_record['customerId']
+    queue_name = customer_config_record['AMC']['WFM']['amcWorkflowExecutionSQSQueueName']
+    dlq_name = get_dead_letter_queue_name(customer_config_record)
+    queue_url = wfm_execution_queue.get_queue_url(sqs_client, queue_name)
+    dlq_url = wfm_execution_queue.get_queue_url(sqs_client, dlq_name)
+
+    minimum_create_date_string = (datetime.today() - timedelta(hours=lookback_hours)).strftime('%Y-%m-%dT00:00:00')
+    completed_or_active_identities, executions_running_or_pending = get_completed_or_active_executions(
+        customer_config_record, minimum_create_date_string)
+
+    redrive_capacity = get_redrive_capacity(customer_config_record, executions_running_or_pending)
+    redrive_limit = max_messages
+    if not ignore_execution_limits and not dry_run:
+        redrive_limit = min(redrive_limit, redrive_capacity)
+
+    strategy, group_count = wfm_execution_queue.get_message_group_strategy(customer_config_record)
+    counts = {'received': 0, 'redriven': 0, 'alreadyCompletedOrActive': 0, 'duplicates': 0, 'invalid': 0,
+              'failedToSend': 0}
+    redriven_identities = set()
+    dry_run_messages = []
+
+    with ThreadPoolExecutor(max_workers=REDRIVE_RECEIVERS) as executor:
+        while counts['redriven'] < redrive_limit:
+            batch_sizes = []
+            remaining_messages = redrive_limit - counts['redriven']
+            while remaining_messages > 0 and len(batch_sizes) < REDRIVE_RECEIVERS:
+                batch_sizes.append(min(remaining_messages, SQS_MAX_BATCH_SIZE))
+                remaining_messages -= batch_sizes[-1]
+            batches = [batch for batch in executor.map(lambda batch_size: receive_dead_letter_messages(
+                dlq_url, batch_size), batch_sizes) if len(batch) > 0]
+            if len(batches) == 0:
+                break
+
+            messages_to_delete = []
+            entries_to_send = []
+            for batch in batches:
+                counts['received'] += len(batch)
+                if dry_run:
+                    dry_run_messages += batch
+                batch_entries = []
+                for message in batch:
+                    try:
+                        payload = json.loads(message['Body'])['payload']
+                        execution_identity = get_payload_identity(payload)
+                    except Exception as e:
+                        # left in the dead letter queue, it is received again after the visibility timeout
+                        logger.error('unable to read dead letter queue message {} error {}'.format(
+                            message['MessageId'], e))
+                        counts['invalid'] += 1
+                        continue
+
+                    if execution_identity in completed_or_active_identities:
+                        counts['alreadyCompletedOrActive'] += 1
+                        messages_to_delete.append(message)
+                    elif execution_identity in redriven_identities:
+                        counts['duplicates'] += 1
+                        messages_to_delete.append(message)
+                    else:
+                        redriven_identities.add(execution_identity)
+                        entry = execution_queue_producer.build_message(customer_id, payload, strategy, group_count)
+                        # SQS drops the copies redriven by another run within its 5 minute deduplication interval
+                        entry['MessageDeduplicationId'] = execution_identity
+                        batch_entries.append((message, entry))
+                if len(batch_entries) > 0:
+                    entries_to_send.append(batch_entries)
+
+            if dry_run:
+                counts['redriven'] += sum(len(batch_entries) for batch_entries in entries_to_send)
+                continue
+
+            send_results = executor.map(lambda batch_entries: execution_queue_producer.send_message_batch(
+                queue_url, [entry for message, entry in batch_entries]), entries_to_send)
+            for batch_entries, send_result in zip(entries_to_send, send_results):
+                sent_ids = {response['Id'] for response in send_result['Successful']}
+                for message, entry in batch_entries:
+                    if entry['Id'] in sent_ids:
+                        counts['redriven'] += 1
+                        messages_to_delete.append(message)
+                    else:
+                        counts['failedToSend'] += 1
+                for failure in send_result['Failed']:
+                    logger.error('unable to redrive message to {} error {} {}'.format(
+                        queue_name, failure.get('Code'), failure.get('Message')))
+            delete_dead_letter_messages(dlq_url, messages_to_delete)
+
+            if counts['failedToSend'] > 0:
+                break
+
+    if dry_run:
+        release_dead_letter_messages(dlq_url, dry_run_messages)
+
+    dlq_attributes = sqs_client.get_queue_attributes(QueueUrl=dlq_url, AttributeNames=[
+        'ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible'])['Attributes']
+    result = {
+        'customerId': customer_id,
+        'deadLetterQueueName': dlq_name,
+        'dryRun': dry_run,
+        'redriveLimit': redrive_limit,
+        'redriveCapacity': redrive_capacity,
+        'deadLetterQueueMessages': int(dlq_attributes['ApproximateNumberOfMessages']),
+        'deadLetterQueueMessagesNotVisible': int(dlq_attributes['ApproximateNumberOfMessagesNotVisible']),
+        'counts': counts
+    }
+    logger.info('dead letter queue redrive {}'.format(result))
+    return result
 
 
 def lambda_handler(event, context):
     executionTable = os.environ['CUSTOMERS_DYNAMODB_TABLE']
 
+    # {"method": "redriveDeadLetterQueue", "customerId": "...", "dryRun": true, "maxMessages": 1000,
+    #  "lookbackHours": 300, "ignoreExecutionLimits": false}
+    if event.get('method', '').lower() == 'redrivedeadletterqueue':
+        configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'],
+                                                                event['customerId'])
+        return [redrive_dead_letter_queue(
+            configs[customer_id], dry_run=bool(event.get('dryRun', False)),
+            max_messages=int(event.get('maxMessages', DEFAULT_REDRIVE_MAX_MESSAGES)),
+            lookback_hours=int(event.get('lookbackHours', DEFAULT_REDRIVE_LOOKBACK_HOURS)),
+            ignore_execution_limits=bool(event.get('ignoreExecutionLimits', False))) for customer_id in configs]
+
     configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'], event['customerId'])
+    failed_rejected_deleted_executions_count = 0
+    failed_rejected_deleted_executions_deduplicated_count = 0
+    executions_running_pending_succeeded_count = 0
+    executions_failed_rejected_deleted_not_yet_succeeded = []
     for configKey in configs:
         config = configs[configKey]
 
@@ -165,83 +279,56 @@ def lambda_handler(event, context):
         else:
             workflow_id = None
 
+        # maxItems limits the number of executions read for each status, by default the whole lookback window is read
         if 'maxItems' in event:
             max_items = int(event['maxItems'])
         else:
-            max_items = 1000
+            max_items = None
 
         if 'workflowIdToExclude' in event:
             workflow_id_to_exclude = event['workflowIdToExclude']
         else:
             workflow_id_to_exclude = None
 
-        deleted_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='DELETED',
-                                                                       workflow_id=workflow_id,
-                                                                       minimum_create_date_string=minimum_create_date_string,
-                                                                       max_items=max_items,
-                                                                       workflow_id_to_exclude=workflow_id_to_exclude)
-
-        rejected_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='REJECTED',
-                                                                        workflow_id=workflow_id,
-                                                                        minimum_create_date_string=minimum_create_date_string,
-                                                                        max_items=max_items,
-                                                                        workflow_id_to_exclude=workflow_id_to_exclude)
-
-        failed_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='FAILED',
-                                                                      workflow_id=workflow_id,
-                                                                      minimum_create_date_string=minimum_create_date_string,
-                                                                      max_items=max_items,
-                                                                      workflow_id_to_exclude=workflow_id_to_exclude)
-
-        failed_rejected_deleted_executions = failed_executions + rejected_executions + deleted_executions
-        logger.info('failed_rejected_deleted_executions count {}'.format(len(failed_rejected_deleted_executions)))
-        failed_rejected_deleted_executions_deduplicated = []
-        
-        items_to_keep = ['customerId', 'workflowId', 'timeWindowStart', 'timeWindowEnd', 'timeWindowTimeZone',
-                         'timeWindowType',
-                         'parameterValues']
-
-        for execution in failed_rejected_deleted_executions:
-            new_execution = filter_dictionary_items(execution, items_to_keep)
-            if 'timeWindowType' not in new_execution:
-                new_execution['timeWindowType'] = 'EXPLICIT'
-
-            if check_if_duplicate(new_execution, failed_rejected_deleted_executions_deduplicated,
-                                  items_to_keep) == False:
-                failed_rejected_deleted_executions_deduplicated.append(new_execution)
-
-        executions_failed_rejected_deleted_not_yet_succeeded = []
-        executions_running_pending_succeeded = []
-        if len(failed_rejected_deleted_executions_deduplicated) > 0:
-            succeeded_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='SUCCEEDED',
-                                                                             workflow_id=workflow_id,
-                                                                             minimum_create_date_string=minimum_create_date_string,
-                                                                             max_items=max_items,
-                                                                             workflow_id_to_exclude=workflow_id_to_exclude)
-            running_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='RUNNING',
-                                                                           workflow_id=workflow_id,
-                                                                           minimum_create_date_string=minimum_create_date_string,
-                                                                           max_items=max_items,
-                                                                           workflow_id_to_exclude=workflow_id_to_exclude)
-            pending_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status='PENDING',
-                                                                           workflow_id=workflow_id,
-                                                                           minimum_create_date_string=minimum_create_date_string,
-                                                                           max_items=max_items,
-                                                                           workflow_id_to_exclude=workflow_id_to_exclude)
-            executions_running_pending_succeeded = succeeded_executions + running_executions + pending_executions
-
-            for execution_to_resubmit_record in failed_rejected_deleted_executions_deduplicated:
-                if check_if_duplicate(execution_to_resubmit_record, executions_running_pending_succeeded,
-                                      items_to_keep):
-                    logger.info('duplicated item in executions_running_pending_succeeded list {}'.format(
-                        execution_to_resubmit_record))
-                else:
-                    executions_failed_rejected_deleted_not_yet_succeeded.append(execution_to_resubmit_record)
+        # all statuses are read in one parallel sweep, candidates are deduplicated on their identity as they arrive
+        executions_to_resubmit = {}
+        completed_or_active_execution_identities = set()
+        for execution in wfmutils.get_workflow_executions_multi(
+                config, statuses=RESUBMIT_EXECUTION_STATUSES + COMPLETED_OR_ACTIVE_EXECUTION_STATUSES,
+                workflow_ids=workflow_id,
+                workflow_ids_to_exclude=workflow_id_to_exclude,
+                minimum_create_date_string=minimum_create_date_string,
+                max_items=max_items,
+                projection=EXECUTION_ATTRIBUTES_TO_GET):
+            execution_identity = wfmutils.get_execution_identity(execution)
+            if execution['executionStatus'] in COMPLETED_OR_ACTIVE_EXECUTION_STATUSES:
+                executions_running_pending_succeeded_count += 1
+                completed_or_active_execution_identities.add(execution_identity)
+                continue
+
+            failed_rejected_deleted_executions_count += 1
+            if execution_identity not in executions_to_resubmit:
+                new_execution = filter_dictionary_items(execution, ITEMS_TO_KEEP)
+                if 'timeWindowType' not in new_execution:
+                    new_execution['timeWindowType'] = 'EXPLICIT'
+                executions_to_resubmit[execution_identity] = new_execution
+        failed_rejected_deleted_executions_deduplicated_count += len(executions_to_resubmit)
+
+        for execution_identity in executions_to_resubmit:
+            if execution_identity in completed_or_active_execution_identities:
+                logger.info('duplicated item in executions_running_pending_succeeded list {}'.format(
+                    executions_to_resubmit[execution_identity]))
+            else:
+                executions_failed_rejected_deleted_not_yet_succeeded.append(executions_to_resubmit[execution_identity])
+
+        logger.info('customerId {} failed_rejected_deleted_executions count {} total to resubmit {}'.format(
+            config['customerId'], failed_rejected_deleted_executions_count,
+            len(executions_failed_rejected_deleted_not_yet_succeeded)))
 
     return {
-        'failed_rejected_deleted_executions_count ': len(failed_rejected_deleted_executions),
-        'failed_rejected_deleted_executions_deduplicated_count': len(failed_rejected_deleted_executions_deduplicated),
-        'executions_running_pending_succeeded_count': len(executions_running_pending_succeeded),
+        'failed_rejected_deleted_executions_count ': failed_rejected_deleted_executions_count,
+        'failed_rejected_deleted_executions_deduplicated_count': failed_rejected_deleted_executions_deduplicated_count,
+        'executions_running_pending_succeeded_count': executions_running_pending_succeeded_count,
         'executions_failed_rejected_deleted_not_yet_succeeded_count': len(
             executions_failed_rejected_deleted_not_yet_succeeded),
         'executions_failed_rejected_deleted_not_yet_succeeded': executions_failed_rejected_deleted_not_yet_succeeded
@@ -21,29 +21,22 @@
 
 import boto3
 import json
-from boto3 import Session
 import os
-import urllib3
 from urllib.parse import urlparse, urlencode, parse_qs, quote
-from botocore.auth import SigV4Auth
-from botocore.awsrequest import AWSRequest
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
-from dateutil.parser import parse
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
-import math
-import time
+from wfm import wfm_utils, wfm_batch_writer
+from amc_api_interface import wfm_amc_api_request, wfm_amc_api_metrics
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
 
-
-def getSignedHeaders(config, request_method, request_endpoint_url, request_body):
-    # Generate signed http headers for Sigv4
-    AWS_REGION = config['AMC']['amcInstanceRegion']
-    request = AWSRequest(method=request_method.upper(), url=request_endpoint_url, data=request_body)
-    SigV4Auth(Session().get_credentials(), "execute-api", AWS_REGION).add_auth(request)
-    return dict(request.headers.items())
+DEFAULT_OUTDATED_EXECUTION_REFRESH_WORKERS = 8
+DEFAULT_SYNC_PARALLEL_CUSTOMERS = 4
+# time left for the rest of the sync after the outdated executions have been refreshed
+OUTDATED_EXECUTION_REFRESH_RESERVED_MILLISECONDS = 180000
 
 
 def getExecutionStatusesByMinCreationTime(config, minCreationTime):
@@ -62,9 +55,7 @@ def getExecutionStatusesByMinCreationTime(config, minCreationTime):
         receivedExecutionStatus = False
         url = "{}/workflowExecutions/?{}".format(config['AMC']['amcApiEndpoint'], urlencode(
             {'minCreationTime': minCreationTime, "nextToken": AMC_API_RESPONSE_DICTIONARY['nextToken']}))
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=getSignedHeaders(config, request_method, url,
-                                                                                  request_body), body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request_with_retry(config, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
         statuses[url] = AMC_API_RESPONSE.status
 
@@ -84,7 +75,7 @@ def getExecutionStatusesByMinCreationTime(config, minCreationTime):
     }
 
     if not receivedExecutionStatus:
-        wfmutils.sns_publish_message(config, ' '.join(message), returnValue)
+        wfmutils.sns_publish_message(config['AMC']['WFM']['snsTopicArn'], ' '.join(message), returnValue)
 
     return returnValue
 
@@ -95,9 +86,7 @@ def getExecutionStatusByWorkFlowExecutionId(config, workflowExecutionId):
     request_method = 'GET'
     request_body = ''
     url = "{}/workflowExecutions/{}".format(config['AMC']['amcApiEndpoint'], workflowExecutionId)
-    AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                     headers=getSignedHeaders(config, request_method, url,
-                                                                              request_body), body=request_body)
+    AMC_API_RESPONSE = wfm_amc_api_request.send_request_with_retry(config, request_method, url, request_body)
     workflow_status_response = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
     if (AMC_API_RESPONSE.status == 200):
@@ -116,143 +105,199 @@ def getExecutionStatusByWorkFlowExecutionId(config, workflowExecutionId):
     }
 
     if not receivedExecutionStatus:
-        wfmutils.sns_publish_message(config, ' '.join(message), returnValue)
+        wfmutils.sns_publish_message(config['AMC']['WFM']['snsTopicArn'], ' '.join(message), returnValue)
 
     return returnValue
 
 
-def update_tracking_table_with_statuses(config, execution_statuses):
-    status_update_record_batch_size = int(
-        config['AMC']['WFM']['syncWorkflowStatuses']['WorkflowStatusRecordUpdateBatchSize'])
-    status_update_batch_delay_seconds = int(
-        config['AMC']['WFM']['syncWorkflowStatuses']['WorkflowStatusRecordUpdateBatchDelaySeconds'])
+# Executions created before the lookback window are not returned by the minCreationTime request, so each RUNNING or
+# PENDING one is fetched individually. The requests are sent from several threads and stop before the lambda timeout.
+# The id of the last execution refreshed is stored on the customer record so the next sync continues after it.
+def refresh_outdated_executions(config, outdated_executions, context):
+    sync_config = config['AMC']['WFM']['syncWorkflowStatuses']
+    cursor = sync_config.get('outdatedExecutionsCursor', '')
+    max_workers = int(os.environ.get('OUTDATED_EXECUTION_REFRESH_WORKERS', DEFAULT_OUTDATED_EXECUTION_REFRESH_WORKERS))
+
+    # start after the cursor and wrap around so every execution is refreshed even if one sync cannot finish them all
+    outdated_executions = sorted(outdated_executions, key=lambda execution: execution['workflowExecutionId'])
+    outdated_executions = [execution for execution in outdated_executions if
+                           execution['workflowExecutionId'] > cursor] + [
+                              execution for execution in outdated_executions if
+                              execution['workflowExecutionId'] <= cursor]
+
+    refreshed_executions = []
+    execution_updates = []
+    executions_checked = 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for index in range(0, len(outdated_executions), max_workers):
+            if context is not None and context.get_remaining_time_in_millis() < OUTDATED_EXECUTION_REFRESH_RESERVED_MILLISECONDS:
+                logger.info('stopping outdated execution refresh to leave time for the sync, {} of {} refreshed'.format(
+                    executions_checked, len(outdated_executions)))
+                break
+
+            executions = outdated_executions[index:index + max_workers]
+            responses = executor.map(
+                lambda execution: getExecutionStatusByWorkFlowExecutionId(config, execution['workflowExecutionId']),
+                executions)
+            for execution, response in zip(executions, responses):
+                if response['statusCode'] == 200:
+                    refreshed_executions.append(execution)
+                    execution_updates.append(response['body'])
+            executions_checked += len(executions)
+
+    new_cursor = ''
+    if 0 < executions_checked < len(outdated_executions):
+        new_cursor = outdated_executions[executions_checked - 1]['workflowExecutionId']
+    if new_cursor != cursor:
+        update_outdated_executions_cursor_customer_record_Dynamodb(os.environ['CUSTOMERS_DYNAMODB_TABLE'], config,
+                                                                    new_cursor)
+
+    return {
+        'refreshedExecutions': refreshed_executions,
+        'executionUpdates': execution_updates,
+        'executionsChecked': executions_checked,
+        'executionsRemaining': len(outdated_executions) - executions_checked
+    }
 
+
+def update_tracking_table_with_statuses(config, execution_statuses):
     if type(execution_statuses) != list:
         execution_statuses = [execution_statuses]
 
-    # Get the name of the tracking table from an environment variable
-    # Create a table object
-    table = boto3.resource('dynamodb').Table(
-        config['AMC']['WFM']['syncWorkflowStatuses']['amcWorkflowExecutionTrackingDynamoDBTableName'])
-    messages = []
+    tracking_table_name = config['AMC']['WFM']['syncWorkflowStatuses']['amcWorkflowExecutionTrackingDynamoDBTableName']
+    retention_days = timedelta(days=int(config['AMC']['WFM']['syncWorkflowStatuses']['WorkflowStatusRecordRetentionDays']))
 
-    records_to_write = len(execution_statuses)
-    message = 'records to write {}'.format(records_to_write)
+    message = 'records to write {}'.format(len(execution_statuses))
     logger.info(message)
-    messages.append(message)
-    batches_to_run = math.ceil(records_to_write / status_update_record_batch_size)
-    batch_counter = 1
-    last_index = 0
-    results = []
-    number_of_records_updated = 0
-    status_codes = [200]
+
     last_updated_times = ['']
-    while batch_counter <= batches_to_run:
-        if batch_counter > 1:
-            time.sleep(status_update_batch_delay_seconds)
-
-        logger.info(
-            'last index{} {} , batch_counter: {} {}, status_update_record_batch_size: {} {}'.format(type(last_index),
-                                                                                                    last_index,
-                                                                                                    type(batch_counter),
-                                                                                                    batch_counter, type(
-                    status_update_record_batch_size), status_update_record_batch_size))
-        statuses = execution_statuses[last_index: (batch_counter * status_update_record_batch_size)]
-        last_index = batch_counter * status_update_record_batch_size
-        message = 'batch_counter {}, lenth of batch {}, last_index: {}'.format(batch_counter, len(statuses), last_index)
-        logger.info(message)
-        messages.append(message)
-        statusCode = 200
-        try:
-            with table.batch_writer() as batch:
-                for record in statuses:
-                    if 'outputS3URI' not in record:
-                        record['outputS3URI'] = ''
-                    last_updated_times.append(record['lastUpdatedTime'])
-                    record['executionStatus'] = record['status']
-                    # remove the status item as it will cause a DynamoDB error as it is a reserved word
-                    del record['status']
-                    record['customerId'] = config['customerId']
-                    record['expireTimestamp'] = round((parse(record['lastUpdatedTime']) + timedelta(days=int(
-                        config['AMC']['WFM']['syncWorkflowStatuses'][
-                            'WorkflowStatusRecordRetentionDays']))).timestamp())
-                    batch.put_item(Item=record)
-            message = 'put {} records for table {}'.format(len(statuses), config['AMC']['WFM']['syncWorkflowStatuses'][
-                'amcWorkflowExecutionTrackingDynamoDBTableName'])
-            logger.info(message)
-            results.append(
-                {'statusCode': 200, 'batchNumber': batch_counter, 'batchSize': len(statuses), 'message': message})
-            number_of_records_updated = number_of_records_updated + len(statuses)
-        except Exception as e:
-            message = 'Updating record batch number {} batch size {} record {} failed with error {}'.format(
-                batch_counter, len(statuses), json.dumps(record, default=wfmutils.json_encoder_default), e)
-            logger.error(message)
-            results.append(
-                {'statusCode': 500, 'batchNumber': batch_counter, 'batchSize': len(statuses), 'message': message})
-            status_codes.append(500)
+    for record in execution_statuses:
+        if 'outputS3URI' not in record:
+            record['outputS3URI'] = ''
+        last_updated_times.append(record['lastUpdatedTime'])
+        record['executionStatus'] = record['status']
+        # remove the status item as it will cause a DynamoDB error as it is a reserved word
+        del record['status']
+        record['customerId'] = config['customerId']
+        record['expireTimestamp'] = round((wfmutils.parse_iso_datetime(record['lastUpdatedTime']) + retention_days).timestamp())
+
+    # the writer adjusts its rate to the capacity DynamoDB reports instead of sleeping a fixed time between batches
+    writer = wfm_batch_writer.AdaptiveBatchWriter(
+        logger, tracking_table_name,
+        max_workers=int(os.environ.get('DYNAMODB_WRITE_WORKERS', wfm_batch_writer.DEFAULT_MAX_WORKERS)),
+        maximum_units_per_second=int(os.environ.get('DYNAMODB_MAX_WRITE_UNITS_PER_SECOND',
+                                                    wfm_batch_writer.DEFAULT_MAXIMUM_UNITS_PER_SECOND)))
+    write_results = writer.put_items(execution_statuses)
+
+    for failed_item in write_results['failedItems']:
+        logger.error('Updating record failed {}'.format(json.dumps(failed_item, default=wfmutils.json_encoder_default)))
 
-        batch_counter = batch_counter + 1
     return {
-        'statusCode': max(status_codes),
-        'totalRecordsUpdated': number_of_records_updated,
+        'statusCode': write_results['statusCode'],
+        'totalRecordsUpdated': write_results['itemsWritten'],
         'latestLastUpdatedTime': max(last_updated_times),
-        'results': results
+        'results': [{
+            'statusCode': write_results['statusCode'],
+            'itemsWritten': write_results['itemsWritten'],
+            'itemsFailed': write_results['itemsFailed'],
+            'consumedCapacityUnits': write_results['consumedCapacityUnits'],
+            'unitsPerSecond': write_results['unitsPerSecond'],
+            'messages': write_results['messages']
+        }]
     }
 
 
+@wfm_amc_api_metrics.log_amc_api_metrics
 def lambda_handler(event, context):
-    default_batch_size = int(os.environ['DEFAULT_DYNAMODB_RECORD_UPDATE_BATCH_SIZE'])
-    default_batch_delay_seconds = int(os.environ['DEFAULT_DYNAMODB_BATCH_DELAY_SECONDS'])
-
     if 'customerId' not in event:
         message = 'no customerId found in the request {}'.format(event)
         logger.error(message)
         return {"statusCode": 500, "message": message}
 
-    configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'], event['customerId'])
+    # a single customerId returns the result for that customer, a list of customerIds (a shard sent by the
+    # syncExecutionStatuses orchestrator) is synced in parallel and returns a list of results
+    if type(event['customerId']) != list:
+        configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'],
+                                                                event['customerId'])
+        for configKey in configs:
+            config = configs[configKey]
+            return (sync_workflow_statuses(config, context))
+
+    configs = wfmutils.dynamodb_batch_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'],
+                                                                  event['customerId'])
+    max_workers = int(os.environ.get('SYNC_PARALLEL_CUSTOMERS', DEFAULT_SYNC_PARALLEL_CUSTOMERS))
+    # boto3 client creation is not thread safe, the clients used by the sync threads are created before they start
+    wfm_batch_writer.get_dynamodb_resource_client()
+    wfmutils.get_sns_client()
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(configs)))) as executor:
+        futures = {customer_id: executor.submit(sync_workflow_statuses, configs[customer_id], context) for
+                   customer_id in configs}
 
-    for configKey in configs:
-        config = configs[configKey]
+    results = []
+    for customer_id in futures:
+        try:
+            result = futures[customer_id].result()
+            results.append({
+                'customerId': customer_id,
+                'statusCode': result.get('statusCode', 500),
+                'totalRecordsUpdated': result.get('totalRecordsUpdated', 0)
+            })
+        except Exception as e:
+            message = 'sync failed for customerId {} with error {}'.format(customer_id, e)
+            logger.error(message)
+            results.append({'customerId': customer_id, 'statusCode': 500, 'message': message})
+    logger.info(results)
+    return results
 
-        if 'WorkflowStatusRecordUpdateBatchSize' not in config['AMC']['WFM']['syncWorkflowStatuses']:
-            config['AMC']['WFM']['syncWorkflowStatuses']['WorkflowStatusRecordUpdateBatchSize'] = default_batch_size
-        if 'WorkflowStatusRecordUpdateBatchDelaySeconds' not in config['AMC']['WFM']['syncWorkflowStatuses']:
-            config['AMC']['WFM']['syncWorkflowStatuses'][
-                'WorkflowStatusRecordUpdateBatchDelaySeconds'] = default_batch_delay_seconds
-        return (sync_workflow_statuses(config))
 
+# the customers are synced in several threads, boto3 resources can not be shared between threads so the updates use
+# the shared low level client of the batch writer, which serializes python types like the resource does
+def update_last_synced_time_customer_record_Dynamodb(table_name, config, last_synced_time, latest_last_updated_time='',
+                                                     sync_metrics=None):
+    client = wfm_batch_writer.get_dynamodb_resource_client()
+    update_expression = "set AMC.WFM.syncWorkflowStatuses.lastSyncedTime=:t"
+    expression_attribute_values = {':t': last_synced_time}
 
-def update_last_synced_time_customer_record_Dynamodb(table_name, config, last_synced_time, latest_last_updated_time=''):
-    table = boto3.resource('dynamodb').Table(table_name)
     if latest_last_updated_time != '':
-        response = table.update_item(
-            Key={
-                'customerId': config['customerId']
-            },
-            UpdateExpression="set AMC.WFM.syncWorkflowStatuses.lastSyncedTime=:t, AMC.WFM.syncWorkflowStatuses.latestLastUpdatedTime=:u",
-            ExpressionAttributeValues={
-                ':t': last_synced_time,
-                ':u': latest_last_updated_time
-            },
-            ReturnValues="UPDATED_NEW"
-        )
+        update_expression += ", AMC.WFM.syncWorkflowStatuses.latestLastUpdatedTime=:u"
+        expression_attribute_values[':u'] = latest_last_updated_time
+
+    # metrics from the last run are used by the syncExecutionStatuses orchestrator and for monitoring
+    if sync_metrics is not None:
+        update_expression += ", AMC.WFM.syncWorkflowStatuses.lastSyncMetrics=:m"
+        expression_attribute_values[':m'] = sync_metrics
+
+    response = client.update_item(
+        TableName=table_name,
+        Key={
+            'customerId': config['customerId']
+        },
+        UpdateExpression=update_expression,
+        ExpressionAttributeValues=expression_attribute_values,
+        ReturnValues="UPDATED_NEW"
+    )
+    return response
 
-    else:
-        response = table.update_item(
-            Key={
-                'customerId': config['customerId']
-            },
-            UpdateExpression="set AMC.WFM.syncWorkflowStatuses.lastSyncedTime=:t",
-            ExpressionAttributeValues={
-                ':t': last_synced_time
-            },
-            ReturnValues="UPDATED_NEW"
-        )
+
+def update_outdated_executions_cursor_customer_record_Dynamodb(table_name, config, cursor):
+    client = wfm_batch_writer.get_dynamodb_resource_client()
+    response = client.update_item(
+        TableName=table_name,
+        Key={
+            'customerId': config['customerId']
+        },
+        UpdateExpression="set AMC.WFM.syncWorkflowStatuses.outdatedExecutionsCursor=:c",
+        ExpressionAttributeValues={
+            ':c': cursor
+        },
+        ReturnValues="UPDATED_NEW"
+    )
     return response
 
 
-def sync_workflow_statuses(config):
+def sync_workflow_statuses(config, context=None):
     logger.info('Syncing Status Table for customerId:{}'.format(config['customerId']))
+    sync_start_time = time.time()
 
     # create a dictionary for execution records so we can do a quick lookup later based on workflowExecutionId as the key for each record
     executionRecordsDictionary = {}
@@ -265,26 +310,23 @@ def sync_workflow_statuses(config):
     # calculate the minimum execution created date
     minimum_create_date_string = (datetime.today() + timedelta(hours=lookbackHours)).strftime('%Y-%m-%dT00:00:00')
     # get a date with UTC by adding Z to the parsed string
-    minimum_create_date = parse(minimum_create_date_string + "Z")
+    minimum_create_date = wfmutils.parse_iso_datetime(minimum_create_date_string + "Z")
     outdated_executions = []
-    updates_for_outdated_executions = []
-    running_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status="RUNNING")
-    pending_executions = wfmutils.dynamodb_get_workflow_executions(config, execution_status="PENDING")
-
-    running_and_pending_executions = running_executions + pending_executions
+    running_and_pending_executions = wfmutils.get_workflow_executions_multi(config, statuses=["RUNNING", "PENDING"])
     for execution in running_and_pending_executions:
-        if 'createTime' in execution:
-            logger.info(
-                'createTime: {} minimum_create_date:{} '.format(parse(execution['createTime']), minimum_create_date))
-            if parse(execution['createTime']) < minimum_create_date:
-                outdated_executions.append(execution)
-                execution_status = getExecutionStatusByWorkFlowExecutionId(config, execution['workflowExecutionId'])
-                logger.info(execution_status['body'])
-                updates_for_outdated_executions.append(execution_status['body'])
+        if 'createTime' in execution and wfmutils.parse_iso_datetime(execution['createTime']) < minimum_create_date:
+            outdated_executions.append(execution)
+
+    logger.info('{} running or pending executions created before {}'.format(len(outdated_executions),
+                                                                            minimum_create_date_string))
+    refresh_results = refresh_outdated_executions(config, outdated_executions, context)
+    # only the executions that were refreshed are compared, the others would otherwise be marked as deleted
+    outdated_executions = refresh_results['refreshedExecutions']
+    updates_for_outdated_executions = refresh_results['executionUpdates']
 
     # get execution records from DynamoDB
-    execution_records_from_time_window = wfmutils.dynamodb_get_workflow_executions(config,
-                                                                                   minimum_create_date_string=minimum_create_date_string)
+    execution_records_from_time_window = list(wfmutils.get_workflow_executions_multi(
+        config, minimum_create_date_string=minimum_create_date_string))
 
     executionRecords = outdated_executions + execution_records_from_time_window
 
@@ -339,10 +381,22 @@ def sync_workflow_statuses(config):
 
     update_results = update_tracking_table_with_statuses(config, AllRecordsToUpdate)
 
+    return_object = {
+        'customerId': config['customerId'],
+        'statusCode': update_results['statusCode'],
+        'updateResults': update_results
+    }
+
     if update_results['statusCode'] == 200:
+        sync_metrics = {
+            'durationSeconds': str(round(time.time() - sync_start_time, 3)),
+            'executionsReturned': len(executions),
+            'recordsUpdated': update_results['totalRecordsUpdated'],
+            'outdatedExecutionsRemaining': refresh_results['executionsRemaining']
+        }
         update_last_synced_time_response = update_last_synced_time_customer_record_Dynamodb(
             os.environ['CUSTOMERS_DYNAMODB_TABLE'], config, datetime.now().strftime('%Y-%m-%dT%H:%M:%S'),
-            update_results['latestLastUpdatedTime'])
+            update_results['latestLastUpdatedTime'], sync_metrics)
 
         return_object = {
             'customerId': config['customerId'],
@@ -356,6 +410,7 @@ def sync_workflow_statuses(config):
             'lookbackHours': lookbackHours,
             'oldestCreateDateMonitored': minimum_create_date_string,
             'runningOrPendingExecutionsOutsideMonitoringWindow': len(outdated_executions),
+            'runningOrPendingExecutionsOutsideMonitoringWindowRemaining': refresh_results['executionsRemaining'],
             'updatesForExecutionsOutsideMonitoringWindow': updates_for_outdated_executions,
             "recordsUpdated": AllRecordsToUpdate,
             'updateResults': update_results,
@@ -15,130 +15,147 @@
 
 import boto3
 import os
+import time
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_config_cache, wfm_workflow_definitions, wfm_schedule_index
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
+customer_config_cache = wfm_config_cache.get_customer_config_cache(wfmutils)
 
 sqs = boto3.client('sqs')
 ssm = boto3.client('ssm')
 ddb = boto3.client('dynamodb')
 
+# one table resource per table is reused for every read and batch write of the container
+dynamodb = boto3.resource('dynamodb')
+tables = {}
 
-def handle_updated_item(item, event_name, configs, workflows_table, workflow_schedule_table):
 
-    logger.info('event: {} item {} '.format(event_name, item))
+def get_table(table_name):
+    if table_name not in tables:
+        tables[table_name] = dynamodb.Table(table_name)
+    return tables[table_name]
 
-    # if the item passed in endemicType or customerPrefix then we have to remove the record from inapplicable customers
-    endemic_flag = False
-    prefix_flag = False
 
-    workflow_endemic_type = ''
-    if 'endemicType' in item:
-        workflow_endemic_type = item['endemicType']
-        endemic_flag = True
-    workflow_customer_prefix = ''
-    if 'customerPrefix' in item:
-        workflow_customer_prefix = item['customerPrefix']
-        prefix_flag = True
-    
+# the eligibility of a customer for library workflows is evaluated once per invocation instead of once per item
+def get_customer_eligibility(configs):
+    eligibility = {}
     for customerId in configs:
-        logger.info(f'checking customer: {customerId}')
-
-        workflow_item_to_update = item.copy()
-        workflow_item_to_update['customerId'] = customerId
-        workflow_item_to_update.pop('schedule', None)
-        if 'schedule' in item:
-            schedule_item_to_update = item['schedule'].copy()
-            schedule_item_to_update['customerId'] = customerId
-
-        enable_workflow_library = False
-        if "enableWorkflowLibrary" in configs[customerId]['AMC']['WFM']:
-            enable_workflow_library = configs[customerId]['AMC']['WFM']["enableWorkflowLibrary"]
-        if not enable_workflow_library:
-            logger.info(f'workflow library not enabled')
+        config = configs[customerId]
+        if not config['AMC'].get('WFM', {}).get('enableWorkflowLibrary', False):
+            logger.info(f'workflow library not enabled for customer: {customerId}')
             continue
-
-        customer_endemic_type = ''
-        if "endemicType" in configs[customerId]:
-            customer_endemic_type = configs[customerId]["endemicType"]
-        if endemic_flag == True and workflow_endemic_type != customer_endemic_type:
-            logger.info(f'workflow endemicType: {workflow_endemic_type}, customer endemicType: {customer_endemic_type}')
-            wfmutils.dynamodb_delete_item(
-                table_name=workflows_table, 
-                key={
-                    "customerId": customerId,
-                    "workflowId": workflow_item_to_update["workflowId"]
-                }
-            )
-            if schedule_item_to_update:
-                wfmutils.dynamodb_delete_item(table_name=workflow_schedule_table, 
-                key={
-                    "customerId": customerId,
-                    "Name": schedule_item_to_update["Name"]
-                }
-            )
-            continue
-
-        customer_customer_prefix = ''
-        if "customerPrefix" in configs[customerId]:
-            customer_customer_prefix = configs[customerId]["customerPrefix"]
-        if prefix_flag == True and workflow_customer_prefix != customer_customer_prefix:
-            logger.info(f'workflow customerPrefix: {workflow_customer_prefix}, customer customerPrefix: {customer_customer_prefix}')
-            wfmutils.dynamodb_delete_item(
-                table_name=workflows_table, 
-                key={
-                    "customerId": customerId,
-                    "workflowId": workflow_item_to_update["workflowId"]
-                }
-            )
-            if schedule_item_to_update:
-                wfmutils.dynamodb_delete_item(table_name=workflow_schedule_table, 
-                key={
-                    "customerId": customerId,
-                    "Name": schedule_item_to_update["Name"]
-                }
-            )
+        eligibility[customerId] = {
+            'endemicType': config.get('endemicType', ''),
+            'customerPrefix': config.get('customerPrefix', '')
+        }
+    return eligibility
+
+
+def is_customer_eligible(item, customer_eligibility):
+    # if the item has an endemicType or customerPrefix it is only deployed to customers with the same value
+    if 'endemicType' in item and item['endemicType'] != customer_eligibility['endemicType']:
+        return False
+    if 'customerPrefix' in item and item['customerPrefix'] != customer_eligibility['customerPrefix']:
+        return False
+    return True
+
+
+class LibraryRows:
+    def __init__(self):
+        # (customerId, workflowId) -> workflow row or None when the row should not exist
+        self.workflows = {}
+        # (customerId, Name) -> schedule row or None when the row should not exist
+        self.schedules = {}
+
+    # adds the rows the library item should have for every customer, old_item is the previous version of the item
+    # so that rows it created that the new version no longer covers are removed
+    def add_library_item(self, item, old_item, eligibility):
+        for customerId in eligibility:
+            # the latest version of an item in the batch replaces the rows added for its earlier versions
+            for version in [old_item, item]:
+                if version is not None:
+                    self.workflows[(customerId, version['workflowId'])] = None
+                    if 'schedule' in version:
+                        self.schedules[(customerId, version['schedule']['Name'])] = None
+
+            if item is None or not is_customer_eligible(item, eligibility[customerId]):
+                continue
+
+            workflow_row = item.copy()
+            workflow_row.pop('schedule', None)
+            workflow_row['customerId'] = customerId
+            self.workflows[(customerId, item['workflowId'])] = workflow_row
+            if 'schedule' in item:
+                schedule_row = item['schedule'].copy()
+                schedule_row['customerId'] = customerId
+                self.schedules[(customerId, item['schedule']['Name'])] = schedule_row
+
+
+# reads the existing rows for a list of keys with BatchGetItem, returns a dictionary of key tuple to row
+def batch_get_rows(table_name, key_names, keys):
+    rows = {}
+    for index in range(0, len(keys), 100):
+        request_items = {table_name: {'Keys': [dict(zip(key_names, key)) for key in keys[index:index + 100]]}}
+        attempt = 0
+        while request_items:
+            if attempt > 0:
+                time.sleep(min(0.1 * (2 ** attempt), 2))
+            response = dynamodb.batch_get_item(RequestItems=request_items)
+            for row in response.get('Responses', {}).get(table_name, []):
+                rows[tuple(row[key_name] for key_name in key_names)] = row
+            request_items = response.get('UnprocessedKeys', {})
+            attempt += 1
+    return rows
+
+
+# writes only the rows that differ from the existing rows and deletes existing rows that should not exist
+# attributes maintained on the rows by other functions, they are not part of the library so they are ignored when
+# comparing rows and kept when a row is rewritten: the content hash of the definition in AMC lets the
+# WorkflowTableTrigger tell if it changed and the schedule index attributes keep a due schedule's next run
+MAINTAINED_ATTRIBUTES = (
+    wfm_workflow_definitions.CONTENT_HASH_ATTRIBUTE,
+    wfm_schedule_index.NEXT_FIRE_TIME_ATTRIBUTE,
+    wfm_schedule_index.SCHEDULE_SHARD_ATTRIBUTE
+)
+
+
+def remove_maintained_attributes(row):
+    return {attribute: value for attribute, value in row.items() if attribute not in MAINTAINED_ATTRIBUTES}
+
+
+def apply_rows(table_name, key_names, desired_rows):
+    existing_rows = batch_get_rows(table_name, key_names, list(desired_rows.keys()))
+    puts = []
+    for key, row in desired_rows.items():
+        if row is None:
             continue
+        existing_row = existing_rows.get(key)
+        if existing_row is None:
+            puts.append(row)
+        elif remove_maintained_attributes(existing_row) != row:
+            maintained_attributes = {attribute: existing_row[attribute] for attribute in MAINTAINED_ATTRIBUTES
+                                     if attribute in existing_row}
+            puts.append(dict(row, **maintained_attributes))
+    deletes = [key for key, row in desired_rows.items() if row is None and key in existing_rows]
 
-        # if all checks pass, add the item to the appropriate tables
-        wfmutils.dynamodb_put_item(workflows_table, workflow_item_to_update)
-        if schedule_item_to_update:
-            wfmutils.dynamodb_put_item(workflow_schedule_table, schedule_item_to_update)
-
-
-def handle_deleted_item(item, event_name, configs, workflows_table, workflow_schedule_table):
-
-    logger.info('event: {} item {} '.format(event_name, item))
+    with get_table(table_name).batch_writer(overwrite_by_pkeys=key_names) as batch:
+        for row in puts:
+            batch.put_item(Item=row)
+        for key in deletes:
+            batch.delete_item(Key=dict(zip(key_names, key)))
 
-    for customerId in configs:
-        logger.info(f'checking customer: {customerId}')
+    logger.info('table {}: {} rows checked, {} put, {} deleted, {} unchanged'.format(
+        table_name, len(desired_rows), len(puts), len(deletes), len(desired_rows) - len(puts) - len(deletes)))
+    return {'rowsChecked': len(desired_rows), 'rowsPut': len(puts), 'rowsDeleted': len(deletes)}
 
-        enable_workflow_library = False
-        if "enableWorkflowLibrary" in configs[customerId]['AMC']['WFM']:
-            enable_workflow_library = configs[customerId]['AMC']['WFM']["enableWorkflowLibrary"]
-        if not enable_workflow_library:
-            logger.info(f'workflow library not enabled')
-            continue
 
-        if enable_workflow_library:
-            workflow_item_to_delete = item.copy()
-            wfmutils.dynamodb_delete_item(
-                table_name=workflows_table, 
-                key={
-                    "customerId": customerId,
-                    "workflowId": workflow_item_to_delete["workflowId"]
-                }
-            )
-            if 'schedule' in item:
-                schedule_item_to_delete = item['schedule'].copy()
-                wfmutils.dynamodb_delete_item(table_name=workflow_schedule_table, 
-                key={
-                    "customerId": customerId,
-                    "Name": schedule_item_to_delete["Name"]
-                }
-            )
+def apply_library_rows(library_rows, workflows_table, workflow_schedule_table):
+    return {
+        'workflows': apply_rows(workflows_table, ['customerId', 'workflowId'], library_rows.workflows),
+        'schedules': apply_rows(workflow_schedule_table, ['customerId', 'Name'], library_rows.schedules)
+    }
 
 
 def lambda_handler(event, context):
@@ -149,34 +166,28 @@ def lambda_handler(event, context):
     workflow_schedule_table = os.environ['WORKFLOW_SCHEDULE_TABLE']
     workflow_library_table = os.environ['WORKFLOW_LIBRARY_DYNAMODB_TABLE']
 
+    library_rows = LibraryRows()
+
     # check to see if the trigger is being invoked for a new customer that needs to have the default workflows deployed
     if 'customerId' in event and 'deployForNewCustomer' in event and event['deployForNewCustomer']:
         # get the customer config record for the specific customer
-        customer_config = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'],
-                                                                        event['customerId'])
-        # get the entire workflow library record set
-        dynamodb_records = wfmutils.dynamodb_get_all_records(workflow_library_table)
-        for workflow_library_record in dynamodb_records:
-            logger.info(workflow_library_record)
-            # treat each workflow records with auto deploy as if it were a newly inserted record for this customerId
-            handle_updated_item(workflow_library_record, 'INSERT', customer_config, workflows_table,
-                                    workflow_schedule_table,)
-        return
-
-    configs = wfmutils.dynamodb_get_customer_config_records(os.environ['CUSTOMERS_DYNAMODB_TABLE'])
-    response = {}
-    for record in event['Records']:
+        eligibility = get_customer_eligibility(customer_config_cache.get_many([event['customerId']]))
+        # treat each workflow library record as if it were a newly inserted record for this customerId
+        for workflow_library_record in wfmutils.dynamodb_get_all_records(workflow_library_table):
+            library_rows.add_library_item(workflow_library_record, None, eligibility)
+        return apply_library_rows(library_rows, workflows_table, workflow_schedule_table)
 
+    eligibility = get_customer_eligibility(customer_config_cache.get_all())
+    for record in event['Records']:
+        new_record = None
+        old_record = None
         if 'dynamodb' in record and 'NewImage' in record['dynamodb']:
             new_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage'])
 
         if 'dynamodb' in record and 'OldImage' in record['dynamodb']:
             old_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['OldImage'])
 
-        if record['eventName'] in ['INSERT', 'MODIFY']:
-            handle_updated_item(new_record, record['eventName'], configs, workflows_table, workflow_schedule_table,)
-
-        if record['eventName'] in ['REMOVE']:
-            handle_deleted_item(old_record, record['eventName'], configs, workflows_table, workflow_schedule_table,)
+        logger.info('event: {} item {} '.format(record['eventName'], new_record or old_record))
+        library_rows.add_library_item(new_record, old_record, eligibility)
 
-    return response
+    return apply_library_rows(library_rows, workflows_table, workflow_schedule_table)
@@ -15,20 +15,75 @@
 
 import json
 import boto3
-import urllib3
 import os
-from boto3 import Session
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from datetime import datetime
-from botocore.auth import SigV4Auth
-from botocore.awsrequest import AWSRequest
 from aws_lambda_powertools import Logger
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_admission_control, wfm_config_cache, wfm_execution_queue
+from amc_api_interface import wfm_amc_api_request, wfm_amc_api_metrics
 
 wfmutils = wfm_utils.Utils(logger)
+customer_config_cache = wfm_config_cache.get_customer_config_cache(wfmutils)
+
+admission_controller = None
+if 'ADMISSION_CONTROL_DYNAMODB_TABLE' in os.environ:
+    admission_controller = wfm_admission_control.AdmissionController(logger,
+                                                                     os.environ['ADMISSION_CONTROL_DYNAMODB_TABLE'])
+
+DEFAULT_RECEIVE_PARALLELISM = 4
+DEFAULT_EXECUTION_SLOT_WAIT_SECONDS = 60
+SQS_MAX_RECEIVE_MESSAGES = 10
+# a message throttled by AMC is kept invisible for THROTTLE_BACKOFF_BASE_SECONDS, doubled with every receive of the
+# message up to THROTTLE_BACKOFF_MAX_SECONDS, so repeatedly throttled executions use few of the queue's receives
+THROTTLE_BACKOFF_BASE_SECONDS = 60
+THROTTLE_BACKOFF_MAX_SECONDS = 900
+
+# the low level client is shared by the receive threads, boto3 resources can not be used from several threads
+sqs_client = boto3.client('sqs')
+lambda_client = boto3.client('lambda')
+receive_parallelism = max(1, int(os.environ.get('RECEIVE_PARALLELISM', DEFAULT_RECEIVE_PARALLELISM)))
+receive_executor = ThreadPoolExecutor(max_workers=receive_parallelism)
+
+
+class ReceivedMessage:
+    def __init__(self, queue_url, message):
+        self.queue_url = queue_url
+        self.body = message['Body']
+        self.message_attributes = message.get('MessageAttributes')
+        self.receipt_handle = message['ReceiptHandle']
+        self.receive_count = int(message.get('Attributes', {}).get('ApproximateReceiveCount', 1))
+
+    def delete(self):
+        sqs_client.delete_message(QueueUrl=self.queue_url, ReceiptHandle=self.receipt_handle)
+
+    def change_visibility(self, VisibilityTimeout):
+        sqs_client.change_message_visibility(QueueUrl=self.queue_url, ReceiptHandle=self.receipt_handle,
+                                             VisibilityTimeout=VisibilityTimeout)
+
+
+def receive_message_batch(queue_url, max_messages):
+    response = sqs_client.receive_message(QueueUrl=queue_url, MessageAttributeNames=['customerId', 'workflowId'],
+                                          AttributeNames=['ApproximateReceiveCount'], MaxNumberOfMessages=max_messages)
+    return [ReceivedMessage(queue_url, message) for message in response.get('Messages', [])]
+
+
+# receives up to max_messages with up to RECEIVE_PARALLELISM concurrent ReceiveMessage calls. A FIFO queue does not
+# return messages of a message group that has messages in flight, so the concurrent calls receive different message
+# groups and the messages of each group are still returned in order
+def receive_messages(queue_url, max_messages):
+    batch_sizes = []
+    while max_messages > 0 and len(batch_sizes) < receive_parallelism:
+        batch_sizes.append(min(max_messages, SQS_MAX_RECEIVE_MESSAGES))
+        max_messages -= batch_sizes[-1]
+
+    if len(batch_sizes) == 1:
+        return receive_message_batch(queue_url, batch_sizes[0])
+    batches = receive_executor.map(lambda batch_size: receive_message_batch(queue_url, batch_size), batch_sizes)
+    return [message for batch in batches for message in batch]
 
 
 def updateExeuctionTrackingTable(customerConfig, executions):
@@ -50,57 +105,20 @@ def updateExeuctionTrackingTable(customerConfig, executions):
                 )
 
 
-def getSignedHeaders(request_method, request_url, region, request_body):
-    # Generate signed http headers for Sigv4
-    request = AWSRequest(method=request_method.upper(), url=request_url, data=request_body)
-    SigV4Auth(Session().get_credentials(), "execute-api", region).add_auth(request)
-    return dict(request.headers.items())
-
-
-def getOffsetValue(offset_string):
-    return (int(offset_string.split('(')[1].split(')')[0]))
-
-
-def getCurrentDateWithOffset(offset_in_days):
-    return ((datetime.today() + timedelta(days=offset_in_days)).strftime('%Y-%m-%dT00:00:00'))
-
-
-def processParameterFunctions(parameter):
-    if parameter.upper() == 'NOW()':
-        return (datetime.today().strftime('%Y-%m-%dT%H:%M:%S'))
-
-    if "TODAY(" in parameter.upper():
-        return getCurrentDateWithOffset(getOffsetValue(parameter))
-    return parameter
-
-
 def executeWorkflow(customerConfig, event):
     executedWorkflow = False
     payload = event['payload']
     message = ''
 
     # Process the parameters to enable now() and today() functions
-    if "parameterValues" in payload:
-        for parameter in payload['parameterValues']:
-            payload['parameterValues'][parameter] = processParameterFunctions(payload['parameterValues'][parameter])
-            logger.info("updated parameter {} to {}".format(parameter, payload['parameterValues'][parameter]))
-
-    payload['timeWindowStart'] = processParameterFunctions(payload['timeWindowStart'])
-    logger.info("updated parameter timeWindowStart to {}".format(payload['timeWindowStart']))
-    payload['timeWindowEnd'] = processParameterFunctions(payload['timeWindowEnd'])
-    logger.info("updated parameter timeWindowEnd to {}".format(payload['timeWindowEnd']))
+    wfmutils.process_payload_parameters(payload)
+    logger.info("updated parameters {}".format(payload))
 
     url = "{}/workflowExecutions".format(customerConfig['AMC']['amcApiEndpoint'])
     request_method = 'POST'
     request_body = json.dumps(payload)
     try:
-        AMC_API_RESPONSE = urllib3.PoolManager().request(request_method, url,
-                                                         headers=getSignedHeaders(request_method, url,
-                                                                                  customerConfig[
-                                                                                      'AMC'][
-                                                                                      'amcInstanceRegion'],
-                                                                                  request_body),
-                                                         body=request_body)
+        AMC_API_RESPONSE = wfm_amc_api_request.send_request(customerConfig, request_method, url, request_body)
         AMC_API_RESPONSE_DICTIONARY = json.loads(AMC_API_RESPONSE.data.decode("utf-8"))
 
         if (AMC_API_RESPONSE.status == 200):
@@ -132,7 +150,8 @@ def executeWorkflow(customerConfig, event):
             'body': {}
         }
 
-    if not executedWorkflow:
+    # throttled requests stay in the queue and are retried once the admission controller allows it
+    if not executedWorkflow and returnValue['statusCode'] != 429:
         wfmutils.sns_publish_message(customerConfig['AMC']['WFM']['snsTopicArn'], message, returnValue)
 
     return returnValue
@@ -332,6 +351,10 @@ def invoke_consume_queue(customer_config):
     return response
 
 
+def get_throttle_backoff_seconds(receive_count):
+    return min(THROTTLE_BACKOFF_BASE_SECONDS * (2 ** (max(1, receive_count) - 1)), THROTTLE_BACKOFF_MAX_SECONDS)
+
+
 def process_queue(customer_config_record):
     log_messages = []
     workflow_execution_responses = []
@@ -345,27 +368,49 @@ def process_queue(customer_config_record):
     executions_available_result = get_number_of_executions_available(customer_config_record)
 
     # Get the queue
-    queue = boto3.resource('sqs').get_queue_by_name(
-        QueueName=customer_config_record['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'])
+    queue_url = wfm_execution_queue.get_queue_url(
+        sqs_client, customer_config_record['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'])
     logger.info('customerId: {} executionsAvailable: {}'.format(customer_config_record['customerId'],
                                                                 executions_available_result['executionsAvailable']))
-    if executions_available_result['executionsAvailable'] > 0:
-        messagesToReceive = executions_available_result['executionsAvailable']
-        if executions_available_result['executionsAvailable'] > 10:
-            messagesToReceive = 10
-
-        messages_received = queue.receive_messages(MessageAttributeNames=['customerId', 'workflowId'],
-                                                   MaxNumberOfMessages=messagesToReceive)
-        messages_received_count = len(messages_received)
+
+    executions_admitted = executions_available_result['executionsAvailable']
+    if admission_controller is not None:
+        executions_admitted = admission_controller.admit(customer_config_record,
+                                                         executions_available_result['executionsAvailable'])
+
+    executions_attempted = 0
+    executions_succeeded = 0
+    throttled = False
+    # the messages are received in batches that double in size while every execution is submitted, so few messages
+    # have been received and not submitted when AMC starts throttling. Each receive counts towards the maximum receive
+    # count of the queue
+    receive_size = SQS_MAX_RECEIVE_MESSAGES
+    # keep receiving until the admitted executions are used up, the queue is empty or AMC starts throttling
+    while executions_attempted < executions_admitted and not throttled:
+        messagesToReceive = min(receive_size, executions_admitted - executions_attempted)
+        receive_size *= 2
+
+        messages_received_batch = receive_messages(queue_url, messagesToReceive)
+        messages_received_count = len(messages_received_batch)
         logger.info('customerId: {} sqs queue: {} messages received: {}'.format(customer_config_record['customerId'],
                                                                                 customer_config_record['AMC']['WFM'][
                                                                                     'amcWorkflowExecutionSQSQueueName'],
                                                                                 messages_received_count))
-        for message in messages_received:
+        if messages_received_count == 0:
+            break
+        messages_received += messages_received_batch
+
+        for message in messages_received_batch:
             customerId = ''
             workflowId = ''
             runWorkflowResponse = {}
             runWorkflowRequest = {}
+
+            if throttled:
+                # make the message visible again so it is picked up by the next run instead of waiting for the visibility timeout
+                message.change_visibility(VisibilityTimeout=0)
+                continue
+
             if message.message_attributes is not None:
                 customerId = message.message_attributes.get('customerId').get('StringValue')
                 workflowId = message.message_attributes.get('workflowId').get('StringValue')
@@ -381,13 +426,24 @@ def process_queue(customer_config_record):
                     'payload': messageBody['payload']
                 }
 
+                executions_attempted += 1
                 runWorkflowResponse = executeWorkflow(customer_config_record, runWorkflowRequest.copy())
                 logger.info('runWorkflowResponse:{}'.format(runWorkflowResponse))
 
                 workflow_execution_responses.append(runWorkflowResponse.copy())
                 workflow_execution_response_codes.append(runWorkflowResponse['statusCode'])
 
+                if runWorkflowResponse['statusCode'] == 429:
+                    throttled = True
+                    logger.info('customerId: {} AMC throttled the execution request, stopping submissions'.format(
+                        customer_config_record['customerId']))
+                    if admission_controller is not None:
+                        admission_controller.record_throttle(customer_config_record)
+                    # the message and the later messages of its group are received again after the backoff
+                    message.change_visibility(VisibilityTimeout=get_throttle_backoff_seconds(message.receive_count))
+
                 if runWorkflowResponse['statusCode'] == 200:
+                    executions_succeeded += 1
                     workflowExecutionId = runWorkflowResponse['body']['workflowExecutionId']
                     executions_submitted.append(
                         {"customerId": customerId, 'workflowId:': workflowId, "executionId": workflowExecutionId,
@@ -412,12 +468,18 @@ def process_queue(customer_config_record):
                         log_messages.append(message)
                         logger.error(message)
 
+    if admission_controller is not None:
+        admission_controller.record_success(customer_config_record, executions_succeeded)
+        admission_controller.release_unused(customer_config_record, executions_admitted - executions_attempted)
+
     return ({
         'statusCode': max(workflow_execution_response_codes),
         'customerId': customer_config_record['customerId'],
         'amcApiEndpoint': customer_config_record['AMC']['amcApiEndpoint'],
         'messages': log_messages,
         'executionsAvailable': executions_available_result['executionsAvailable'],
+        'executionsAdmitted': executions_admitted,
+        'throttled': throttled,
         'executionsRunning': executions_available_result['executionsRunning'],
         'executionsPending': executions_available_result['executionsPending'],
         'messagesReceived': len(messages_received),
@@ -428,24 +490,146 @@ def process_queue(customer_config_record):
     })
 
 
+# returns the records of the batch that have to be received again, the message is kept invisible for
+# EXECUTION_SLOT_WAIT_SECONDS so it is not redelivered before executions are likely to be available again
+def defer_records(queue_url, records):
+    wait_seconds = int(os.environ.get('EXECUTION_SLOT_WAIT_SECONDS', DEFAULT_EXECUTION_SLOT_WAIT_SECONDS))
+    for record in records:
+        try:
+            sqs_client.change_message_visibility(QueueUrl=queue_url, ReceiptHandle=record['receiptHandle'],
+                                                 VisibilityTimeout=wait_seconds)
+        except Exception as e:
+            # the message is received again once the queue visibility timeout expires
+            logger.error('unable to extend the visibility of message {} error {}'.format(record['messageId'], e))
+    return [{'itemIdentifier': record['messageId']} for record in records]
+
+
+# disables the event source mapping of the queue while the customer has no free execution slots. Every time a deferred
+# record is received again it counts towards the maximum receive count of the queue, so the mapping stops receiving
+# until the scheduled poller enables it again with resume_event_source_mapping
+def pause_event_source_mapping(queue_arn):
+    try:
+        if wfm_execution_queue.set_event_source_mapping_enabled(lambda_client, queue_arn,
+                                                                os.environ['AWS_LAMBDA_FUNCTION_NAME'], False):
+            logger.info('paused the event source mapping of queue {}'.format(queue_arn))
+    except Exception as e:
+        logger.error('unable to pause the event source mapping of queue {} error {}'.format(queue_arn, e))
+
+
+# enables the paused event source mapping of a customer once executions are available again
+def resume_event_source_mapping(customer_config):
+    queue_arn = wfm_execution_queue.get_queue_arn(sqs_client,
+                                                  customer_config['AMC']['WFM']['amcWorkflowExecutionSQSQueueName'])
+    function_name = os.environ['WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME']
+    mapping = wfm_execution_queue.get_event_source_mapping(lambda_client, queue_arn, function_name)
+    if mapping is None or mapping['State'] != 'Disabled':
+        return False
+    if get_number_of_executions_available(customer_config)['executionsAvailable'] <= 0:
+        return False
+    resumed = wfm_execution_queue.set_event_source_mapping_enabled(lambda_client, queue_arn, function_name, True)
+    if resumed:
+        logger.info('customerId: {} resumed the event source mapping of queue {}'.format(
+            customer_config['customerId'], queue_arn))
+    return resumed
+
+
+# submits the executions of a batch delivered by the SQS event source mapping of a customer execution queue.
+# Successful records are deleted by the event source mapping, the records that could not be submitted because no
+# execution slots were available or AMC throttled are deferred and reported as batch item failures, and the mapping is
+# paused until executions are available. Once a record is not submitted every later record of the batch is reported as
+# well, so the order of the FIFO message groups is kept.
+def process_queue_records(records):
+    queue_url = wfm_execution_queue.get_queue_url(sqs_client, records[0]['eventSourceARN'].split(':')[-1])
+    customer_id = records[0]['messageAttributes']['customerId']['stringValue']
+    customer_config_record = customer_config_cache.get(customer_id)
+    if customer_config_record is None:
+        logger.error('no customer config found for customerId {}, {} executions not submitted'.format(
+            customer_id, len(records)))
+        return {'batchItemFailures': [{'itemIdentifier': record['messageId']} for record in records]}
+
+    executions_available = get_number_of_executions_available(customer_config_record)['executionsAvailable']
+    executions_admitted = min(executions_available, len(records))
+    if admission_controller is not None:
+        executions_admitted = admission_controller.admit(customer_config_record, executions_admitted)
+
+    executions_attempted = 0
+    executions_succeeded = 0
+    batch_item_failures = []
+    # the admitted executions are accounted for even if a record raises, otherwise the admitted tokens would leak
+    try:
+        for index, record in enumerate(records):
+            if executions_attempted >= executions_admitted:
+                logger.info('customerId: {} no execution slots available, deferring {} executions'.format(
+                    customer_id, len(records) - index))
+                batch_item_failures += defer_records(queue_url, records[index:])
+                pause_event_source_mapping(records[0]['eventSourceARN'])
+                break
+
+            workflow_id = record['messageAttributes']['workflowId']['stringValue']
+            logger.info('Recevied Run request for customerId: {} workflowId: {} Body: {}'.format(
+                customer_id, workflow_id, record['body']))
+            runWorkflowRequest = {
+                'workflowId': workflow_id,
+                'customerConfig': customer_config_record,
+                'amcApiEndpoint': customer_config_record['AMC']['amcApiEndpoint'],
+                'payload': json.loads(record['body'])['payload']
+            }
+
+            executions_attempted += 1
+            runWorkflowResponse = executeWorkflow(customer_config_record, runWorkflowRequest)
+            if runWorkflowResponse['statusCode'] == 200:
+                executions_succeeded += 1
+                try:
+                    updateExeuctionTrackingTable(customer_config_record, runWorkflowResponse['body'])
+                except Exception as e:
+                    # the execution was submitted, retrying the record would submit it to AMC again. The status
+                    # sync adds the execution to the tracking table from the AMC API
+                    logger.error('customerId: {} unable to add execution {} to the tracking table error {}'.format(
+                        customer_id, runWorkflowResponse['body'].get('workflowExecutionId'), e))
+                continue
+
+            if runWorkflowResponse['statusCode'] == 429:
+                logger.info('customerId: {} AMC throttled the execution request, deferring {} executions'.format(
+                    customer_id, len(records) - index))
+                if admission_controller is not None:
+                    admission_controller.record_throttle(customer_config_record)
+                batch_item_failures += defer_records(queue_url, records[index:])
+                pause_event_source_mapping(records[0]['eventSourceARN'])
+            else:
+                # the failed record is received again after the queue visibility timeout and moves to the dead
+                # letter queue once its maximum receive count is reached
+                batch_item_failures += [{'itemIdentifier': remaining_record['messageId']} for remaining_record in
+                                        records[index:]]
+            break
+    finally:
+        if admission_controller is not None:
+            admission_controller.record_success(customer_config_record, executions_succeeded)
+            admission_controller.release_unused(customer_config_record, executions_admitted - executions_attempted)
+
+    logger.info('customerId: {} records: {} executions submitted: {} records returned to the queue: {}'.format(
+        customer_id, len(records), executions_succeeded, len(batch_item_failures)))
+    return {'batchItemFailures': batch_item_failures}
+
+
+@wfm_amc_api_metrics.log_amc_api_metrics
 def lambda_handler(event, context):
     logger.info('event received {}'.format(event))
-    customers_dynamodb_table_name = os.environ['CUSTOMERS_DYNAMODB_TABLE']
+
+    if 'Records' in event:
+        if len(event['Records']) == 0:
+            return {'batchItemFailures': []}
+        return process_queue_records(event['Records'])
 
     if 'method' in event:
         if event['method'].lower() == 'getexecutionsavailable':
             if 'customerId' in event:
-                get_customer_config_records_results = wfmutils.dynamodb_get_customer_config_records(
-                    customers_dynamodb_table_name, event['customerId'])
-                customer_config = get_customer_config_records_results[event['customerId']]
+                customer_config = customer_config_cache.get_many([event['customerId']])[event['customerId']]
                 return (get_number_of_executions_available(customer_config))
 
     if 'method' in event:
         if event['method'].lower() == 'getrunningandpendingexecutions':
             if 'customerId' in event:
-                get_customer_config_records_results = wfmutils.dynamodb_get_customer_config_records(
-                    customers_dynamodb_table_name, event['customerId'])
-                customer_config = get_customer_config_records_results[event['customerId']]
+                customer_config = customer_config_cache.get_many([event['customerId']])[event['customerId']]
                 return (get_running_and_pending_executions(customer_config))
 
     results = []
@@ -459,9 +643,7 @@ def lambda_handler(event, context):
                     logger.info(process_queue_results)
                     return process_queue_results
                 else:
-                    get_customer_config_records_results = wfmutils.dynamodb_get_customer_config_records(
-                        customers_dynamodb_table_name, event['customerId'])
-                    customer_config = get_customer_config_records_results[event['customerId']]
+                    customer_config = customer_config_cache.get_many([event['customerId']])[event['customerId']]
                     process_queue_results = process_queue(customer_config)
                     logger.info(process_queue_results)
                     return (process_queue_results)
@@ -473,7 +655,7 @@ def lambda_handler(event, context):
             results = []
             all_workflow_execution_response_codes = [200]
             logger.info('No method specified, Consuming All queues')
-            customer_config_records = wfmutils.dynamodb_get_customer_config_records(customers_dynamodb_table_name)
+            customer_config_records = customer_config_cache.get_all()
 
             for customer_id in customer_config_records:
                 results.append(get_number_of_executions_available(customer_config_records[customer_id]))
@@ -482,8 +664,18 @@ def lambda_handler(event, context):
     results = []
     all_workflow_execution_response_codes = [200]
     logger.info('No method specified, Consuming All queues')
-    customer_config_records = wfmutils.dynamodb_get_customer_config_records(customers_dynamodb_table_name)
+    customer_config_records = customer_config_cache.get_all()
     for customer_id in customer_config_records:
+        # the queues of these customers are consumed by their SQS event source mapping, which is resumed here once
+        # it was paused because the customer had no free execution slots
+        if wfm_execution_queue.get_consumption_mode(
+                customer_config_records[customer_id]) == wfm_execution_queue.EVENT_SOURCE_CONSUMPTION_MODE:
+            try:
+                resume_event_source_mapping(customer_config_records[customer_id])
+            except Exception as e:
+                logger.error('customerId: {} unable to resume the event source mapping error {}'.format(
+                    customer_id, e))
+            continue
         invoke_process_queue_results = invoke_consume_queue(customer_config_records[customer_id])
         results.append(invoke_process_queue_results.copy())
         all_workflow_execution_response_codes.append(invoke_process_queue_results['statusCode'])
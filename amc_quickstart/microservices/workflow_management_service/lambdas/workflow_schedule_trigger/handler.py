@@ -18,13 +18,15 @@ import os
 import boto3
 from botocore.exceptions import ClientError
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from datetime import datetime
+from wfm import wfm_utils, wfm_batch_writer, wfm_schedule_index, wfm_schedule_expressions
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
 
 client = boto3.client('events')
 lambdaClient = boto3.client('lambda')
+dynamodb_resource_client = wfm_batch_writer.get_dynamodb_resource_client()
 
 
 def get_targets_for_rule(rule):
@@ -95,6 +97,18 @@ def delete_rule(rule):
     return response
 
 
+def delete_rule_if_exists(rule):
+    try:
+        return delete_rule(rule)
+    except client.exceptions.ResourceNotFoundException:
+        logger.info('rule {} does not exist, nothing to remove'.format(rule['Name']))
+
+
+def is_legacy_eventbridge_schedules():
+    # when enabled cron schedules are run by their own EventBridge rule instead of the CustomScheduler tick
+    return os.environ.get('LEGACY_EVENTBRIDGE_SCHEDULES', 'false').lower() == 'true'
+
+
 def remove_targets(rule):
     target_for_rule_response = get_targets_for_rule(rule)
     logger.info('target_for_rule_response {}'.format(target_for_rule_response))
@@ -225,8 +239,25 @@ def lambda_handler(event, context):
 
             if 'customerId' not in old_record["Input"]:
                 old_record["Input"]['customerId'] = old_record['customerId']
+
+        if newimgexist == 1:
+            # keep the schedule's index attributes in line with its expression and state
+            wfm_schedule_index.update_schedule_index(
+                dynamodb_resource_client, os.environ['WORKFLOW_SCHEDULE_TABLE'], new_record, datetime.utcnow(), logger,
+                previous_schedule=old_record if oldimgexist == 1 else None,
+                legacy_eventbridge_schedules=is_legacy_eventbridge_schedules())
         
-        if ( newimgexist == 1 and 'cron' in new_record["ScheduleExpression"] ):
+        if ( newimgexist == 1 and 'cron' in new_record["ScheduleExpression"] and not is_legacy_eventbridge_schedules() ):
+            try:
+                wfm_schedule_expressions.parse_schedule_expression(new_record["ScheduleExpression"])
+            except ValueError as e:
+                logger.error('schedule {} for customerId {} is not valid: {}'.format(new_record['Name'], new_record['customerId'], e))
+
+            # cron schedules are run by the CustomScheduler tick, remove the rule the schedule had before it was indexed
+            if oldimgexist == 0 or old_record.get(wfm_schedule_index.NEXT_FIRE_TIME_ATTRIBUTE) is None:
+                delete_rule_if_exists(new_record)
+
+        elif ( newimgexist == 1 and 'cron' in new_record["ScheduleExpression"] ):
             if record['eventName'] == 'INSERT':
                 logger.info(new_record)
                 rule_result = update_rule(new_record)
@@ -265,14 +296,14 @@ def lambda_handler(event, context):
             function_name = os.environ['EXECUTION_QUEUE_PRODUCER_LAMBA_ARN'].split(':')[-1]
 
             statement_id = '{}'.format(old_record['Name'])
-            delete_rule_result = delete_rule(old_record)
+            delete_rule_result = delete_rule_if_exists(old_record)
         
         elif (record['eventName'] == 'REMOVE' and oldimgexist == 1 and 'cron' in old_record["ScheduleExpression"]) :
             logger.info('REMOVING : {}'.format(old_record))
             function_name = os.environ['EXECUTION_QUEUE_PRODUCER_LAMBA_ARN'].split(':')[-1]
 
             statement_id = '{}'.format(old_record['Name'])
-            delete_rule_result = delete_rule(old_record)
+            delete_rule_result = delete_rule_if_exists(old_record)
             
 
     return {'statusCode': 200}
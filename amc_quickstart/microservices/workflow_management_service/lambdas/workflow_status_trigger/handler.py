@@ -18,48 +18,113 @@
 # Author: Joshua Witt jwittaws@amazon.com
 # Description:
 # This lambda is a trigger for the workflow status table to send sns notifications when certain statuses appear on workflow execution records
+# The status changes of a stream batch are grouped by customer and SNS topic and sent as digest messages with PublishBatch
 
 import boto3
 import json
 import os
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_config_cache
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
+customer_config_cache = wfm_config_cache.get_customer_config_cache(wfmutils)
+
+DEFAULT_DIGEST_MAX_EXECUTIONS = 50
+# leaves room for the subject of the digest within the 256 KB an SNS message or PublishBatch request can hold
+DIGEST_MAX_MESSAGE_BYTES = wfm_utils.SNS_MAX_BATCH_BYTES - 1024
+
+# returns the execution records of the batch whose status changed to a status that is not ignored, the latest record
+# of each execution is kept when the same execution changed several times in the batch
+def get_status_changes(records):
+    ignore_status_list = os.environ['IGNORE_STATUS_LIST'].split(',')
+    status_changes = {}
+    for record in records:
+        if 'dynamodb' not in record or 'NewImage' not in record['dynamodb'] or 'S' not in record['dynamodb'][
+                'NewImage'].get('executionStatus', {}):
+            continue
+        new_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage'])
+        if new_record['executionStatus'] in ignore_status_list:
+            continue
+        old_status = record['dynamodb'].get('OldImage', {}).get('executionStatus', {}).get('S')
+        if old_status == new_record['executionStatus']:
+            continue
+        status_changes[(new_record['customerId'], new_record['workflowExecutionId'])] = new_record
+    return list(status_changes.values())
+
+
+def get_execution_message(execution):
+    return 'Execution {} for workflow {} created on {} for time window {} to {} status is {}'.format(
+        execution['workflowExecutionId'], execution['workflowId'], execution.get('createTime'),
+        execution.get('timeWindowStart'), execution.get('timeWindowEnd'), execution['executionStatus'])
+
+
+# splits the executions into digests of at most DIGEST_MAX_EXECUTIONS executions whose message fits in one SNS message
+def get_digest_executions(executions):
+    max_executions = int(os.environ.get('DIGEST_MAX_EXECUTIONS', DEFAULT_DIGEST_MAX_EXECUTIONS))
+    digests = [[]]
+    digest_bytes = 0
+    for execution in executions:
+        # the line of the execution and its newline
+        execution_bytes = len(get_execution_message(execution).encode('utf-8')) + 1
+        if len(digests[-1]) == max_executions or (
+                len(digests[-1]) > 0 and digest_bytes + execution_bytes > DIGEST_MAX_MESSAGE_BYTES):
+            digests.append([])
+            digest_bytes = 0
+        digests[-1].append(execution)
+        digest_bytes += execution_bytes
+    return [digest_executions for digest_executions in digests if len(digest_executions) > 0]
+
+
+# builds the (subject, message) digests for the status changes of one customer
+def get_digest_messages(customer_id, executions):
+    messages = []
+    for digest_executions in get_digest_executions(executions):
+        if len(digest_executions) == 1:
+            subject = '{} Execution {}'.format(digest_executions[0]['workflowId'],
+                                               digest_executions[0]['executionStatus'])
+        else:
+            status_counts = {}
+            for execution in digest_executions:
+                status_counts[execution['executionStatus']] = status_counts.get(execution['executionStatus'], 0) + 1
+            subject = '{} {} Executions {}'.format(customer_id, len(digest_executions), ', '.join(
+                '{} {}'.format(count, status) for status, count in sorted(status_counts.items())))
+        messages.append((subject, '\n'.join(get_execution_message(execution) for execution in digest_executions)))
+    return messages
+
 
 def lambda_handler(event, context):
 
-    logger.info('event: {}'.format(event))
-    snsResultMessage = ''
-    result=''
-
-    for record in event['Records']:
-        dynamodbTable = record['eventSourceARN'].split('/')[1]
-
-        if 'dynamodb' in record and 'NewImage' in record['dynamodb'] and 'executionStatus' in record['dynamodb'][
-            'NewImage'] and 'S' in record['dynamodb']['NewImage']['executionStatus']:
-            newRecord = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage'])
-
-            if newRecord['executionStatus'] not in os.environ['IGNORE_STATUS_LIST'].split(','):
-                customerConfigs = wfmutils.dynamodb_get_customer_config_records(
-                    os.environ['CUSTOMERS_DYNAMODB_TABLE'])
-
-                if newRecord['customerId'] in customerConfigs:
-                    config = customerConfigs[newRecord['customerId']]
-                    subject = '{} Execution {}'.format(newRecord['workflowId'], newRecord['executionStatus'])
-                    message = 'Execution {} for workflow {} created on {} for time window {} to {} status is {} event info: {}'.format(
-                        newRecord['workflowExecutionId'], newRecord['workflowId'], newRecord['createTime'],
-                        newRecord['timeWindowStart'], newRecord['timeWindowEnd'], newRecord['executionStatus'],
-                        json.dumps(record))
-                    result = wfmutils.sns_publish_message( config['AMC']['WFM']['snsTopicArn'], subject, message)
-                    print(result)
-                    if result['ResponseMetadata']['HTTPStatusCode'] == 200:
-                        snsResultMessage = "Successfully sent subject {} and message {} to SNS topic {} \n sns Response: {}".format(
-                            subject, message, config['AMC']['WFM']['snsTopicArn'], result)
-                        logger.info(snsResultMessage)
-                    else:
-                        snsResultMessage = "Failed to sent subject {} and message {} to SNS topic {} \n sns Response: {}".format(
-                            subject, message, config['AMC']['WFM']['snsTopicArn'], result)
-                        logger.error(snsResultMessage)
-    return {"message": snsResultMessage, "result": result}
+    logger.info('received {} records'.format(len(event['Records'])))
+    status_changes = get_status_changes(event['Records'])
+
+    # group the status changes by the SNS topic and customer they are sent to
+    digests = {}
+    for execution in status_changes:
+        config = customer_config_cache.get(execution['customerId'])
+        if config is None:
+            logger.info('no customer config found for customerId {}'.format(execution['customerId']))
+            continue
+        topic_arn = config['AMC']['WFM']['snsTopicArn']
+        digests.setdefault(topic_arn, {}).setdefault(execution['customerId'], []).append(execution)
+
+    results = []
+    messages_sent = 0
+    messages_failed = 0
+    for topic_arn in digests:
+        messages = []
+        for customer_id in digests[topic_arn]:
+            messages += get_digest_messages(customer_id, digests[topic_arn][customer_id])
+
+        for response in wfmutils.sns_publish_message_batch(topic_arn, messages):
+            messages_sent += len(response.get('Successful', []))
+            messages_failed += len(response.get('Failed', []))
+            for failed in response.get('Failed', []):
+                logger.error('Failed to send subject {} to SNS topic {} error {} {}'.format(
+                    messages[int(failed['Id'])][0], topic_arn, failed.get('Code'), failed.get('Message')))
+            results.append(response)
+
+    snsResultMessage = 'sent {} digest messages for {} status changes, {} messages failed'.format(
+        messages_sent, len(status_changes), messages_failed)
+    logger.info(snsResultMessage)
+    return {"message": snsResultMessage, "result": results}
@@ -17,57 +17,195 @@
 # File Name: WorkflowTableTrigger.py
 # Author: Joshua Witt jwittaws@amazon.com
 # Description:
-# The Lambda function invokes the AMC API lambda to perform CRUD operations on workflows based upon the workflow table.
+# The Lambda function performs CRUD operations on AMC workflows based upon the workflow table.
+# All records of a stream batch are processed, repeated changes to the same workflow are coalesced into one AMC API
+# request and the requests are sent concurrently to the customers' AMC endpoints with the asyncio AMC API interface.
+# Only the failed records are reported back to the event source mapping so that they are retried.
 
-import boto3
-import json
+import asyncio
 import os
 from aws_lambda_powertools import Logger
-from wfm import wfm_utils
+from wfm import wfm_utils, wfm_config_cache, wfm_batch_writer, wfm_workflow_definitions
+from amc_api_interface import wfm_amc_api_async, wfm_amc_api_metrics
 
 logger = Logger(service="WorkFlowManagement", level="INFO")
 wfmutils = wfm_utils.Utils(logger)
+customer_config_cache = wfm_config_cache.get_customer_config_cache(wfmutils)
+dynamodb_resource_client = wfm_batch_writer.get_dynamodb_resource_client()
 
+DEFAULT_WORKFLOW_SYNC_WORKERS = 4
 
-def invoke_amc_api(customer_id, payload, method='createWorkflow'):
-    # create an event that will be sent to the email-s3-file lambda
-    client = boto3.client('lambda')
-    logger.info('function name: {}'.format(os.environ['AMC_API_INTERFACE_FUNCTION_NAME']))
-    lambda_invoke_response = client.invoke(
-        FunctionName=os.environ['AMC_API_INTERFACE_FUNCTION_NAME'],
-        InvocationType='Event',
-        Payload=bytes(json.dumps(
-            {
-                'customerId': customer_id,
-                'method': method,
-                'payload': payload
-            }, default=wfmutils.json_encoder_default
-        ), 'utf-8')
-    )
 
-    logger.info('response payload: {}'.format(lambda_invoke_response))
-    return lambda_invoke_response
+class WorkflowChange:
+    def __init__(self, customer_id, workflow_id):
+        self.customer_id = customer_id
+        self.workflow_id = workflow_id
+        self.method = None
+        self.payload = None
+        self.sequence_numbers = []
+        # content hash of the definition AMC last accepted for the workflow, None if it is not known to exist in AMC
+        self.synced_content_hash = None
+        self.content_hash = None
 
+    # applies the next stream record for the workflow, the method sent to AMC is the one that gets the workflow from
+    # its state before the batch to its state after the last record
+    def apply(self, event_name, record, sequence_number, old_record=None):
+        self.sequence_numbers.append(sequence_number)
+        self.payload = record
+        content_hash_attribute = wfm_workflow_definitions.CONTENT_HASH_ATTRIBUTE
+        if content_hash_attribute in record:
+            self.synced_content_hash = record[content_hash_attribute]
+        elif old_record is not None and content_hash_attribute in old_record:
+            # the record was replaced by a put without the hash, the definition AMC has is still the old one
+            self.synced_content_hash = old_record[content_hash_attribute]
+        if event_name == 'INSERT':
+            self.method = 'createWorkflow' if self.method != 'deleteWorkflow' else 'updateWorkflow'
+        elif event_name == 'MODIFY':
+            self.method = 'createWorkflow' if self.method == 'createWorkflow' else 'updateWorkflow'
+        elif event_name == 'REMOVE':
+            # a workflow created and removed within the batch never needs to reach AMC
+            self.method = None if self.method == 'createWorkflow' else 'deleteWorkflow'
 
-def lambda_handler(event, context):
-
-    logger.info('event: {}'.format(event))
-    for record in event['Records']:
-        logger.info('dynamoDB Record: {}'.format(record))
 
-        if 'dynamodb' in record and 'NewImage' in record['dynamodb']:
-            new_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage'])
-            logger.info('NewRecord:{}'.format(new_record))
-        if 'dynamodb' in record and 'OldImage' in record['dynamodb']:
+# coalesces the stream records into one change per workflow, in the order the workflows were first changed
+def get_workflow_changes(records):
+    workflow_changes = {}
+    for record in records:
+        if 'dynamodb' not in record:
+            continue
+        old_record = None
+        if 'OldImage' in record['dynamodb']:
             old_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['OldImage'])
+        if 'NewImage' in record['dynamodb']:
+            workflow_record = wfmutils.deseralize_dynamodb_item(record['dynamodb']['NewImage'])
+        else:
+            workflow_record = old_record
+
+        key = (workflow_record['customerId'], workflow_record['workflowId'])
+        if key not in workflow_changes:
+            workflow_changes[key] = WorkflowChange(*key)
+        workflow_changes[key].apply(record['eventName'], workflow_record, record['dynamodb']['SequenceNumber'],
+                                    old_record)
+    return list(workflow_changes.values())
+
+
+# drops the changes that do not change the definition AMC already has and updates workflows known to exist in AMC
+# without trying to create them first
+def skip_unchanged_workflow_definitions(workflow_changes):
+    changes_to_send = []
+    for workflow_change in workflow_changes:
+        if workflow_change.method in ['createWorkflow', 'updateWorkflow']:
+            workflow_change.content_hash = wfm_workflow_definitions.get_workflow_content_hash(workflow_change.payload)
+            if workflow_change.content_hash == workflow_change.synced_content_hash:
+                logger.info('definition of workflow {} customerId {} is unchanged, skipping {}'.format(
+                    workflow_change.workflow_id, workflow_change.customer_id, workflow_change.method))
+                continue
+            if workflow_change.synced_content_hash is not None:
+                workflow_change.method = 'updateWorkflow'
+        changes_to_send.append(workflow_change)
+    return changes_to_send
+
+
+# stores the hash of the definition AMC accepted on the workflow record, the record is not recreated if it was removed
+def save_workflow_content_hash(workflow_change):
+    try:
+        dynamodb_resource_client.update_item(
+            TableName=os.environ['WORKFLOWS_TABLE_NAME'],
+            Key={'customerId': workflow_change.customer_id, 'workflowId': workflow_change.workflow_id},
+            UpdateExpression='SET #hash = :hash',
+            ConditionExpression='attribute_exists(workflowId)',
+            ExpressionAttributeNames={'#hash': wfm_workflow_definitions.CONTENT_HASH_ATTRIBUTE},
+            ExpressionAttributeValues={':hash': workflow_change.content_hash}
+        )
+    except dynamodb_resource_client.exceptions.ConditionalCheckFailedException:
+        logger.info('workflow {} customerId {} was removed before its content hash was saved'.format(
+            workflow_change.workflow_id, workflow_change.customer_id))
+    except Exception as e:
+        # the next change to the workflow is sent to AMC again
+        logger.error('unable to save content hash for workflow {} customerId {} error {}'.format(
+            workflow_change.workflow_id, workflow_change.customer_id, e))
+
+
+async def send_workflow_change(amc_api, workflow_change):
+    payload = wfm_workflow_definitions.remove_sync_attributes(workflow_change.payload)
+    if workflow_change.method == 'createWorkflow':
+        return await amc_api.create_workflow(payload)
+    if workflow_change.method == 'updateWorkflow':
+        return await amc_api.update_workflow(payload)
+    return await amc_api.delete_workflow(payload)
+
+
+async def process_workflow_change(amc_api, workflow_change):
+    try:
+        result = await send_workflow_change(amc_api, workflow_change)
+    except Exception as e:
+        result = None
+        logger.error('{} for workflow {} customerId {} failed with error {}'.format(
+            workflow_change.method, workflow_change.workflow_id, workflow_change.customer_id, e))
+
+    if result is None:
+        return False
+
+    logger.info('{} for workflow {} customerId {} returned {}'.format(
+        workflow_change.method, workflow_change.workflow_id, workflow_change.customer_id, result['statusCode']))
+    return True
+
+
+# sends the changes of all customers concurrently, each customer has at most WORKFLOW_SYNC_WORKERS requests in flight
+async def process_workflow_changes(configs, workflow_changes):
+    max_workers = int(os.environ.get('WORKFLOW_SYNC_WORKERS', DEFAULT_WORKFLOW_SYNC_WORKERS))
+    amc_apis = {customer_id: wfm_amc_api_async.AsyncAMCAPIInterface(logger, configs[customer_id], max_workers) for
+                customer_id in configs}
+    return await asyncio.gather(*[process_workflow_change(amc_apis[workflow_change.customer_id], workflow_change)
+                                  for workflow_change in workflow_changes])
+
+
+# the notifications are sent after all requests completed
+def notify_failed_workflow_change(config, workflow_change):
+    message = 'Failed to {} {} for customerId {}'.format(workflow_change.method, workflow_change.workflow_id,
+                                                          workflow_change.customer_id)
+    try:
+        wfmutils.sns_publish_message(config['AMC']['WFM']['snsTopicArn'], message, message)
+    except Exception as e:
+        logger.error('unable to send notification {} error {}'.format(message, e))
+
+
+@wfm_amc_api_metrics.log_amc_api_metrics
+def lambda_handler(event, context):
+
+    logger.info('received {} records'.format(len(event['Records'])))
+    workflow_changes = [workflow_change for workflow_change in get_workflow_changes(event['Records']) if
+                        workflow_change.method is not None]
+    changed_workflows = len(workflow_changes)
+    workflow_changes = skip_unchanged_workflow_definitions(workflow_changes)
+    configs = customer_config_cache.get_many([workflow_change.customer_id for workflow_change in workflow_changes])
 
-        if record['eventName'] == 'INSERT':
-            invoke_lambda_response = invoke_amc_api(new_record['customerId'], new_record, 'createWorkflow')
+    failed_sequence_numbers = []
+    failed_changes = 0
+    changes_to_send = []
+    for workflow_change in workflow_changes:
+        if workflow_change.customer_id not in configs:
+            logger.error('no customer config found for customerId {}, workflow {} can not be synced'.format(
+                workflow_change.customer_id, workflow_change.workflow_id))
+            failed_sequence_numbers += workflow_change.sequence_numbers
+            failed_changes += 1
+        else:
+            changes_to_send.append(workflow_change)
 
-        if record['eventName'] == 'MODIFY':
-            invoke_lambda_response = invoke_amc_api(new_record['customerId'], new_record, 'updateWorkflow')
+    results = wfm_amc_api_async.run(process_workflow_changes(configs, changes_to_send))
+    for workflow_change, succeeded in zip(changes_to_send, results):
+        if not succeeded:
+            failed_sequence_numbers += workflow_change.sequence_numbers
+            failed_changes += 1
+            notify_failed_workflow_change(configs[workflow_change.customer_id], workflow_change)
+        elif workflow_change.content_hash is not None:
+            save_workflow_content_hash(workflow_change)
 
-        if record['eventName'] == 'REMOVE':
-            invoke_lambda_response = invoke_amc_api(old_record['customerId'], old_record, 'deleteWorkflow')
+    logger.info('synced {} of {} workflow changes from {} records, {} unchanged definitions skipped'.format(
+        len(workflow_changes) - failed_changes, len(workflow_changes), len(event['Records']),
+        changed_workflows - len(workflow_changes)))
 
-        return invoke_lambda_response['ResponseMetadata']['HTTPStatusCode']
+    # the stream is retried from the earliest failed record, records after it that succeeded are sent again
+    if len(failed_sequence_numbers) > 0:
+        return {'batchItemFailures': [{'itemIdentifier': min(failed_sequence_numbers, key=int)}]}
+    return {'batchItemFailures': []}
@@ -0,0 +1,45 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import importlib.util
+import os
+import sys
+
+import pytest
+
+WORKFLOW_MANAGEMENT_SERVICE_DIRECTORY = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# the lambda functions import the wfm modules from the wfm-layer
+sys.path.insert(0, os.path.join(WORKFLOW_MANAGEMENT_SERVICE_DIRECTORY, 'lambda-layers', 'wfm-layer', 'python'))
+
+# the lambda functions create their boto3 clients when they are imported
+os.environ.setdefault('AWS_DEFAULT_REGION', 'us-east-1')
+
+
+# every lambda function has a handler module, they are loaded from their files under a name for each function so
+# the lambdas directory does not have to be on the path, its amc_api_interface function would hide the layer package
+@pytest.fixture(scope='session')
+def load_lambda_handler():
+    handlers = {}
+
+    def load(function_directory):
+        if function_directory not in handlers:
+            spec = importlib.util.spec_from_file_location(
+                '{}_handler'.format(function_directory),
+                os.path.join(WORKFLOW_MANAGEMENT_SERVICE_DIRECTORY, 'lambdas', function_directory, 'handler.py'))
+            handlers[function_directory] = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(handlers[function_directory])
+        return handlers[function_directory]
+
+    return load
@@ -0,0 +1,114 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from botocore.exceptions import ClientError
+from moto import mock_aws
+
+TICK_EVENT = {'tick': True, 'time': '2024-01-01T12:00:00Z'}
+PREVIOUS_NEXT_FIRE_TIME = '2024-01-01T12:00:00'
+ADVANCED_NEXT_FIRE_TIME = '2024-01-02T12:00:00'
+
+
+def get_schedule(customer_id):
+    return {
+        'customerId': customer_id,
+        'Name': 'daily-{}'.format(customer_id),
+        'State': 'ENABLED',
+        'ScheduleExpression': 'cron(0 12 * * ? *)',
+        'Input': {'payload': {'workflowId': 'workflow-1'}},
+        'scheduleShard': '0',
+        'nextFireTime': PREVIOUS_NEXT_FIRE_TIME
+    }
+
+
+def send_payloads(customer_config, payloads):
+    if customer_config['customerId'] == 'customer-2':
+        raise Exception('queue does not exist')
+    return {'customerId': customer_config['customerId'], 'messages_failed_to_send': 0,
+            'messages_sent_successfully': len(payloads), 'statusCode': 200,
+            'responses': [{'HTTPStatusCode': 200, 'MessageId': 'message-1', 'PayloadIndex': 0}]}
+
+
+@pytest.fixture
+def handler(load_lambda_handler, monkeypatch):
+    monkeypatch.setenv('CUSTOMERS_DYNAMODB_TABLE', 'customers')
+    monkeypatch.setenv('WORKFLOW_SCHEDULE_TABLE', 'schedules')
+    handler = load_lambda_handler('custom_scheduler')
+    monkeypatch.setattr(handler, 'customer_config_cache', MagicMock(**{
+        'get_many.side_effect': lambda customer_ids: {customer_id: {'customerId': customer_id} for customer_id in
+                                                      customer_ids}}))
+    monkeypatch.setattr(handler, 'execution_queue_producer', MagicMock(**{'send_payloads.side_effect': send_payloads}))
+    return handler
+
+
+@pytest.fixture
+def schedule_table(handler, monkeypatch):
+    with mock_aws():
+        # the shared clients are created again inside the mock
+        monkeypatch.setattr(handler.wfm_batch_writer, 'dynamodb_resource_client', None)
+        monkeypatch.setattr(handler.wfm_utils, 'dynamodb_client', None)
+        table = boto3.resource('dynamodb').create_table(
+            TableName='schedules',
+            KeySchema=[{'AttributeName': 'customerId', 'KeyType': 'HASH'}, {'AttributeName': 'Name', 'KeyType': 'RANGE'}],
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'} for name in
+                                  ['customerId', 'Name', 'scheduleShard', 'nextFireTime']],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'next-fire-time-index',
+                'KeySchema': [{'AttributeName': 'scheduleShard', 'KeyType': 'HASH'},
+                              {'AttributeName': 'nextFireTime', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }],
+            BillingMode='PAY_PER_REQUEST')
+        for customer_id in ['customer-1', 'customer-2', 'customer-3']:
+            table.put_item(Item=get_schedule(customer_id))
+        yield table
+
+
+def get_next_fire_time(table, customer_id):
+    return table.get_item(Key={'customerId': customer_id, 'Name': 'daily-{}'.format(customer_id)})['Item'][
+        'nextFireTime']
+
+
+class TestTick:
+
+    @staticmethod
+    def test_schedules_that_were_not_sent_are_restored(handler, schedule_table):
+        response = handler.lambda_handler(dict(TICK_EVENT), None)
+
+        assert response['statusCode'] == 500
+        assert get_next_fire_time(schedule_table, 'customer-1') == ADVANCED_NEXT_FIRE_TIME
+        assert get_next_fire_time(schedule_table, 'customer-2') == PREVIOUS_NEXT_FIRE_TIME
+        assert get_next_fire_time(schedule_table, 'customer-3') == ADVANCED_NEXT_FIRE_TIME
+
+    @staticmethod
+    def test_an_advance_error_does_not_drop_the_other_schedules(handler, schedule_table, monkeypatch):
+        advance_next_fire_time = handler.wfm_schedule_index.advance_next_fire_time
+
+        def advance_or_fail(dynamodb_client, table_name, schedule, after, logger):
+            if schedule['customerId'] == 'customer-3':
+                raise ClientError({'Error': {'Code': 'InternalServerError', 'Message': ''}}, 'UpdateItem')
+            return advance_next_fire_time(dynamodb_client, table_name, schedule, after, logger)
+
+        monkeypatch.setattr(handler.wfm_schedule_index, 'advance_next_fire_time', advance_or_fail)
+        handler.lambda_handler(dict(TICK_EVENT), None)
+
+        sent_customers = [call.args[0]['customerId'] for call in
+                          handler.execution_queue_producer.send_payloads.call_args_list]
+        assert sorted(sent_customers) == ['customer-1', 'customer-2']
+        assert get_next_fire_time(schedule_table, 'customer-1') == ADVANCED_NEXT_FIRE_TIME
+        assert get_next_fire_time(schedule_table, 'customer-3') == PREVIOUS_NEXT_FIRE_TIME
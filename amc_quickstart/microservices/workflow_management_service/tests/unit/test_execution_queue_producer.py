@@ -0,0 +1,54 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import MagicMock
+
+import pytest
+
+PAYLOAD = {'workflowId': 'workflow-1', 'timeWindowStart': '2024-01-01T00:00:00', 'timeWindowEnd': '2024-01-02T00:00:00'}
+
+
+@pytest.fixture
+def handler(load_lambda_handler, monkeypatch):
+    monkeypatch.setenv('CUSTOMERS_DYNAMODB_TABLE', 'customers')
+    handler = load_lambda_handler('execution_queue_producer')
+    monkeypatch.setattr(handler, 'customer_config_cache', MagicMock(**{
+        'get_many.side_effect': lambda customer_ids: {customer_id: {'customerId': customer_id} for customer_id in
+                                                      customer_ids if customer_id == 'customer-1'}}))
+    monkeypatch.setattr(handler, 'execution_queue_producer', MagicMock(**{
+        'send_payloads.side_effect': lambda customer_config, payloads: {
+            'customerId': customer_config['customerId'], 'messages_failed_to_send': 0,
+            'messages_sent_successfully': len(payloads), 'statusCode': 200}}))
+    return handler
+
+
+class TestLambdaHandler:
+
+    @staticmethod
+    def test_payloads_are_sent_to_every_customer(handler):
+        response = handler.lambda_handler({'customerId': 'customer-1', 'payload': [dict(PAYLOAD), dict(PAYLOAD)]}, None)
+
+        assert response['statusCode'] == 200
+        assert response['body'] == [{'customerId': 'customer-1', 'messages_failed_to_send': 0,
+                                     'messages_sent_successfully': 2, 'statusCode': 200}]
+
+    @staticmethod
+    def test_missing_customers_are_reported(handler):
+        response = handler.lambda_handler({'customerId': ['customer-1', 'customer-2', 'customer-2'],
+                                           'payload': dict(PAYLOAD)}, None)
+
+        assert response['statusCode'] == 404
+        assert {'customerId': 'customer-2', 'messages_failed_to_send': 1, 'messages_sent_successfully': 0,
+                'statusCode': 404} in response['body']
+        assert len(response['body']) == 2
@@ -0,0 +1,46 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest.mock import MagicMock
+
+import pytest
+
+EVENT = {'startDate': '2024-01-01', 'endDate': '2024-01-04', 'windowSize': 1, 'payload': {'workflowId': 'workflow-1'}}
+
+
+@pytest.fixture
+def handler(load_lambda_handler, monkeypatch):
+    monkeypatch.setenv('CUSTOMERS_DYNAMODB_TABLE', 'customers')
+    handler = load_lambda_handler('generate_data_range')
+    monkeypatch.setattr(handler.wfmutils, 'dynamodb_batch_get_customer_config_records', lambda table_name, customer_ids: {
+        customer_id: {'customerId': customer_id} for customer_id in customer_ids if customer_id == 'customer-1'})
+    monkeypatch.setattr(handler.wfm_execution_queue, 'ExecutionQueueProducer', MagicMock(return_value=MagicMock(**{
+        'send_payloads.side_effect': lambda customer_config, payloads: {
+            'customerId': customer_config['customerId'], 'messages_failed_to_send': 0,
+            'messages_sent_successfully': len(payloads), 'statusCode': 200}})))
+    return handler
+
+
+class TestQueueSpans:
+
+    @staticmethod
+    def test_missing_customers_are_reported(handler):
+        response = handler.lambda_handler(dict(EVENT, customerId=['customer-1', 'customer-2', 'customer-2']), None)
+
+        assert response['statusCode'] == 404
+        assert response['spansGenerated'] == 3
+        assert response['body'] == [
+            {'customerId': 'customer-1', 'messages_sent_successfully': 3, 'messages_failed_to_send': 0},
+            {'customerId': 'customer-2', 'messages_sent_successfully': 0, 'messages_failed_to_send': 3,
+             'statusCode': 404}]
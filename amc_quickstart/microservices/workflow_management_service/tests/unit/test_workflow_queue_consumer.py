@@ -0,0 +1,203 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from unittest.mock import MagicMock
+
+import boto3
+import pytest
+from moto import mock_aws
+
+QUEUE_NAME = 'customer-1-workflowExecution.fifo'
+MAX_RECEIVE_COUNT = 20
+CUSTOMER_CONFIG = {'customerId': 'customer-1', 'AMC': {'amcApiEndpoint': 'https://amc.example.com', 'WFM': {
+    'amcWorkflowExecutionSQSQueueName': QUEUE_NAME, 'executionQueueConsumptionMode': 'eventSource'}}}
+
+
+# the event source mapping of the execution queue, it receives a batch from the queue each time it polls while it is
+# enabled and deletes the records that the consumer did not report as batch item failures
+class EventSourceMapping:
+    def __init__(self, sqs, queue_url, queue_arn):
+        self.sqs = sqs
+        self.queue_url = queue_url
+        self.queue_arn = queue_arn
+        self.state = 'Enabled'
+
+    def list_event_source_mappings(self, EventSourceArn, FunctionName):
+        return {'EventSourceMappings': [{'UUID': 'mapping-1', 'State': self.state}]}
+
+    def update_event_source_mapping(self, UUID, Enabled):
+        self.state = 'Enabled' if Enabled else 'Disabled'
+
+    def poll(self, handler):
+        if self.state != 'Enabled':
+            return
+        messages = self.sqs.receive_message(QueueUrl=self.queue_url, MaxNumberOfMessages=10,
+                                            MessageAttributeNames=['All']).get('Messages', [])
+        if len(messages) == 0:
+            return
+        records = [{
+            'messageId': message['MessageId'],
+            'receiptHandle': message['ReceiptHandle'],
+            'body': message['Body'],
+            'messageAttributes': {name: {'stringValue': attribute['StringValue']} for name, attribute in
+                                  message['MessageAttributes'].items()},
+            'eventSourceARN': self.queue_arn
+        } for message in messages]
+        failures = [failure['itemIdentifier'] for failure in
+                    handler.lambda_handler({'Records': records}, None)['batchItemFailures']]
+        for message in messages:
+            if message['MessageId'] not in failures:
+                self.sqs.delete_message(QueueUrl=self.queue_url, ReceiptHandle=message['ReceiptHandle'])
+
+
+# a FIFO execution queue with a clock that the test moves forward. A message group is not received while one of its
+# messages is in flight and a message received more than max_receive_count times is moved to the dead letter queue
+class ExecutionQueue:
+    def __init__(self, max_receive_count):
+        self.max_receive_count = max_receive_count
+        self.now = 0
+        self.messages = []
+        self.dead_letters = []
+
+    def send_message(self, message_id, workflow_id):
+        self.messages.append({
+            'MessageId': message_id,
+            'ReceiptHandle': message_id,
+            'MessageGroupId': 'amcworkflows',
+            'Body': json.dumps({'customerId': 'customer-1', 'payload': {'workflowId': workflow_id}}),
+            'MessageAttributes': {'customerId': {'StringValue': 'customer-1', 'DataType': 'String'},
+                                  'workflowId': {'StringValue': workflow_id, 'DataType': 'String'}},
+            'receiveCount': 0,
+            'visibleAt': 0
+        })
+
+    def receive_message(self, QueueUrl, MessageAttributeNames, AttributeNames, MaxNumberOfMessages):
+        in_flight_groups = {message['MessageGroupId'] for message in self.messages if message['visibleAt'] > self.now}
+        received = []
+        for message in list(self.messages):
+            if message['MessageGroupId'] in in_flight_groups or len(received) == MaxNumberOfMessages:
+                continue
+            if message['receiveCount'] >= self.max_receive_count:
+                self.messages.remove(message)
+                self.dead_letters.append(message)
+                continue
+            message['receiveCount'] += 1
+            message['visibleAt'] = self.now + 30
+            received.append(dict(message, Attributes={'ApproximateReceiveCount': str(message['receiveCount'])}))
+        return {'Messages': received}
+
+    def change_message_visibility(self, QueueUrl, ReceiptHandle, VisibilityTimeout):
+        for message in self.messages:
+            if message['ReceiptHandle'] == ReceiptHandle:
+                message['visibleAt'] = self.now + VisibilityTimeout
+
+    def delete_message(self, QueueUrl, ReceiptHandle):
+        self.messages = [message for message in self.messages if message['ReceiptHandle'] != ReceiptHandle]
+
+
+@pytest.fixture
+def handler(load_lambda_handler, monkeypatch):
+    monkeypatch.setenv('CUSTOMERS_DYNAMODB_TABLE', 'customers')
+    monkeypatch.setenv('AWS_LAMBDA_FUNCTION_NAME', 'WorkflowExecutionQueueEventConsumer')
+    monkeypatch.setenv('WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME', 'WorkflowExecutionQueueEventConsumer')
+    monkeypatch.setenv('EXECUTION_SLOT_WAIT_SECONDS', '0')
+    handler = load_lambda_handler('workflow_queue_consumer')
+    monkeypatch.setattr(handler, 'admission_controller', None)
+    monkeypatch.setattr(handler, 'customer_config_cache', MagicMock(**{
+        'get.return_value': CUSTOMER_CONFIG, 'get_all.return_value': {'customer-1': CUSTOMER_CONFIG}}))
+    monkeypatch.setattr(handler, 'updateExeuctionTrackingTable', MagicMock())
+    monkeypatch.setattr(handler, 'executeWorkflow', MagicMock(return_value={
+        'statusCode': 200, 'body': {'workflowExecutionId': 'execution-1'}}))
+    return handler
+
+
+@pytest.fixture
+def execution_queue(handler, monkeypatch):
+    with mock_aws():
+        sqs = boto3.client('sqs')
+        dead_letter_queue_url = sqs.create_queue(QueueName='customer-1-workflowExecution-DLQ.fifo',
+                                                 Attributes={'FifoQueue': 'true'})['QueueUrl']
+        dead_letter_queue_arn = sqs.get_queue_attributes(QueueUrl=dead_letter_queue_url, AttributeNames=[
+            'QueueArn'])['Attributes']['QueueArn']
+        queue_url = sqs.create_queue(QueueName=QUEUE_NAME, Attributes={
+            'FifoQueue': 'true',
+            'ContentBasedDeduplication': 'true',
+            'RedrivePolicy': json.dumps({'deadLetterTargetArn': dead_letter_queue_arn,
+                                         'maxReceiveCount': MAX_RECEIVE_COUNT})})['QueueUrl']
+        queue_arn = sqs.get_queue_attributes(QueueUrl=queue_url, AttributeNames=['QueueArn'])['Attributes']['QueueArn']
+        sqs.send_message(QueueUrl=queue_url, MessageGroupId='amcworkflows', MessageBody=json.dumps({
+            'customerId': 'customer-1', 'payload': {'workflowId': 'workflow-1'}}), MessageAttributes={
+            'customerId': {'StringValue': 'customer-1', 'DataType': 'String'},
+            'workflowId': {'StringValue': 'workflow-1', 'DataType': 'String'}})
+
+        mapping = EventSourceMapping(sqs, queue_url, queue_arn)
+        monkeypatch.setattr(handler, 'sqs_client', sqs)
+        monkeypatch.setattr(handler, 'lambda_client', mapping)
+        monkeypatch.setattr(handler.wfm_execution_queue, 'queue_urls', {})
+        monkeypatch.setattr(handler.wfm_execution_queue, 'queue_arns', {})
+        yield mapping, dead_letter_queue_url
+
+
+class TestProcessQueueRecords:
+
+    @staticmethod
+    def test_deferred_records_are_not_dead_lettered_while_saturated(handler, execution_queue, monkeypatch):
+        mapping, dead_letter_queue_url = execution_queue
+        executions_available = {'executionsAvailable': 0}
+        monkeypatch.setattr(handler, 'get_number_of_executions_available', lambda customer_config: dict(
+            executions_available))
+
+        for _ in range(MAX_RECEIVE_COUNT * 3):
+            mapping.poll(handler)
+            handler.lambda_handler({}, None)
+
+        assert mapping.state == 'Disabled'
+        handler.executeWorkflow.assert_not_called()
+
+        executions_available['executionsAvailable'] = 1
+        handler.lambda_handler({}, None)
+        mapping.poll(handler)
+
+        assert mapping.state == 'Enabled'
+        handler.executeWorkflow.assert_called_once()
+        assert mapping.sqs.receive_message(QueueUrl=dead_letter_queue_url).get('Messages', []) == []
+
+
+class TestProcessQueue:
+
+    @staticmethod
+    def test_repeatedly_throttled_executions_are_not_dead_lettered(handler, monkeypatch):
+        execution_queue = ExecutionQueue(MAX_RECEIVE_COUNT)
+        for index in range(3):
+            execution_queue.send_message('message-{}'.format(index), 'workflow-{}'.format(index))
+        monkeypatch.setattr(handler, 'sqs_client', execution_queue)
+        monkeypatch.setattr(handler.wfm_execution_queue, 'queue_urls', {QUEUE_NAME: QUEUE_NAME})
+        monkeypatch.setattr(handler, 'get_number_of_executions_available', lambda customer_config: {
+            'executionsAvailable': 10, 'executionsRunning': 0, 'executionsPending': 0})
+        handler.executeWorkflow.return_value = {'statusCode': 429, 'body': {}}
+
+        # AMC throttles every request for two hours, the scheduled consumer runs every minute
+        for _ in range(120):
+            execution_queue.now += 60
+            handler.process_queue(CUSTOMER_CONFIG)
+
+        assert max(message['receiveCount'] for message in execution_queue.messages) < MAX_RECEIVE_COUNT
+
+        handler.executeWorkflow.return_value = {'statusCode': 200, 'body': {'workflowExecutionId': 'execution-1'}}
+        execution_queue.now += handler.THROTTLE_BACKOFF_MAX_SECONDS
+        handler.process_queue(CUSTOMER_CONFIG)
+
+        assert execution_queue.messages == []
+        assert execution_queue.dead_letters == []
@@ -0,0 +1,157 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pytest
+from boto3.dynamodb.types import TypeSerializer
+
+from wfm import wfm_workflow_definitions
+
+WORKFLOW = {'customerId': 'customer-1', 'workflowId': 'workflow-1', 'sqlQuery': 'SELECT 1'}
+WORKFLOW_CONTENT_HASH = wfm_workflow_definitions.get_workflow_content_hash(WORKFLOW)
+SYNCED_WORKFLOW = dict(WORKFLOW, **{wfm_workflow_definitions.CONTENT_HASH_ATTRIBUTE: WORKFLOW_CONTENT_HASH})
+
+
+def get_stream_record(event_name, sequence_number, new_image=None, old_image=None):
+    serializer = TypeSerializer()
+    stream_record = {'SequenceNumber': str(sequence_number)}
+    if new_image is not None:
+        stream_record['NewImage'] = {key: serializer.serialize(value) for key, value in new_image.items()}
+    if old_image is not None:
+        stream_record['OldImage'] = {key: serializer.serialize(value) for key, value in old_image.items()}
+    return {'eventName': event_name, 'dynamodb': stream_record}
+
+
+@pytest.fixture
+def handler(load_lambda_handler, monkeypatch):
+    monkeypatch.setenv('CUSTOMERS_DYNAMODB_TABLE', 'customers')
+    monkeypatch.setenv('WORKFLOWS_TABLE_NAME', 'workflows')
+    return load_lambda_handler('workflow_table_trigger')
+
+
+class TestGetWorkflowChanges:
+
+    @staticmethod
+    def test_repeated_changes_are_coalesced_into_one_change(handler):
+        updated_workflow = dict(WORKFLOW, sqlQuery='SELECT 2')
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('INSERT', 1, WORKFLOW),
+            get_stream_record('MODIFY', 2, updated_workflow, WORKFLOW)
+        ])
+
+        assert len(workflow_changes) == 1
+        assert workflow_changes[0].method == 'createWorkflow'
+        assert workflow_changes[0].payload == updated_workflow
+        assert workflow_changes[0].sequence_numbers == ['1', '2']
+
+    @staticmethod
+    def test_workflow_created_and_removed_in_the_batch_is_not_sent(handler):
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('INSERT', 1, WORKFLOW),
+            get_stream_record('REMOVE', 2, old_image=WORKFLOW)
+        ])
+
+        assert workflow_changes[0].method is None
+
+    @staticmethod
+    def test_workflow_removed_and_created_again_is_updated(handler):
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('REMOVE', 1, old_image=WORKFLOW),
+            get_stream_record('INSERT', 2, WORKFLOW)
+        ])
+
+        assert workflow_changes[0].method == 'updateWorkflow'
+
+    @staticmethod
+    def test_modified_workflow_is_removed(handler):
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('MODIFY', 1, WORKFLOW, WORKFLOW),
+            get_stream_record('REMOVE', 2, old_image=WORKFLOW)
+        ])
+
+        assert workflow_changes[0].method == 'deleteWorkflow'
+
+    @staticmethod
+    def test_changes_are_kept_per_workflow_in_first_change_order(handler):
+        other_workflow = dict(WORKFLOW, workflowId='workflow-2')
+        other_customer_workflow = dict(WORKFLOW, customerId='customer-2')
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('INSERT', 1, other_workflow),
+            get_stream_record('INSERT', 2, WORKFLOW),
+            get_stream_record('INSERT', 3, other_customer_workflow),
+            get_stream_record('MODIFY', 4, other_workflow, other_workflow)
+        ])
+
+        assert [(change.customer_id, change.workflow_id) for change in workflow_changes] == [
+            ('customer-1', 'workflow-2'), ('customer-1', 'workflow-1'), ('customer-2', 'workflow-1')]
+        assert workflow_changes[0].sequence_numbers == ['1', '4']
+
+
+class TestSkipUnchangedWorkflowDefinitions:
+
+    @staticmethod
+    def test_metadata_change_is_skipped(handler):
+        updated_workflow = dict(SYNCED_WORKFLOW, defaultPayload={'timeWindowType': 'MOST_RECENT_DAY'})
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('MODIFY', 1, updated_workflow, SYNCED_WORKFLOW)
+        ])
+
+        assert handler.skip_unchanged_workflow_definitions(workflow_changes) == []
+
+    @staticmethod
+    def test_definition_change_is_sent_as_an_update(handler):
+        updated_workflow = dict(SYNCED_WORKFLOW, sqlQuery='SELECT 2')
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('MODIFY', 1, updated_workflow, SYNCED_WORKFLOW)
+        ])
+
+        changes_to_send = handler.skip_unchanged_workflow_definitions(workflow_changes)
+        assert len(changes_to_send) == 1
+        assert changes_to_send[0].method == 'updateWorkflow'
+        assert changes_to_send[0].content_hash == wfm_workflow_definitions.get_workflow_content_hash(updated_workflow)
+
+    @staticmethod
+    def test_put_without_the_hash_keeps_the_synced_hash(handler):
+        # a put of the same definition without the hash attribute does not need to be sent to AMC
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('MODIFY', 1, dict(WORKFLOW, description='metadata'), SYNCED_WORKFLOW)
+        ])
+
+        assert handler.skip_unchanged_workflow_definitions(workflow_changes) == []
+
+    @staticmethod
+    def test_workflow_replaced_in_the_batch_is_updated(handler):
+        # the removed record had a hash so the workflow is known to exist in AMC and is not created again
+        updated_workflow = dict(WORKFLOW, sqlQuery='SELECT 2')
+        workflow_changes = handler.get_workflow_changes([
+            get_stream_record('REMOVE', 1, old_image=SYNCED_WORKFLOW),
+            get_stream_record('INSERT', 2, updated_workflow)
+        ])
+
+        changes_to_send = handler.skip_unchanged_workflow_definitions(workflow_changes)
+        assert changes_to_send[0].method == 'updateWorkflow'
+
+    @staticmethod
+    def test_new_workflow_is_created(handler):
+        workflow_changes = handler.get_workflow_changes([get_stream_record('INSERT', 1, WORKFLOW)])
+
+        changes_to_send = handler.skip_unchanged_workflow_definitions(workflow_changes)
+        assert changes_to_send[0].method == 'createWorkflow'
+        assert changes_to_send[0].content_hash == WORKFLOW_CONTENT_HASH
+
+    @staticmethod
+    def test_removed_workflow_is_always_sent(handler):
+        workflow_changes = handler.get_workflow_changes([get_stream_record('REMOVE', 1, old_image=SYNCED_WORKFLOW)])
+
+        changes_to_send = handler.skip_unchanged_workflow_definitions(workflow_changes)
+        assert changes_to_send[0].method == 'deleteWorkflow'
@@ -28,6 +28,7 @@ import aws_cdk.aws_dynamodb as DDB
 from aws_cdk.aws_athena import CfnWorkGroup
 from aws_cdk.aws_s3 import Bucket, IBucket
 from aws_cdk.aws_events import CfnRule
+from aws_cdk.custom_resources import Provider
 from aws_ddk_core.resources import KMSFactory, LambdaFactory
 
 
@@ -132,6 +133,19 @@ class WorkFlowManagerService(BaseStack):
                 },
         )
 
+        self._amc_admission_control_table = self._create_ddb_table(
+            name=f"{self._microservice_name}-{self._team}-AMCAdmissionControl",
+            ddb_props={"partition_key": DDB.Attribute(name="bucketId", type=DDB.AttributeType.STRING)},
+        )
+
+        # Version of the customer config records cached by the lambdas, updated by the CustomerConfigTrigger
+        self._customer_config_cache_version_parameter = StringParameter(
+            self,
+            f"{self._resource_prefix}-{self._microservice_name}-{self._team}-customer-config-cache-version-ssm",
+            parameter_name=f"/AMC/{self._microservice_name}/{self._team}/{self._environment_id}/CustomerConfigCacheVersion",
+            string_value="0",
+        )
+
         # SNS Topic Creation
         self._sns_topic = self._create_sns_topic(topic_name_prefix=f"{self._microservice_name}-{self._team}")
 
@@ -170,42 +184,36 @@ class WorkFlowManagerService(BaseStack):
 
         self._rule_get_glue_status = self._create_cloudwatch_event(
             name = f"{self._microservice_name}-syncExecutionStatuses",
-            description="Runs the amc api interface lambda function every 10 minutes to get all execution statuses",
-            schedule = "rate(10 minutes)",
+            description="Runs the amc api interface lambda function every 5 minutes to sync busy customers execution statuses",
+            schedule = "rate(5 minutes)",
             target_input = '{ "method": "syncExecutionStatuses" }',
             target_function = self._lambda_amc_api_interface
         )
 
-        self._rule_hourly_custom_scheduler = self._create_cloudwatch_event(
-            name = f"{self._microservice_name}-CustomSchedulerOnHourly",
-            description="Runs the CustomScheduler lambda function on hourly",
-            schedule = "rate(1 hour)",
-            target_input = '{"query": "custom(H * *)" }',
-            target_function = self._lambda_custom_scheduler
-        )
-
-        self._rule_daily_custom_scheduler = self._create_cloudwatch_event(
-            name = f"{self._microservice_name}-CustomSchedulerOnDaily",
-            description="Runs the CustomScheduler lambda function on daily",
-            schedule = "rate(1 hour)",
-            target_input = '{"query": "custom(D * {H})" }',
+        # Runs due custom and cron schedules, replaces the per schedule EventBridge rules for cron schedules
+        self._rule_custom_scheduler_tick = self._create_cloudwatch_event(
+            name = f"{self._microservice_name}-CustomSchedulerTick",
+            description="Runs the CustomScheduler lambda function every minute to run the workflow schedules that are due",
+            schedule = "rate(1 minute)",
+            target_input = '{"tick": true}',
             target_function = self._lambda_custom_scheduler
         )
 
-        self._rule_weekly_custom_scheduler = self._create_cloudwatch_event(
-            name = f"{self._microservice_name}-CustomSchedulerOnWeekly",
-            description="Runs the CustomScheduler lambda function on weekly",
-            schedule = "rate(1 hour)",
-            target_input = '{"query": "custom(W {D} {H})" }',
-            target_function = self._lambda_custom_scheduler
+        # Adds the existing schedules to the next fire time index on deploy, the tick only runs schedules that have a
+        # nextFireTime. The rebuild runs again when a property changes
+        self._schedule_index_rebuild_provider = Provider(
+            self,
+            f"{self._microservice_name}-ScheduleIndexRebuildProvider",
+            on_event_handler=self._lambda_custom_scheduler
         )
-
-        self._rule_weekly_custom_scheduler = self._create_cloudwatch_event(
-            name = f"{self._microservice_name}-CustomSchedulerOnMonthly",
-            description="Runs the CustomScheduler lambda function on m onthyl",
-            schedule = "rate(1 hour)",
-            target_input = '{"query": "custom(M {D} {H})" }',
-            target_function = self._lambda_custom_scheduler
+        cdk.CustomResource(
+            self,
+            f"{self._microservice_name}-ScheduleIndexRebuild",
+            service_token=self._schedule_index_rebuild_provider.service_token,
+            properties={
+                "WorkflowScheduleTable": self._amc_workflow_schedules_table.table_name,
+                "LegacyEventBridgeSchedules": "false"
+            }
         )
     
     # SNS Topic Creation
@@ -300,6 +308,14 @@ class WorkFlowManagerService(BaseStack):
                 partition_key=DDB.Attribute(name="ScheduleExpression", type=DDB.AttributeType.STRING),
                 sort_key=DDB.Attribute(name="State", type=DDB.AttributeType.STRING)
             )
+            # sparse index, only schedules run by the CustomScheduler have the scheduleShard and nextFireTime attributes
+            table.add_global_secondary_index(
+                index_name="next-fire-time-index",
+                partition_key=DDB.Attribute(name="scheduleShard", type=DDB.AttributeType.STRING),
+                sort_key=DDB.Attribute(name="nextFireTime", type=DDB.AttributeType.STRING),
+                projection_type=DDB.ProjectionType.INCLUDE,
+                non_key_attributes=["Input", "ScheduleExpression"]
+            )
 
         elif name.split("-")[-1] == "AMCExecutionStatus":
             table: DDB.Table = DDB.Table(
@@ -402,8 +418,11 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
-                "DEFAULT_DYNAMODB_RECORD_UPDATE_BATCH_SIZE": "50",
-                "DEFAULT_DYNAMODB_BATCH_DELAY_SECONDS": "3"
+                "DYNAMODB_WRITE_WORKERS": "4",
+                "DYNAMODB_MAX_WRITE_UNITS_PER_SECOND": "4000",
+                "OUTDATED_EXECUTION_REFRESH_WORKERS": "8",
+                "SYNC_PARALLEL_CUSTOMERS": "4",
+                "AMC_API_REQUESTS_PER_SECOND": "5"
             },
             role=self._sync_workflow_status_role
         )
@@ -421,6 +440,14 @@ class WorkFlowManagerService(BaseStack):
             timeout=cdk.Duration.minutes(15),
             runtime = Runtime.PYTHON_3_8,
             layers = [self._wfm_helper_layer, self._powertools_layer],
+            environment={
+                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "MAX_INLINE_SPANS": "20000",
+                "DEFAULT_QUEUE_CHUNK_SIZE": "1000",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY": "workflowHash",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_COUNT": "8"
+            },
+            role=self._generate_data_range_role
         )
 
         # GenerateExecutionResubmissions
@@ -438,7 +465,10 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
-                "EXECUTION_STATUS_TABLE": self._amc_execution_status_table.table_name
+                "EXECUTION_STATUS_TABLE": self._amc_execution_status_table.table_name,
+                "EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY": "workflowHash",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_COUNT": "8",
+                "REDRIVE_RECEIVERS": "4"
             },
             role=self._generate_resubmission_role
         )
@@ -458,15 +488,20 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER": self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS": "300",
                 "EXECUTION_STATUS_TABLE": self._amc_execution_status_table.table_name,
-                "IGNORE_STATUS_LIST": "PENDING,RUNNING,SUCCEEDED,PUBLISHING"
+                "IGNORE_STATUS_LIST": "PENDING,RUNNING,SUCCEEDED,PUBLISHING",
+                "DIGEST_MAX_EXECUTIONS": "50"
             },
             role=self._workflow_status_trigger_role
         )
 
+        # status changes are collected for up to 30 seconds so executions finishing together are sent as one digest
         workflow_status_trigger.add_event_source_mapping(
             "lambda-ddb-event-source-mapping",
-            batch_size=5,
+            batch_size=100,
+            max_batching_window=cdk.Duration.seconds(30),
             event_source_arn=self._amc_execution_status_table.table_stream_arn,
             starting_position=StartingPosition.TRIM_HORIZON,
             retry_attempts=1
@@ -487,7 +522,9 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
-                "SYNC_WORKFLOW_STATUSES_LAMBDA_FUNCTION_NAME": lambda_sync_workflow_status.function_name
+                "SYNC_WORKFLOW_STATUSES_LAMBDA_FUNCTION_NAME": lambda_sync_workflow_status.function_name,
+                "SYNC_CUSTOMERS_PER_INVOCATION": "5",
+                "IDLE_CUSTOMER_SYNC_INTERVAL_MINUTES": "60"
             },
             role=self._amc_api_interface_role
         )
@@ -501,23 +538,28 @@ class WorkFlowManagerService(BaseStack):
             code=Code.from_asset(os.path.join(f"{Path(__file__).parents[1]}", "workflow_management_service/lambdas/workflow_table_trigger")),
             handler="handler.lambda_handler",
             description="Synchronizes workflow table records from the workflow DyanmoDB table to AMC",
-            memory_size=128,
+            memory_size=512,
             timeout=cdk.Duration.minutes(5),
             runtime = Runtime.PYTHON_3_8,
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
-                "AMC_API_INTERFACE_FUNCTION_NAME": self._lambda_amc_api_interface.function_name,
-                "WORKFLOWS_TABLE_NAME": self._amc_workflows_table.table_name
+                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER": self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS": "300",
+                "WORKFLOWS_TABLE_NAME": self._amc_workflows_table.table_name,
+                "WORKFLOW_SYNC_WORKERS": "4"
             },
             role=self._workflow_table_trigger_role
         )
 
         workflow_table_trigger.add_event_source_mapping(
             "lambda-ddb-event-source-mapping",
-            batch_size=5,
+            batch_size=100,
+            max_batching_window=cdk.Duration.seconds(5),
             event_source_arn=self._amc_workflows_table.table_stream_arn,
             starting_position=StartingPosition.TRIM_HORIZON,
-            retry_attempts=1
+            retry_attempts=1,
+            report_batch_item_failures=True
         )
 
         # WorkflowExecutionQueueConsumer
@@ -534,7 +576,40 @@ class WorkFlowManagerService(BaseStack):
             runtime = Runtime.PYTHON_3_8,
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
-                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name
+                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER": self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS": "300",
+                "ADMISSION_CONTROL_DYNAMODB_TABLE": self._amc_admission_control_table.table_name,
+                "GLOBAL_SUBMISSIONS_PER_SECOND": "10",
+                "GLOBAL_SUBMISSION_BURST_CAPACITY": "50",
+                "RECEIVE_PARALLELISM": "4",
+                "WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME": f"{function_name_prefix}-WorkflowExecutionQueueEventConsumer-{self._environment_id}"
+            },
+            role=self._event_queue_consumer_role
+        )
+
+        # Lambda Workflow Execution Queue Event Consumer, attached by the CustomerConfigTrigger to the execution queues
+        # of the customers that use the eventSource consumption mode
+        lambda_execution_queue_event_consumer = LambdaFactory.function(
+            self,
+            f"{function_name_prefix}-WorkflowExecutionQueueEventConsumer-{self._environment_id}",
+            environment_id = self._environment_id,
+            function_name=f"{function_name_prefix}-WorkflowExecutionQueueEventConsumer-{self._environment_id}",
+            code=Code.from_asset(os.path.join(f"{Path(__file__).parents[1]}", "workflow_management_service/lambdas/workflow_queue_consumer")),
+            handler="handler.lambda_handler",
+            description="Submits the workflow executions delivered by the SQS event source mappings of the execution queues to the AMC API Endpoint",
+            memory_size=512,
+            timeout=cdk.Duration.minutes(1),
+            runtime = Runtime.PYTHON_3_8,
+            layers = [self._wfm_helper_layer, self._powertools_layer],
+            environment={
+                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER": self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS": "300",
+                "ADMISSION_CONTROL_DYNAMODB_TABLE": self._amc_admission_control_table.table_name,
+                "GLOBAL_SUBMISSIONS_PER_SECOND": "10",
+                "GLOBAL_SUBMISSION_BURST_CAPACITY": "50",
+                "EXECUTION_SLOT_WAIT_SECONDS": "60"
             },
             role=self._event_queue_consumer_role
         )
@@ -553,7 +628,11 @@ class WorkFlowManagerService(BaseStack):
             runtime = Runtime.PYTHON_3_8,
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
-                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name
+                "CUSTOMERS_DYNAMODB_TABLE": self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER": self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS": "300",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY": "workflowHash",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_COUNT": "8"
             },
             role=self._event_queue_producer_role 
         )
@@ -579,6 +658,8 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "EXECUTION_QUEUE_PRODUCER_LAMBA_ARN": lambda_events_queue_producer.function_arn,
+                "WORKFLOW_SCHEDULE_TABLE":self._amc_workflow_schedules_table.table_name,
+                "LEGACY_EVENTBRIDGE_SCHEDULES": "false"
             },
             role=self._workflow_schedule_trigger_role
         )
@@ -606,6 +687,8 @@ class WorkFlowManagerService(BaseStack):
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
                 "CUSTOMERS_DYNAMODB_TABLE":self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER":self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS":"300",
                 "WORKFLOW_LIBRARY_DYNAMODB_TABLE":self._amc_workflow_library_table.table_name,
                 "WORKFLOWS_TABLE_NAME":self._amc_workflows_table.table_name,
                 "WORKFLOW_SCHEDULE_TABLE":self._amc_workflow_schedules_table.table_name,
@@ -616,7 +699,8 @@ class WorkFlowManagerService(BaseStack):
 
         workflow_library_trigger.add_event_source_mapping(
             "lambda-ddb-event-source-mapping",
-            batch_size=5,
+            batch_size=100,
+            max_batching_window=cdk.Duration.seconds(5),
             event_source_arn=self._amc_workflow_library_table.table_stream_arn,
             starting_position=StartingPosition.TRIM_HORIZON,
             retry_attempts=1
@@ -639,11 +723,16 @@ class WorkFlowManagerService(BaseStack):
                 "EXECUTION_QUEUE_PRODUCER_LAMBA_ARN": lambda_events_queue_producer.function_arn,
                 "WORKFLOW_LIBRARY_TRIGGER_LAMBDA_FUNCTION_NAME": workflow_library_trigger.function_arn,
                 "CUSTOMERS_DYNAMODB_TABLE":self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER":self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS":"300",
                 "KMS_MASTER_KEY":self._wfm_masker_key.key_arn, 
                 "TEAM":self._team,
                 "MICROSERVICE":self._microservice_name,
                 "ENV":self._environment_id,
-                "AMC_ENDPOINT_IAM_POLICY_ARN":self._invoke_amc_api_policy.managed_policy_arn
+                "AMC_ENDPOINT_IAM_POLICY_ARN":self._invoke_amc_api_policy.managed_policy_arn,
+                "WORKFLOW_QUEUE_EVENT_CONSUMER_LAMBDA_FUNCTION_NAME":lambda_execution_queue_event_consumer.function_name,
+                "EVENT_SOURCE_QUEUE_VISIBILITY_TIMEOUT":"120",
+                "EXECUTION_QUEUE_MAX_RECEIVE_COUNT":"20"
             },
             role=self._customer_config_trigger_role
         )
@@ -664,15 +753,21 @@ class WorkFlowManagerService(BaseStack):
             function_name=f"{function_name_prefix}-CustomScheduler-{self._environment_id}",
             code=Code.from_asset(os.path.join(f"{Path(__file__).parents[1]}", "workflow_management_service/lambdas/custom_scheduler")),
             handler="handler.lambda_handler",
-            description="This function will query workflows based on their frequency from AMCWorkflowSchedules table and pass payload to WorkflowExecutionQueueProducer Lambda",
+            description="This function will find the workflow schedules that are due in the AMCWorkflowSchedules table and send their payloads to the customer execution queues",
             memory_size=2048,
             timeout=cdk.Duration.minutes(15),
             runtime = Runtime.PYTHON_3_8,
             layers = [self._wfm_helper_layer, self._powertools_layer],
             environment={
-                "EXECUTION_QUEUE_PRODUCER_LAMBA_ARN": lambda_events_queue_producer.function_arn,
+                "CUSTOMERS_DYNAMODB_TABLE":self._customer_config_table.table_name,
+                "CUSTOMER_CONFIG_CACHE_VERSION_PARAMETER":self._customer_config_cache_version_parameter.parameter_name,
+                "CUSTOMER_CONFIG_CACHE_TTL_SECONDS":"300",
                 "WORKFLOW_SCHEDULE_TABLE":self._amc_workflow_schedules_table.table_name,
-                "CLOUDWATCH_RULE_NAME_PREFIX": self._microservice_name
+                "CLOUDWATCH_RULE_NAME_PREFIX": self._microservice_name,
+                "DISPATCH_WORKERS": "8",
+                "LEGACY_EVENTBRIDGE_SCHEDULES": "false",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY": "workflowHash",
+                "EXECUTION_QUEUE_MESSAGE_GROUP_COUNT": "8"
             },
             role= self._custom_scheduler_role
         )
@@ -787,6 +882,7 @@ class WorkFlowManagerService(BaseStack):
                             "sqs:ReceiveMessage",
                             "sqs:SendMessage",
                             "sqs:DeleteMessage",
+                            "sqs:ChangeMessageVisibility",
                             "sqs:GetQueueAttributes",
                             "sqs:GetQueueUrl"
                         ],
@@ -925,40 +1021,6 @@ class WorkFlowManagerService(BaseStack):
             )
         )
 
-        # Lambda - Invoke Execution Queue Producer
-        lambda_invoke_execution_producer = ManagedPolicy(
-            self,
-            f"{name_prefix}-Lambda-ExecutionQueueProducerInvoke-1",
-            managed_policy_name=f"{name_prefix}-{cdk.Aws.REGION}-Lambda-ExecutionQueueProducerInvoke-1",
-            description= "Allows API Invoke on the AMC API Endpoints",
-            document=PolicyDocument(
-                statements=[
-                    PolicyStatement(
-                        effect=Effect.ALLOW,
-                        actions=["lambda:InvokeFunction"],
-                        resources=[f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:function:{name_prefix}-ExecutionQueueProducer-{self._environment_id}"]
-                    )
-                ]
-            )
-        )
-
-        # Lambda - Invoke AMC API Interface
-        lambda_invoke_amc_api_interface = ManagedPolicy(
-            self,
-            f"{name_prefix}-Lambda-AMCApiInterfaceInvoke-1",
-            managed_policy_name=f"{name_prefix}-{cdk.Aws.REGION}-Lambda-AMCApiInterfaceInvoke-1",
-            description= "Allows API Invoke on the AMC API Lambda",
-            document=PolicyDocument(
-                statements=[
-                    PolicyStatement(
-                        effect=Effect.ALLOW,
-                        actions=["lambda:InvokeFunction"],
-                        resources=[f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:function:{name_prefix}-AmcApiInterface-{self._environment_id}"]
-                    )
-                ]
-            )
-        )
-
         # Lambda - Invoke Workflow Execution Producer
         lambda_invoke_execution_consumer = ManagedPolicy(
             self,
@@ -1090,6 +1152,58 @@ class WorkFlowManagerService(BaseStack):
             )
         )
 
+        # DDB - Read Write AMC Admission Control DynamoDB
+        ddb_rw_admission_control_policy = ManagedPolicy(
+            self,
+            f"{name_prefix}-WFM-DynamoDB-AdmissionControl-RW-1",
+            managed_policy_name=f"{name_prefix}-{cdk.Aws.REGION}-Workflowmgr-DynamoDB-AdmissionControl-RW-1",
+            description= "Allows Read and Write Access to the AMC Admission Control DynamoDB Table",
+            document=PolicyDocument(
+                statements=[
+                    PolicyStatement(
+                        effect=Effect.ALLOW,
+                        actions=[
+                            "dynamodb:DescribeTable",
+                            "dynamodb:GetItem",
+                            "dynamodb:PutItem",
+                            "dynamodb:UpdateItem"
+                        ],
+                        resources=[
+                            self._amc_admission_control_table.table_arn
+                        ]
+                    )
+                ]
+            )
+        )
+
+        # Lambda - Pause and resume the execution queue event source mappings while a customer has no free execution slots
+        execution_queue_event_consumer_arn = f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:function:{name_prefix}-WorkflowExecutionQueueEventConsumer-{self._environment_id}"
+        lambda_pause_event_source_mapping_policy = ManagedPolicy(
+            self,
+            f"{name_prefix}-Lambda-PauseExecutionQueueEventSourceMapping-1",
+            managed_policy_name=f"{name_prefix}-{cdk.Aws.REGION}-Lambda-PauseExecutionQueueEventSourceMapping-1",
+            description= "Allows the execution queue consumers to enable and disable the execution queue event source mappings",
+            document=PolicyDocument(
+                statements=[
+                    PolicyStatement(
+                        effect=Effect.ALLOW,
+                        actions=["lambda:ListEventSourceMappings"],
+                        resources=["*"]
+                    ),
+                    PolicyStatement(
+                        effect=Effect.ALLOW,
+                        actions=["lambda:UpdateEventSourceMapping"],
+                        resources=[f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:event-source-mapping:*"],
+                        conditions={
+                            "ArnLike":{
+                                "lambda:FunctionArn": execution_queue_event_consumer_arn
+                            }
+                        }
+                    )
+                ]
+            )
+        )
+
         # DDB - Read AMC Workflows DynamoDB
         ddb_read_workflows_policy = ManagedPolicy(
             self,
@@ -1136,6 +1250,8 @@ class WorkFlowManagerService(BaseStack):
                             "dynamodb:DescribeTable",
                             "dynamodb:Query",
                             "dynamodb:Scan",
+                            "dynamodb:GetItem",
+                            "dynamodb:BatchGetItem",
                             "dynamodb:BatchWriteItem",
                             "dynamodb:PutItem",
                             "dynamodb:UpdateItem",
@@ -1165,6 +1281,8 @@ class WorkFlowManagerService(BaseStack):
                             "dynamodb:ListGlobalTables",
                             "dynamodb:Query",
                             "dynamodb:Scan",
+                            "dynamodb:GetItem",
+                            "dynamodb:BatchGetItem",
                             "dynamodb:ListShards",
                             "dynamodb:GetRecords",
                             "dynamodb:GetShardIterator",
@@ -1175,6 +1293,13 @@ class WorkFlowManagerService(BaseStack):
                             self._customer_config_table.table_arn,
                             f"{self._customer_config_table.table_arn}/*"
                         ]
+                    ),
+                    PolicyStatement(
+                        effect=Effect.ALLOW,
+                        actions=[
+                            "ssm:GetParameter"
+                        ],
+                        resources=[self._customer_config_cache_version_parameter.parameter_arn]
                     )
                 ]
             )
@@ -1201,6 +1326,8 @@ class WorkFlowManagerService(BaseStack):
                             "dynamodb:GetShardIterator",
                             "dynamodb:Query",
                             "dynamodb:Scan",
+                            "dynamodb:GetItem",
+                            "dynamodb:BatchGetItem",
                             "dynamodb:BatchWriteItem",
                             "dynamodb:PutItem",
                             "dynamodb:UpdateItem",
@@ -1293,6 +1420,46 @@ class WorkFlowManagerService(BaseStack):
                             resources=[f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:function:{name_prefix}-WorkflowLibraryTrigger-{self._environment_id}"]
                         )
                     ]
+                ),
+                "PublishCustomerConfigCacheVersion":PolicyDocument(
+                    statements=[
+                        PolicyStatement(
+                            effect=Effect.ALLOW,
+                            actions=["ssm:PutParameter"],
+                            resources=[self._customer_config_cache_version_parameter.parameter_arn]
+                        )
+                    ]
+                ),
+                "ManageExecutionQueueEventSourceMappings":PolicyDocument(
+                    statements=[
+                        PolicyStatement(
+                            effect=Effect.ALLOW,
+                            actions=["lambda:ListEventSourceMappings"],
+                            resources=["*"]
+                        ),
+                        # CreateEventSourceMapping does not support resource level permissions, both actions are
+                        # limited to the WorkflowExecutionQueueEventConsumer with the function ARN condition
+                        PolicyStatement(
+                            effect=Effect.ALLOW,
+                            actions=["lambda:CreateEventSourceMapping"],
+                            resources=["*"],
+                            conditions={
+                                "ArnLike":{
+                                    "lambda:FunctionArn": execution_queue_event_consumer_arn
+                                }
+                            }
+                        ),
+                        PolicyStatement(
+                            effect=Effect.ALLOW,
+                            actions=["lambda:UpdateEventSourceMapping"],
+                            resources=[f"arn:aws:lambda:{cdk.Aws.REGION}:{cdk.Aws.ACCOUNT_ID}:event-source-mapping:*"],
+                            conditions={
+                                "ArnLike":{
+                                    "lambda:FunctionArn": execution_queue_event_consumer_arn
+                                }
+                            }
+                        )
+                    ]
                 )
             }
         )
@@ -1400,8 +1567,9 @@ class WorkFlowManagerService(BaseStack):
                 ddb_read_config_policy,
                 kms_decrypt_snssqs_key_policy,
                 sns_publish_policy,
-                lambda_invoke_amc_api_interface,
-                ddb_read_workflows_policy
+                self._invoke_amc_api_policy,
+                ddb_read_workflows_policy,
+                ddb_write_schedules_policy
             ]
         )
 
@@ -1435,7 +1603,23 @@ class WorkFlowManagerService(BaseStack):
                 sqs_execution_queue_policy,
                 sns_publish_policy,
                 kms_decrypt_snssqs_key_policy,
-                lambda_invoke_execution_consumer
+                lambda_invoke_execution_consumer,
+                ddb_rw_admission_control_policy,
+                lambda_pause_event_source_mapping_policy
+            ]
+        )
+
+        # IAM Role GenerateDateRangeValues
+        self._generate_data_range_role = Role(
+            self,
+            "IAM Role GenerateDateRangeValues 1",
+            description=f"Role for the GenerateDateRangeValues Lambda for {name_prefix}",
+            assumed_by=ServicePrincipal("lambda.amazonaws.com"),
+            managed_policies=[
+                ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"),
+                ddb_read_config_policy,
+                sqs_execution_queue_policy,
+                kms_decrypt_snssqs_key_policy
             ]
         )
 
@@ -1463,7 +1647,8 @@ class WorkFlowManagerService(BaseStack):
             managed_policies=[
                 ManagedPolicy.from_aws_managed_policy_name("service-role/AWSLambdaBasicExecutionRole"),
                 ddb_write_schedules_policy,
-                lambda_invoke_execution_producer,
+                ddb_read_config_policy,
+                sqs_execution_queue_policy,
                 sns_publish_policy,
                 kms_decrypt_snssqs_key_policy
             ]
@@ -0,0 +1,365 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Offline stand-in for an AMC instance API, used to load test WFM without a live AMC instance.
+# Implements /workflows, /workflowExecutions (with minCreationTime, workflowId and nextToken pagination) and /schedules
+# with in memory state. Every endpoint path prefix is a separate AMC instance, for example http://host:port/amc/a and
+# http://host:port/amc/b do not share workflows or executions. Every response is delayed by a configurable latency,
+# requests above the configured rate are throttled with 429 responses, executions are rejected with 429 while the
+# maximum number of concurrent executions of the instance is running and executions move from PENDING to RUNNING to
+# SUCCEEDED (or FAILED) after configurable durations. The request signature is not checked.
+# Usage: python scripts/benchmarks/amc_api_simulator.py [--port 8080] [--latency-ms 50] [--requests-per-second 5]
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+RESOURCES = ['workflows', 'workflowExecutions', 'schedules']
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+
+def format_time(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).strftime(TIME_FORMAT)[:-4] + 'Z'
+
+
+def parse_time(time_string):
+    time_string = time_string.rstrip('Z')
+    for time_format in ['%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S']:
+        try:
+            return datetime.strptime(time_string, time_format).replace(tzinfo=timezone.utc).timestamp()
+        except ValueError:
+            continue
+    raise ValueError('invalid time {}'.format(time_string))
+
+
+class TokenBucket:
+    def __init__(self, requests_per_second, burst_capacity):
+        self.requests_per_second = requests_per_second
+        self.capacity = burst_capacity
+        self.tokens = burst_capacity
+        self.updated_time = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated_time) * self.requests_per_second)
+            self.updated_time = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+class SimulatedExecution:
+    def __init__(self, workflow_execution_id, payload, create_time, pending_seconds, running_seconds, fails):
+        self.workflow_execution_id = workflow_execution_id
+        self.payload = payload
+        self.create_time = create_time
+        self.pending_seconds = pending_seconds
+        self.running_seconds = running_seconds
+        self.fails = fails
+
+    # the status and last updated time of the execution at a point in time
+    def get_state(self, now):
+        running_time = self.create_time + self.pending_seconds
+        completed_time = running_time + self.running_seconds
+        if now < running_time:
+            return 'PENDING', self.create_time
+        if now < completed_time:
+            return 'RUNNING', running_time
+        return ('FAILED' if self.fails else 'SUCCEEDED'), completed_time
+
+    def is_active(self, now):
+        return self.get_state(now)[0] in ['PENDING', 'RUNNING']
+
+    def to_dict(self, now):
+        status, last_updated_time = self.get_state(now)
+        execution = {
+            'workflowExecutionId': self.workflow_execution_id,
+            'workflowId': self.payload.get('workflowId'),
+            'status': status,
+            'createTime': format_time(self.create_time),
+            'lastUpdatedTime': format_time(last_updated_time),
+            'timeWindowStart': self.payload.get('timeWindowStart'),
+            'timeWindowEnd': self.payload.get('timeWindowEnd'),
+            'timeWindowType': self.payload.get('timeWindowType', 'EXPLICIT'),
+            'parameterValues': self.payload.get('parameterValues', {})
+        }
+        if 'timeWindowTimeZone' in self.payload:
+            execution['timeWindowTimeZone'] = self.payload['timeWindowTimeZone']
+        if status == 'SUCCEEDED':
+            execution['outputS3URI'] = 's3://amc-simulator/{}/'.format(self.workflow_execution_id)
+        if status == 'FAILED':
+            execution['statusReason'] = 'Simulated failure'
+        return execution
+
+
+class SimulatedInstance:
+    def __init__(self):
+        self.workflows = {}
+        self.executions = []
+        self.executions_by_id = {}
+        self.schedules = {}
+
+
+class AMCAPISimulator:
+    def __init__(self, latency_seconds=0.05, latency_jitter_seconds=0.0, requests_per_second=None,
+                 burst_capacity=None, max_concurrent_executions=None, page_size=100, pending_seconds=1.0,
+                 running_seconds=5.0, failure_rate=0.0, seed=None):
+        self.latency_seconds = latency_seconds
+        self.latency_jitter_seconds = latency_jitter_seconds
+        self.rate_limiter = None
+        if requests_per_second is not None:
+            self.rate_limiter = TokenBucket(requests_per_second, burst_capacity or requests_per_second)
+        self.max_concurrent_executions = max_concurrent_executions
+        self.page_size = page_size
+        self.pending_seconds = pending_seconds
+        self.running_seconds = running_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+
+        self.lock = threading.Lock()
+        # path prefix -> SimulatedInstance
+        self.instances = {}
+        # (method, resource, status) -> number of requests
+        self.request_counts = {}
+        self.server = None
+
+    def start(self, host='127.0.0.1', port=0):
+        simulator = self
+
+        class RequestHandler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def handle_request(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                body = self.rfile.read(length).decode('utf-8') if length > 0 else ''
+                status, response_body, headers = simulator.handle(self.command, self.path, body)
+                data = json.dumps(response_body).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(data)))
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(data)
+
+            do_GET = do_POST = do_PUT = do_DELETE = handle_request
+
+        self.server = ThreadingHTTPServer((host, port), RequestHandler)
+        self.server.daemon_threads = True
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return 'http://{}:{}/amc'.format(host, self.server.server_address[1])
+
+    def stop(self):
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+    def get_latency(self):
+        if self.latency_jitter_seconds <= 0:
+            return self.latency_seconds
+        with self.lock:
+            jitter = self.random.uniform(-self.latency_jitter_seconds, self.latency_jitter_seconds)
+        return max(0.0, self.latency_seconds + jitter)
+
+    def count_request(self, method, resource, status):
+        with self.lock:
+            key = (method, resource, status)
+            self.request_counts[key] = self.request_counts.get(key, 0) + 1
+
+    def handle(self, method, path, body):
+        time.sleep(self.get_latency())
+        parsed_url = urlparse(path)
+        segments = [segment for segment in parsed_url.path.split('/') if segment != '']
+        resource_index = next((index for index, segment in enumerate(segments) if segment in RESOURCES), None)
+        if resource_index is None:
+            self.count_request(method, None, 404)
+            return 404, {'message': 'Not Found'}, {}
+        with self.lock:
+            instance = self.instances.setdefault('/'.join(segments[:resource_index]), SimulatedInstance())
+        resource = segments[resource_index]
+        resource_id = segments[resource_index + 1] if len(segments) > resource_index + 1 else None
+        query = {name: values[0] for name, values in parse_qs(parsed_url.query).items()}
+
+        if self.rate_limiter is not None and not self.rate_limiter.try_acquire():
+            self.count_request(method, resource, 429)
+            return 429, {'message': 'Rate exceeded'}, {'Retry-After': '1'}
+
+        try:
+            payload = json.loads(body) if body else {}
+        except ValueError:
+            self.count_request(method, resource, 400)
+            return 400, {'message': 'Request body is not valid JSON'}, {}
+
+        handler = getattr(self, 'handle_{}'.format(resource))
+        status, response_body = handler(instance, method, resource_id, query, payload)
+        self.count_request(method, resource, status)
+        return status, response_body, {}
+
+    def handle_workflows(self, instance, method, workflow_id, query, payload):
+        with self.lock:
+            if workflow_id is None:
+                if method == 'GET':
+                    return self.get_page('workflows', sorted(instance.workflows.values(), key=lambda workflow: workflow[
+                        'workflowId']), query)
+                if method != 'POST':
+                    return 405, {'message': 'Method Not Allowed'}
+                if 'workflowId' not in payload or 'sqlQuery' not in payload:
+                    return 400, {'message': 'workflowId and sqlQuery are required'}
+                if payload['workflowId'] in instance.workflows:
+                    return 400, {'message': 'Workflow with ID {} already exists.'.format(payload['workflowId'])}
+                instance.workflows[payload['workflowId']] = payload
+                return 200, {'workflowId': payload['workflowId']}
+
+            if workflow_id not in instance.workflows:
+                return 404, {'message': 'Workflow with ID {} does not exist.'.format(workflow_id)}
+            if method == 'GET':
+                return 200, instance.workflows[workflow_id]
+            if method == 'PUT':
+                instance.workflows[workflow_id] = dict(payload, workflowId=workflow_id)
+                return 200, {'workflowId': workflow_id}
+            if method == 'DELETE':
+                del instance.workflows[workflow_id]
+                return 200, {'workflowId': workflow_id}
+            return 405, {'message': 'Method Not Allowed'}
+
+    def handle_workflowExecutions(self, instance, method, workflow_execution_id, query, payload):
+        now = time.time()
+        with self.lock:
+            if workflow_execution_id is not None:
+                if method != 'GET':
+                    return 405, {'message': 'Method Not Allowed'}
+                if workflow_execution_id not in instance.executions_by_id:
+                    return 404, {'message': 'Execution {} does not exist.'.format(workflow_execution_id)}
+                return 200, instance.executions_by_id[workflow_execution_id].to_dict(now)
+
+            if method == 'GET':
+                executions = instance.executions
+                if 'minCreationTime' in query:
+                    try:
+                        min_creation_time = parse_time(query['minCreationTime'])
+                    except ValueError as e:
+                        return 400, {'message': str(e)}
+                    executions = [execution for execution in executions if
+                                  execution.create_time >= min_creation_time]
+                if 'workflowId' in query:
+                    executions = [execution for execution in executions if
+                                  execution.payload.get('workflowId') == query['workflowId']]
+                return self.get_page('executions', [execution.to_dict(now) for execution in executions], query)
+
+            if method != 'POST':
+                return 405, {'message': 'Method Not Allowed'}
+            if 'workflowId' not in payload:
+                return 400, {'message': 'workflowId is required'}
+            active_executions = sum(1 for execution in instance.executions if execution.is_active(now))
+            if self.max_concurrent_executions is not None and active_executions >= self.max_concurrent_executions:
+                return 429, {'message': 'Maximum number of concurrent executions reached'}
+
+            execution = SimulatedExecution(str(uuid.uuid4()), payload, now, self.pending_seconds,
+                                           self.running_seconds, self.random.random() < self.failure_rate)
+            instance.executions.append(execution)
+            instance.executions_by_id[execution.workflow_execution_id] = execution
+            return 200, execution.to_dict(now)
+
+    def handle_schedules(self, instance, method, schedule_id, query, payload):
+        with self.lock:
+            if schedule_id is None:
+                if method == 'GET':
+                    return self.get_page('schedules', sorted(instance.schedules.values(), key=lambda schedule: schedule[
+                        'scheduleId']), query)
+                if method != 'POST':
+                    return 405, {'message': 'Method Not Allowed'}
+                schedule = dict(payload, scheduleId=payload.get('scheduleId', str(uuid.uuid4())))
+                if schedule['scheduleId'] in instance.schedules:
+                    return 400, {'message': 'Schedule with ID {} already exists.'.format(schedule['scheduleId'])}
+                instance.schedules[schedule['scheduleId']] = schedule
+                return 200, {'scheduleId': schedule['scheduleId']}
+
+            if schedule_id not in instance.schedules:
+                return 404, {'message': 'Schedule with ID {} does not exist.'.format(schedule_id)}
+            if method == 'GET':
+                return 200, instance.schedules[schedule_id]
+            if method == 'PUT':
+                instance.schedules[schedule_id] = dict(payload, scheduleId=schedule_id)
+                return 200, {'scheduleId': schedule_id}
+            if method == 'DELETE':
+                del instance.schedules[schedule_id]
+                return 200, {'scheduleId': schedule_id}
+            return 405, {'message': 'Method Not Allowed'}
+
+    # the last page has no nextToken, the token is the offset of the next page
+    def get_page(self, name, items, query):
+        next_token = query.get('nextToken') or '0'
+        if not re.match('^[0-9]+$', next_token):
+            return 400, {'message': 'Invalid nextToken'}
+        offset = int(next_token)
+        page = {name: items[offset:offset + self.page_size]}
+        if offset + self.page_size < len(items):
+            page['nextToken'] = str(offset + self.page_size)
+        return 200, page
+
+    def get_execution_status_counts(self):
+        now = time.time()
+        status_counts = {}
+        with self.lock:
+            for execution in [execution for instance in self.instances.values() for execution in
+                              instance.executions]:
+                status = execution.get_state(now)[0]
+                status_counts[status] = status_counts.get(status, 0) + 1
+        return status_counts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Runs the AMC API simulator until it is interrupted')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=0)
+    parser.add_argument('--requests-per-second', type=float, default=None)
+    parser.add_argument('--max-concurrent-executions', type=int, default=None)
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--pending-seconds', type=float, default=1)
+    parser.add_argument('--running-seconds', type=float, default=5)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    arguments = parser.parse_args()
+
+    simulator = AMCAPISimulator(
+        latency_seconds=arguments.latency_ms / 1000, latency_jitter_seconds=arguments.jitter_ms / 1000,
+        requests_per_second=arguments.requests_per_second,
+        max_concurrent_executions=arguments.max_concurrent_executions, page_size=arguments.page_size,
+        pending_seconds=arguments.pending_seconds, running_seconds=arguments.running_seconds,
+        failure_rate=arguments.failure_rate)
+    print('AMC API simulator listening on {}'.format(simulator.start(arguments.host, arguments.port)))
+    try:
+        while True:
+            time.sleep(60)
+    except KeyboardInterrupt:
+        simulator.stop()
+
+
+if __name__ == '__main__':
+    main()
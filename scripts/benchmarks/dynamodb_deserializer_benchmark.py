@@ -0,0 +1,89 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Compares deserializing DynamoDB items with a new TypeDeserializer per attribute (the previous Utils
+# implementation), a shared TypeDeserializer and the wfm_dynamodb_types fast path.
+# Usage: python scripts/benchmarks/dynamodb_deserializer_benchmark.py [number of items]
+
+import os
+import sys
+import timeit
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'amc_quickstart', 'microservices',
+                                'workflow_management_service', 'lambda-layers', 'wfm-layer', 'python'))
+
+from wfm import wfm_dynamodb_types
+
+
+# an item shaped like a record of the AMC execution status table
+def get_items(number_of_items):
+    serializer = TypeSerializer()
+    items = []
+    for index in range(number_of_items):
+        item = {
+            'customerId': 'customer-{}'.format(index % 20),
+            'workflowExecutionId': 'execution-{:08d}'.format(index),
+            'workflowId': 'workflow-{}'.format(index % 50),
+            'executionStatus': 'SUCCEEDED',
+            'createTime': '2022-06-01T00:00:00Z',
+            'lastUpdatedTime': '2022-06-01T01:00:00Z',
+            'timeWindowStart': '2022-05-31T00:00:00',
+            'timeWindowEnd': '2022-06-01T00:00:00',
+            'timeWindowType': 'EXPLICIT',
+            'invalidationOffsetSecs': Decimal(0),
+            'expireTimestamp': Decimal(1662000000 + index),
+            'parameterValues': {'campaignId': str(index), 'lookbackDays': Decimal(30), 'includeTest': False},
+            'outputS3URI': 's3://bucket/workflow/{}/output.csv'.format(index)
+        }
+        items.append({key: serializer.serialize(value) for key, value in item.items()})
+    return items
+
+
+def deserialize_with_new_deserializers(item):
+    return {k: TypeDeserializer().deserialize(value=v) for k, v in item.items()}
+
+
+shared_deserializer = TypeDeserializer()
+
+
+def deserialize_with_shared_deserializer(item):
+    return {k: shared_deserializer.deserialize(value=v) for k, v in item.items()}
+
+
+def main():
+    number_of_items = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    items = get_items(number_of_items)
+    repeat = 5
+
+    implementations = [
+        ('TypeDeserializer per attribute', deserialize_with_new_deserializers),
+        ('shared TypeDeserializer', deserialize_with_shared_deserializer),
+        ('wfm_dynamodb_types', wfm_dynamodb_types.deserialize_item),
+        ('wfm_dynamodb_types native numbers', lambda item: wfm_dynamodb_types.deserialize_item(item, True))
+    ]
+
+    assert wfm_dynamodb_types.deserialize_item(items[0]) == deserialize_with_new_deserializers(items[0])
+
+    print('items: {}'.format(number_of_items))
+    baseline_seconds = None
+    for name, deserialize in implementations:
+        seconds = min(timeit.repeat(lambda: [deserialize(item) for item in items], number=1, repeat=repeat))
+        baseline_seconds = baseline_seconds or seconds
+        print('{:<36} {:.3f}s {:.1f}x'.format(name, seconds, baseline_seconds / seconds))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,105 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Compares the cached parameter function evaluator in the WFM layer with the previous implementation
+# that parsed every parameter on every call.
+# Usage: python scripts/benchmarks/parameter_functions_benchmark.py [number of payloads]
+
+import calendar
+import os
+import sys
+import timeit
+from datetime import datetime, timedelta
+from dateutil.relativedelta import relativedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'amc_quickstart', 'microservices',
+                                'workflow_management_service', 'lambda-layers', 'wfm-layer', 'python'))
+
+from wfm import wfm_parameter_functions
+
+
+# the implementation that was copied in wfm_utils, AMCAPIInterface and the queue consumer
+def legacy_process_parameter_functions(parameter):
+    def get_offset_value(offset_string):
+        return int(offset_string.split('(')[1].split(')')[0])
+
+    if parameter.upper() == 'NOW()':
+        return datetime.today().strftime('%Y-%m-%dT%H:%M:%S')
+
+    if "TODAY(" in parameter.upper():
+        return (datetime.today() + timedelta(days=get_offset_value(parameter))).strftime('%Y-%m-%dT00:00:00')
+
+    if "LASTDAYOFOFFSETMONTH(" in parameter.upper():
+        date_with_month_offset = datetime.today() + relativedelta(months=get_offset_value(parameter))
+        last_day = calendar.monthrange(date_with_month_offset.year, date_with_month_offset.month)[1]
+        return datetime(date_with_month_offset.year, date_with_month_offset.month, last_day).strftime('%Y-%m-%dT00:00:00')
+
+    if "FIRSTDAYOFOFFSETMONTH(" in parameter.upper():
+        date_with_month_offset = datetime.today() + relativedelta(months=get_offset_value(parameter))
+        return datetime(date_with_month_offset.year, date_with_month_offset.month, 1).strftime('%Y-%m-%dT00:00:00')
+
+    if "FIFTEENTHDAYOFOFFSETMONTH(" in parameter.upper():
+        date_with_month_offset = datetime.today() + relativedelta(months=get_offset_value(parameter))
+        return datetime(date_with_month_offset.year, date_with_month_offset.month, 15).strftime('%Y-%m-%dT00:00:00')
+    return parameter
+
+
+def legacy_process_payload_parameters(payload):
+    for parameter in payload['parameterValues']:
+        payload['parameterValues'][parameter] = legacy_process_parameter_functions(payload['parameterValues'][parameter])
+    payload['timeWindowStart'] = legacy_process_parameter_functions(payload['timeWindowStart'])
+    payload['timeWindowEnd'] = legacy_process_parameter_functions(payload['timeWindowEnd'])
+    return payload
+
+
+def get_payloads(number_of_payloads):
+    return [{
+        'workflowId': 'workflow-{}'.format(index % 50),
+        'timeWindowStart': 'TODAY(-{})'.format(index % 30),
+        'timeWindowEnd': 'TODAY(0)',
+        'parameterValues': {
+            'monthStart': 'FIRSTDAYOFOFFSETMONTH(-1)',
+            'monthEnd': 'LASTDAYOFOFFSETMONTH(-1)',
+            'midMonth': 'FIFTEENTHDAYOFOFFSETMONTH(0)',
+            'runTime': 'NOW()',
+            'campaignId': 'campaign-{}'.format(index)
+        }
+    } for index in range(number_of_payloads)]
+
+
+def main():
+    number_of_payloads = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    repeat = 5
+
+    legacy_seconds = min(timeit.repeat(
+        lambda: [legacy_process_payload_parameters(payload) for payload in get_payloads(number_of_payloads)],
+        number=1, repeat=repeat))
+
+    def process_batch():
+        now = wfm_parameter_functions.get_reference_time()
+        return [wfm_parameter_functions.process_payload_parameters(payload, now) for payload in
+                get_payloads(number_of_payloads)]
+
+    cached_seconds = min(timeit.repeat(process_batch, number=1, repeat=repeat))
+    payload_seconds = min(timeit.repeat(lambda: get_payloads(number_of_payloads), number=1, repeat=repeat))
+
+    print('payloads: {}'.format(number_of_payloads))
+    print('legacy evaluator: {:.3f}s'.format(legacy_seconds - payload_seconds))
+    print('cached evaluator: {:.3f}s'.format(cached_seconds - payload_seconds))
+    print('speedup: {:.1f}x'.format((legacy_seconds - payload_seconds) / max(cached_seconds - payload_seconds, 1e-9)))
+    print('parse cache: {}'.format(wfm_parameter_functions.parse_parameter.cache_info()))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,542 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: End to end benchmark of the SDLF pipeline stages on synthetic AMC exports, with S3, DynamoDB, SQS,
+# SSM, KMS and Glue mocked by moto. Synthetic CSV exports with a configurable number of rows and columns, a ratio of
+# filtered rows, values with escaped quotes and versioned file names are written to the raw bucket and processed by
+#   light-transform       amc_light_transform.CustomTransform.transform_object for every export
+#   light-postupdate      the sdlf_light_transform postupdate-metadata handler for every transformed object
+#   heavy-transform       amc_heavy_transform.CustomTransform.transform_object for every batch of objects
+#   heavy-process-files   process_files of the sdlf_heavy_transform Glue job for every batch
+#   heavy-postupdate      the sdlf_heavy_transform postupdate-metadata handler for every batch
+# The wall time, the peak resident set size and the number of AWS API calls of every stage are printed and appended
+# as a JSON line with the git commit to the results file, --compare prints the change to the last earlier result
+# recorded with the same parameters.
+# Requires pandas, awswrangler and moto (pip install pandas awswrangler "moto[s3,dynamodb,sqs,ssm,kms,glue]").
+# Usage: python scripts/benchmarks/sdlf_pipeline_benchmark.py [--files 20] [--rows 10000] [--columns 20] [--compare]
+
+import argparse
+import collections
+import contextlib
+import importlib.util
+import io
+import json
+import logging
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import threading
+import time
+import types
+from datetime import datetime, timedelta, timezone
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+REPOSITORY_PATH = os.path.abspath(os.path.join(BENCHMARKS_PATH, '..', '..'))
+QUICKSTART_PATH = os.path.join(REPOSITORY_PATH, 'amc_quickstart')
+sys.path.insert(0, os.path.join(QUICKSTART_PATH, 'foundations', 'layers', 'data_lake_library', 'python'))
+
+DEFAULT_RESULTS_FILE = os.path.join(BENCHMARKS_PATH, 'results', 'sdlf_pipeline_benchmark.jsonl')
+REGION = 'us-east-1'
+TEAM = 'amcteam'
+DATASET = 'amcdataset'
+PIPELINE = 'main'
+ENVIRONMENT = 'dev'
+RAW_BUCKET = 'sdlf-benchmark-raw'
+STAGE_BUCKET = 'sdlf-benchmark-stage'
+ANALYTICS_BUCKET = 'sdlf-benchmark-analytics'
+STAGE_CATALOG = 'sdlf_benchmark_stage'
+CUSTOMER_CONFIG_TABLE = 'sdlf-benchmark-customer-config'
+OBJECT_METADATA_TABLE = 'sdlf-benchmark-object-metadata'
+DATASETS_TABLE = 'sdlf-benchmark-datasets'
+HEAVY_TRANSFORM_JOB_NAME = 'sdlf-benchmark-heavy-transform'
+STAGE_B_QUEUE = 'sdlf-benchmark-stage-b.fifo'
+# the tables of the dev configuration instance in octagon-configuration.json
+OCTAGON_PIPELINES_TABLE = 'octagon-Pipelines-{}'.format(ENVIRONMENT)
+OCTAGON_PEH_TABLE = 'octagon-PipelineExecutionHistory-{}'.format(ENVIRONMENT)
+
+STAGES = ['light-transform', 'light-postupdate', 'heavy-transform', 'heavy-process-files', 'heavy-postupdate']
+RSS_SAMPLE_SECONDS = 0.005
+
+# metric columns of the synthetic exports, the names match the data type overrides of the heavy transform
+METRIC_COLUMNS = [('impressions', 'int'), ('clicks', 'int'), ('total_cost', 'float'), ('ecpm', 'float'),
+                  ('reach_pct', 'float'), ('new_to_brand', 'bool'), ('creative_name', 'string'),
+                  ('purchases', 'int'), ('avg_frequency', 'float'), ('line_item_name', 'string')]
+STRING_VALUES = ['Spring Sale', 'Brand Awareness', 'Retargeting', 'Holiday Video', 'Prime Day']
+
+
+def get_export_header(number_of_columns):
+    columns = ['campaign_id', 'event_date', 'filtered']
+    index = 0
+    while len(columns) < number_of_columns:
+        name, column_type = METRIC_COLUMNS[index % len(METRIC_COLUMNS)]
+        columns.append((name if index < len(METRIC_COLUMNS) else '{}_{}'.format(name, index // len(METRIC_COLUMNS)),
+                        column_type))
+        index += 1
+    return columns
+
+
+def get_string_value(generator, escaped_quote_ratio):
+    value = generator.choice(STRING_VALUES)
+    if generator.random() < escaped_quote_ratio:
+        # AMC escapes quotes in values with a backslash
+        value = '{} \\"{}\\"'.format(value, generator.choice(STRING_VALUES))
+    return '"{}"'.format(value)
+
+
+def get_metric_value(generator, column_type, escaped_quote_ratio):
+    if column_type == 'int':
+        return str(generator.randint(0, 100000))
+    if column_type == 'float':
+        return '{:.4f}'.format(generator.uniform(0, 1000))
+    if column_type == 'bool':
+        return generator.choice(['true', 'false'])
+    return get_string_value(generator, escaped_quote_ratio)
+
+
+# a CSV export the way AMC writes it, the metrics of filtered rows are empty
+def get_export_content(generator, arguments, export_date):
+    columns = get_export_header(arguments.columns)
+    lines = [','.join(column if isinstance(column, str) else column[0] for column in columns)]
+    for row in range(arguments.rows):
+        filtered = generator.random() < arguments.filtered_ratio
+        values = ['"{}"'.format(generator.randint(1, 500)), export_date.strftime('%Y-%m-%d'),
+                  'true' if filtered else 'false']
+        for name, column_type in columns[3:]:
+            values.append('' if filtered and column_type != 'string' else
+                          get_metric_value(generator, column_type, arguments.escaped_quote_ratio))
+        lines.append(','.join(values))
+    return '\n'.join(lines) + '\n'
+
+
+# raw bucket keys of the exports: workflow=<name>/schedule=<frequency>/<time>Z-<basename>[-verN].csv
+def get_export_keys(generator, arguments):
+    export_time = datetime(2022, 6, 1, tzinfo=timezone.utc)
+    keys = []
+    for index in range(arguments.files):
+        workflow_name = 'benchmark_workflow_{}'.format(index % arguments.workflows)
+        basename = workflow_name
+        if generator.random() < arguments.versioned_ratio:
+            basename = '{}-ver{}'.format(basename, generator.randint(2, 3))
+        file_time = export_time + timedelta(hours=index)
+        keys.append((file_time, 'workflow={}/schedule={}/{}.{:03d}Z-{}.csv'.format(
+            workflow_name, generator.choice(['adhoc', 'daily', 'weekly']), file_time.strftime('%Y-%m-%dT%H:%M:%S'),
+            index % 1000, basename)))
+    return keys
+
+
+class ApiCallCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = collections.Counter()
+
+    # every boto3 client of the stages, including the ones created by awswrangler, sends its requests through
+    # BaseClient._make_api_call
+    def install(self):
+        import botocore.client
+        make_api_call = botocore.client.BaseClient._make_api_call
+        counter = self
+
+        def counted_make_api_call(client, operation_name, api_params):
+            with counter.lock:
+                counter.calls['{}.{}'.format(client.meta.service_model.service_name, operation_name)] += 1
+            return make_api_call(client, operation_name, api_params)
+
+        botocore.client.BaseClient._make_api_call = counted_make_api_call
+
+    def reset(self):
+        with self.lock:
+            calls = dict(self.calls)
+            self.calls.clear()
+        return calls
+
+
+class RSSSampler:
+    def __init__(self):
+        self.page_size = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+        self.peak_rss = 0
+        self.running = False
+        self.thread = None
+
+    # the current resident set size, the peak of the process is used where /proc is not available
+    def get_rss(self):
+        try:
+            with open('/proc/self/statm') as statm:
+                return int(statm.read().split()[1]) * self.page_size
+        except (OSError, IndexError, ValueError):
+            max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return max_rss if sys.platform == 'darwin' else max_rss * 1024
+
+    def sample(self):
+        while self.running:
+            self.peak_rss = max(self.peak_rss, self.get_rss())
+            time.sleep(RSS_SAMPLE_SECONDS)
+
+    def start(self):
+        self.peak_rss = self.get_rss()
+        self.running = True
+        self.thread = threading.Thread(target=self.sample, daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return max(self.peak_rss, self.get_rss())
+
+
+class StageRecorder:
+    def __init__(self, verbose):
+        self.verbose = verbose
+        self.api_call_counter = ApiCallCounter()
+        self.stages = {}
+
+    @contextlib.contextmanager
+    def stage(self, name, items):
+        # the setup calls made before the stage are not counted
+        self.api_call_counter.reset()
+        rss_sampler = RSSSampler()
+        rss_sampler.start()
+        output = io.StringIO()
+        start_time = time.perf_counter()
+        try:
+            if self.verbose:
+                yield
+            else:
+                # the transforms print every file name and schema
+                with contextlib.redirect_stdout(output):
+                    yield
+        finally:
+            wall_seconds = time.perf_counter() - start_time
+            api_calls = self.api_call_counter.reset()
+            self.stages[name] = {
+                'items': items,
+                'wallSeconds': round(wall_seconds, 4),
+                'peakRssMb': round(rss_sampler.stop() / (1024 * 1024), 1),
+                'apiCalls': sum(api_calls.values()),
+                'apiCallsByOperation': dict(sorted(api_calls.items()))
+            }
+
+
+class LambdaContext:
+    def __init__(self, function_name):
+        self.function_name = function_name
+
+
+def load_module(module_name, path):
+    spec = importlib.util.spec_from_file_location(module_name, path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def load_glue_job():
+    # getResolvedOptions is only called when main.py runs as the Glue job script
+    try:
+        import awsglue.utils
+    except ImportError:
+        awsglue = types.ModuleType('awsglue')
+        awsglue.utils = types.ModuleType('awsglue.utils')
+        awsglue.utils.getResolvedOptions = None
+        sys.modules['awsglue'] = awsglue
+        sys.modules['awsglue.utils'] = awsglue.utils
+    return load_module('sdlf_heavy_transform_glue_job', os.path.join(
+        QUICKSTART_PATH, 'foundations', 'glue', 'pyshell_scripts', 'sdlf_heavy_transform', 'main.py'))
+
+
+def create_table(dynamodb, table_name, key_name, global_secondary_index=None):
+    table = {
+        'TableName': table_name,
+        'BillingMode': 'PAY_PER_REQUEST',
+        'KeySchema': [{'AttributeName': key_name, 'KeyType': 'HASH'}],
+        'AttributeDefinitions': [{'AttributeName': key_name, 'AttributeType': 'S'}]
+    }
+    if global_secondary_index is not None:
+        index_name, index_key_name = global_secondary_index
+        table['AttributeDefinitions'].append({'AttributeName': index_key_name, 'AttributeType': 'S'})
+        table['GlobalSecondaryIndexes'] = [{
+            'IndexName': index_name,
+            'KeySchema': [{'AttributeName': index_key_name, 'KeyType': 'HASH'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }]
+    dynamodb.create_table(**table)
+
+
+# the resources the SDLF foundations and dataset stacks create and the SSM parameters the stages read them from
+def create_resources(boto3):
+    s3 = boto3.client('s3')
+    for bucket in [RAW_BUCKET, STAGE_BUCKET, ANALYTICS_BUCKET]:
+        s3.create_bucket(Bucket=bucket)
+    stage_key_arn = boto3.client('kms').create_key(Description='sdlf benchmark stage key')['KeyMetadata']['Arn']
+
+    dynamodb = boto3.client('dynamodb')
+    create_table(dynamodb, CUSTOMER_CONFIG_TABLE, 'customer_hash_key', ('amc-index', 'hash_key'))
+    create_table(dynamodb, OBJECT_METADATA_TABLE, 'id')
+    create_table(dynamodb, DATASETS_TABLE, 'name')
+    create_table(dynamodb, OCTAGON_PIPELINES_TABLE, 'name')
+    create_table(dynamodb, OCTAGON_PEH_TABLE, 'id')
+    dynamodb_resource = boto3.resource('dynamodb')
+    dynamodb_resource.Table(CUSTOMER_CONFIG_TABLE).put_item(Item={
+        'customer_hash_key': 'benchmarkcustomer', 'hash_key': RAW_BUCKET, 'prefix': 'bench'})
+    for stage in ['a', 'b']:
+        dynamodb_resource.Table(OCTAGON_PIPELINES_TABLE).put_item(Item={
+            'name': get_pipeline_name(stage), 'status': 'ACTIVE', 'version': 1})
+
+    sqs = boto3.client('sqs')
+    sqs.create_queue(QueueName=STAGE_B_QUEUE, Attributes={'FifoQueue': 'true'})
+
+    glue = boto3.client('glue')
+    glue.create_database(DatabaseInput={'Name': STAGE_CATALOG})
+    glue.create_job(Name=HEAVY_TRANSFORM_JOB_NAME, Role='sdlf-benchmark-glue-role',
+                    Command={'Name': 'pythonshell', 'ScriptLocation': 's3://{}/main.py'.format(RAW_BUCKET)})
+
+    parameters = {
+        '/AMC/S3/RawBucket': RAW_BUCKET,
+        '/AMC/S3/StageBucket': STAGE_BUCKET,
+        '/AMC/S3/AnalyticsBucket': ANALYTICS_BUCKET,
+        '/AMC/KMS/StageBucketKeyArn': stage_key_arn,
+        '/AMC/DynamoDB/DataLake/CustomerConfig': CUSTOMER_CONFIG_TABLE,
+        '/AMC/DynamoDB/ObjectMetadata': OBJECT_METADATA_TABLE,
+        '/AMC/DynamoDB/Datasets': DATASETS_TABLE,
+        '/AMC/SQS/{}/{}StageBQueue'.format(TEAM, DATASET): STAGE_B_QUEUE,
+        '/AMC/Glue/{}/{}/StageDataCatalog'.format(TEAM, DATASET): STAGE_CATALOG,
+        '/AMC/Glue/{}/{}/SDLFHeavyTranformJobName'.format(TEAM, DATASET): HEAVY_TRANSFORM_JOB_NAME
+    }
+    ssm = boto3.client('ssm')
+    for name, value in parameters.items():
+        ssm.put_parameter(Name=name, Value=value, Type='String')
+    return stage_key_arn
+
+
+def get_pipeline_name(stage):
+    return '{}-{}-stage-{}'.format(TEAM, PIPELINE, stage)
+
+
+def upload_exports(boto3, arguments):
+    generator = random.Random(arguments.seed)
+    s3 = boto3.client('s3')
+    export_bytes = 0
+    keys = []
+    for export_time, key in get_export_keys(generator, arguments):
+        content = get_export_content(generator, arguments, export_time).encode('utf-8')
+        s3.put_object(Bucket=RAW_BUCKET, Key=key, Body=content)
+        export_bytes += len(content)
+        keys.append(key)
+    return keys, export_bytes
+
+
+# the pipeline execution records are created by the stage routing functions before the postupdate functions run
+def start_pipeline_executions(octagon, stage, count):
+    octagon_client = octagon.OctagonClient().with_run_lambda(True).with_configuration_instance(ENVIRONMENT).build()
+    return [octagon_client.start_pipeline_execution(get_pipeline_name(stage)) for index in range(count)]
+
+
+def get_postupdate_body(stage):
+    return {
+        'team': TEAM,
+        'dataset': DATASET,
+        'pipeline': PIPELINE,
+        'pipeline_stage': 'Stage{}'.format(stage.upper()),
+        'org': 'benchmark',
+        'app': 'amc',
+        'env': ENVIRONMENT
+    }
+
+
+def get_batches(keys, batch_size):
+    return [keys[index:index + batch_size] for index in range(0, len(keys), batch_size)]
+
+
+def run_pipeline(boto3, arguments, recorder):
+    from datalake_library import octagon
+
+    stage_key_arn = create_resources(boto3)
+    raw_keys, export_bytes = upload_exports(boto3, arguments)
+
+    # the transforms read their configuration when they are imported, the resources have to exist before
+    from datalake_library.transforms.stage_a_transforms import amc_light_transform
+    from datalake_library.transforms.stage_b_transforms import amc_heavy_transform
+    os.environ['stage_bucket'] = STAGE_BUCKET
+    lambdas_path = os.path.join(QUICKSTART_PATH, 'data_lake', 'lambdas')
+    light_postupdate = load_module('sdlf_light_postupdate_metadata', os.path.join(
+        lambdas_path, 'sdlf_light_transform', 'postupdate-metadata', 'handler.py'))
+    heavy_postupdate = load_module('sdlf_heavy_postupdate_metadata', os.path.join(
+        lambdas_path, 'sdlf_heavy_transform', 'postupdate-metadata', 'handler.py'))
+    glue_job = load_glue_job()
+
+    stage_keys = []
+    with recorder.stage('light-transform', len(raw_keys)):
+        light_transform = amc_light_transform.CustomTransform()
+        for key in raw_keys:
+            stage_keys += light_transform.transform_object(RAW_BUCKET, key, TEAM, DATASET)
+
+    peh_ids = start_pipeline_executions(octagon, 'a', len(stage_keys))
+    with recorder.stage('light-postupdate', len(stage_keys)):
+        context = LambdaContext('sdlf-{}-{}-postupdate-a'.format(TEAM, PIPELINE))
+        for key, peh_id in zip(stage_keys, peh_ids):
+            light_postupdate.lambda_handler({'body': dict(get_postupdate_body('a'), processedKeys=[key],
+                                                          peh_id=peh_id)}, context)
+
+    batches = get_batches(stage_keys, arguments.heavy_batch_size)
+    jobs = []
+    with recorder.stage('heavy-transform', len(batches)):
+        heavy_transform = amc_heavy_transform.CustomTransform()
+        for batch in batches:
+            jobs.append(heavy_transform.transform_object(STAGE_BUCKET, batch, TEAM, DATASET))
+
+    with recorder.stage('heavy-process-files', len(stage_keys)):
+        output_location = 's3://{}/post-stage/{}/{}'.format(STAGE_BUCKET, TEAM, DATASET)
+        for batch in batches:
+            glue_job.process_files(['s3://{}/{}'.format(STAGE_BUCKET, key) for key in batch], output_location,
+                                   stage_key_arn, STAGE_CATALOG)
+
+    peh_ids = start_pipeline_executions(octagon, 'b', len(batches))
+    with recorder.stage('heavy-postupdate', len(batches)):
+        context = LambdaContext('sdlf-{}-{}-postupdate-b'.format(TEAM, PIPELINE))
+        for job, peh_id in zip(jobs, peh_ids):
+            heavy_postupdate.lambda_handler({'body': dict(get_postupdate_body('b'), bucket=STAGE_BUCKET,
+                                                          job=dict(job, peh_id=peh_id))}, context)
+
+    post_stage_objects = sum(1 for page in boto3.client('s3').get_paginator('list_objects_v2').paginate(
+        Bucket=STAGE_BUCKET, Prefix='post-stage/') for obj in page.get('Contents', []))
+    tables = boto3.client('glue').get_tables(DatabaseName=STAGE_CATALOG)['TableList']
+    return {'exportBytes': export_bytes, 'stageObjects': len(stage_keys), 'postStageObjects': post_stage_objects,
+            'tables': len(tables)}
+
+
+def get_git_commit():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', 'HEAD'], cwd=REPOSITORY_PATH, capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPOSITORY_PATH,
+                               capture_output=True, text=True, check=True).stdout.strip() != ''
+        return commit, dirty
+    except (OSError, subprocess.CalledProcessError):
+        return None, None
+
+
+def get_parameters(arguments):
+    return {name: getattr(arguments, name) for name in
+            ['files', 'rows', 'columns', 'workflows', 'filtered_ratio', 'escaped_quote_ratio', 'versioned_ratio',
+             'heavy_batch_size', 'seed']}
+
+
+def read_results(results_file):
+    if not os.path.exists(results_file):
+        return []
+    with open(results_file) as results:
+        return [json.loads(line) for line in results if line.strip() != '']
+
+
+def append_result(results_file, result):
+    os.makedirs(os.path.dirname(os.path.abspath(results_file)), exist_ok=True)
+    with open(results_file, 'a') as results:
+        results.write(json.dumps(result, sort_keys=True) + '\n')
+
+
+def get_change(value, baseline_value):
+    if not baseline_value:
+        return ''
+    return '{:+.1f}%'.format((value - baseline_value) * 100.0 / baseline_value)
+
+
+def print_result(result, baseline):
+    if baseline is not None:
+        print('compared to the result of commit {} recorded {}'.format(baseline['commit'], baseline['timestamp']))
+    print('{:<22} {:>7} {:>10} {:>8} {:>10} {:>8} {:>10} {:>8}'.format(
+        'stage', 'items', 'wall s', '', 'peak MB', '', 'API calls', ''))
+    for stage in STAGES:
+        metrics = result['stages'][stage]
+        baseline_metrics = baseline['stages'].get(stage, {}) if baseline is not None else {}
+        print('{:<22} {:>7} {:>10.3f} {:>8} {:>10.1f} {:>8} {:>10} {:>8}'.format(
+            stage, metrics['items'],
+            metrics['wallSeconds'], get_change(metrics['wallSeconds'], baseline_metrics.get('wallSeconds')),
+            metrics['peakRssMb'], get_change(metrics['peakRssMb'], baseline_metrics.get('peakRssMb')),
+            metrics['apiCalls'], get_change(metrics['apiCalls'], baseline_metrics.get('apiCalls'))))
+    print('pipeline {}'.format(json.dumps(result['pipeline'])))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks the SDLF pipeline stages on synthetic AMC exports')
+    parser.add_argument('--files', type=int, default=20, help='number of exports')
+    parser.add_argument('--rows', type=int, default=10000, help='rows per export')
+    parser.add_argument('--columns', type=int, default=20, help='columns per export')
+    parser.add_argument('--workflows', type=int, default=4, help='number of workflows the exports belong to')
+    parser.add_argument('--filtered-ratio', type=float, default=0.1, help='ratio of filtered rows')
+    parser.add_argument('--escaped-quote-ratio', type=float, default=0.05,
+                        help='ratio of string values with escaped quotes')
+    parser.add_argument('--versioned-ratio', type=float, default=0.25, help='ratio of exports with a -verN suffix')
+    parser.add_argument('--heavy-batch-size', type=int, default=10, help='objects per heavy transform job')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--results-file', default=DEFAULT_RESULTS_FILE)
+    parser.add_argument('--compare', action='store_true',
+                        help='compare with the last earlier result recorded with the same parameters')
+    parser.add_argument('--baseline-commit', default=None,
+                        help='compare with the last result recorded for this commit instead')
+    parser.add_argument('--no-save', action='store_true', help='do not append the result to the results file')
+    parser.add_argument('--verbose', action='store_true', help='show the output of the stages')
+    arguments = parser.parse_args()
+
+    try:
+        import awswrangler
+        import pandas
+        from moto import mock_aws
+    except ImportError as e:
+        sys.exit('{}, the benchmark requires pandas, awswrangler and moto: pip install pandas awswrangler '
+                 '"moto[s3,dynamodb,sqs,ssm,kms,glue]"'.format(e))
+
+    os.environ.update({'AWS_DEFAULT_REGION': REGION, 'AWS_ACCESS_KEY_ID': 'benchmark',
+                       'AWS_SECRET_ACCESS_KEY': 'benchmark'})
+    if not arguments.verbose:
+        logging.disable(logging.INFO)
+
+    recorder = StageRecorder(arguments.verbose)
+    recorder.api_call_counter.install()
+    with mock_aws():
+        import boto3
+        pipeline = run_pipeline(boto3, arguments, recorder)
+
+    commit, dirty = get_git_commit()
+    result = {
+        'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ'),
+        'commit': commit,
+        'dirty': dirty,
+        'python': platform.python_version(),
+        'pandas': pandas.__version__,
+        'awswrangler': awswrangler.__version__,
+        'parameters': get_parameters(arguments),
+        'pipeline': pipeline,
+        'stages': recorder.stages
+    }
+
+    baseline = None
+    if arguments.compare or arguments.baseline_commit is not None:
+        earlier_results = [earlier_result for earlier_result in read_results(arguments.results_file) if
+                           earlier_result['parameters'] == result['parameters'] and
+                           (arguments.baseline_commit is None or
+                            (earlier_result['commit'] or '').startswith(arguments.baseline_commit))]
+        if len(earlier_results) > 0:
+            baseline = earlier_results[-1]
+        else:
+            print('no earlier result with the same parameters in {}'.format(arguments.results_file))
+
+    print_result(result, baseline)
+    if not arguments.no_save:
+        append_result(arguments.results_file, result)
+        print('result appended to {}'.format(arguments.results_file))
+
+
+if __name__ == '__main__':
+    main()
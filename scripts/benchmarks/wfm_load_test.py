@@ -0,0 +1,324 @@
+# Copyright 2022 Amazon.com, Inc. or its affiliates. All Rights Reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License").
+# You may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+# Description: Load test of the WFM execution path against the AMC API simulator, with DynamoDB, SQS and SNS mocked
+# by moto. Workflows are created and updated with the asyncio AMC API interface, the execution requests are
+# queued with the execution queue producer and the queue is drained by alternating process_queue of the queue
+# consumer with sync_workflow_statuses, the way the scheduled consumer and status sync run in a deployment.
+# Throughput of each phase and the p50/p99 latency of the handler invocations and of the AMC API requests are printed.
+# Requires moto (pip install "moto[dynamodb,sqs,sns]").
+# Usage: python scripts/benchmarks/wfm_load_test.py [--customers 2] [--executions 200] [--latency-ms 50]
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+
+BENCHMARKS_PATH = os.path.dirname(os.path.abspath(__file__))
+WFM_PATH = os.path.join(BENCHMARKS_PATH, '..', '..', 'amc_quickstart', 'microservices', 'workflow_management_service')
+sys.path.insert(0, os.path.join(WFM_PATH, 'lambda-layers', 'wfm-layer', 'python'))
+sys.path.insert(0, BENCHMARKS_PATH)
+
+from amc_api_simulator import AMCAPISimulator
+
+CUSTOMERS_TABLE_NAME = 'wfm-load-test-customers'
+TRACKING_TABLE_NAME = 'wfm-load-test-executions'
+REGION = 'us-east-1'
+
+
+def percentile(values, percent):
+    if len(values) == 0:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(percent / 100.0 * (len(values) - 1))))]
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = {}
+
+    def add(self, name, seconds):
+        with self.lock:
+            self.latencies.setdefault(name, []).append(seconds)
+
+    def timed(self, name, function, *args):
+        start_time = time.perf_counter()
+        try:
+            return function(*args)
+        finally:
+            self.add(name, time.perf_counter() - start_time)
+
+    def print_summary(self, title):
+        print(title)
+        print('  {:<40} {:>8} {:>10} {:>10} {:>10}'.format('', 'count', 'p50 ms', 'p99 ms', 'max ms'))
+        for name, latencies in sorted(self.latencies.items()):
+            print('  {:<40} {:>8} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, len(latencies), percentile(latencies, 50) * 1000, percentile(latencies, 99) * 1000,
+                max(latencies) * 1000))
+
+
+# each handler is loaded as its own module, they are all named handler
+def load_handler(lambda_name):
+    spec = importlib.util.spec_from_file_location('wfm_load_test_{}'.format(lambda_name),
+                                                  os.path.join(WFM_PATH, 'lambdas', lambda_name, 'handler.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_customer_config(customer_id, endpoint, queue_name, topic_arn, arguments):
+    return {
+        'customerId': customer_id,
+        'AMC': {
+            'amcApiEndpoint': '{}/{}'.format(endpoint, customer_id),
+            'amcInstanceRegion': REGION,
+            'maximumConcurrentWorkflowExecutions': arguments.max_concurrent_executions,
+            'WFM': {
+                'amcWorkflowExecutionSQSQueueName': queue_name,
+                'snsTopicArn': topic_arn,
+                'syncWorkflowStatuses': {
+                    'amcWorkflowExecutionTrackingDynamoDBTableName': TRACKING_TABLE_NAME,
+                    'WorkflowStatusRecordRetentionDays': 90
+                }
+            }
+        }
+    }
+
+
+def create_resources(boto3, endpoint, arguments):
+    dynamodb = boto3.client('dynamodb', region_name=REGION)
+    dynamodb.create_table(TableName=CUSTOMERS_TABLE_NAME, BillingMode='PAY_PER_REQUEST',
+                          KeySchema=[{'AttributeName': 'customerId', 'KeyType': 'HASH'}],
+                          AttributeDefinitions=[{'AttributeName': 'customerId', 'AttributeType': 'S'}])
+    dynamodb.create_table(
+        TableName=TRACKING_TABLE_NAME, BillingMode='PAY_PER_REQUEST',
+        KeySchema=[{'AttributeName': 'customerId', 'KeyType': 'HASH'},
+                   {'AttributeName': 'workflowExecutionId', 'KeyType': 'RANGE'}],
+        AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'} for name in
+                              ['customerId', 'workflowExecutionId', 'executionStatus']],
+        GlobalSecondaryIndexes=[{
+            'IndexName': 'executionStatus-workflowId-index',
+            'KeySchema': [{'AttributeName': 'customerId', 'KeyType': 'HASH'},
+                          {'AttributeName': 'executionStatus', 'KeyType': 'RANGE'}],
+            'Projection': {'ProjectionType': 'ALL'}
+        }])
+    topic_arn = boto3.client('sns', region_name=REGION).create_topic(Name='wfm-load-test')['TopicArn']
+
+    sqs = boto3.client('sqs', region_name=REGION)
+    customers_table = boto3.resource('dynamodb', region_name=REGION).Table(CUSTOMERS_TABLE_NAME)
+    configs = []
+    queue_urls = {}
+    for index in range(arguments.customers):
+        customer_id = 'loadtest{}'.format(index)
+        queue_name = 'wfm-load-test-{}.fifo'.format(customer_id)
+        queue_urls[customer_id] = sqs.create_queue(
+            QueueName=queue_name, Attributes={'FifoQueue': 'true', 'ContentBasedDeduplication': 'true'})['QueueUrl']
+        config = get_customer_config(customer_id, endpoint, queue_name, topic_arn, arguments)
+        customers_table.put_item(Item=config)
+        configs.append(config)
+    return configs, queue_urls
+
+
+def get_queued_messages(sqs, queue_url):
+    attributes = sqs.get_queue_attributes(
+        QueueUrl=queue_url, AttributeNames=['ApproximateNumberOfMessages', 'ApproximateNumberOfMessagesNotVisible'])[
+        'Attributes']
+    return int(attributes['ApproximateNumberOfMessages']) + int(attributes['ApproximateNumberOfMessagesNotVisible'])
+
+
+def get_workflow_payloads(arguments):
+    return [{
+        'workflowId': 'loadtest-workflow-{}'.format(index),
+        'sqlQuery': 'SELECT campaign, SUM(impressions) AS impressions FROM dsp_impressions GROUP BY campaign',
+        'filteredMetricsDiscriminatorColumn': 'filtered'
+    } for index in range(arguments.workflows)]
+
+
+def get_execution_payloads(arguments):
+    return [{
+        'workflowId': 'loadtest-workflow-{}'.format(index % arguments.workflows),
+        'timeWindowStart': 'TODAY(-{})'.format(1 + index % 7),
+        'timeWindowEnd': 'TODAY(0)',
+        'timeWindowType': 'EXPLICIT',
+        'parameterValues': {'runTime': 'NOW()', 'batch': str(index)}
+    } for index in range(arguments.executions)]
+
+
+def run_workflow_phase(configs, arguments, recorder, logger):
+    from amc_api_interface import wfm_amc_api_async
+
+    async def run_customer(config, payloads):
+        amc_api = wfm_amc_api_async.AsyncAMCAPIInterface(logger, config, arguments.workflow_workers)
+        # the second create finds the existing workflows and updates them
+        results = await amc_api.create_workflows(payloads)
+        results += await amc_api.create_workflows(payloads)
+        return results
+
+    payloads = get_workflow_payloads(arguments)
+    start_time = time.perf_counter()
+    failed = 0
+    for config in configs:
+        results = recorder.timed('create and update workflows', wfm_amc_api_async.run, run_customer(config, payloads))
+        failed += sum(1 for result in results if result is None)
+    duration = time.perf_counter() - start_time
+    requests = len(configs) * len(payloads) * 2
+    print('workflows: {} create and update calls ({} failed) in {:.2f}s, {:.1f} calls/s'.format(
+        requests, failed, duration, requests / duration))
+
+
+def run_producer_phase(producer, configs, arguments, recorder):
+    payloads = get_execution_payloads(arguments)
+    customer_ids = [config['customerId'] for config in configs]
+    start_time = time.perf_counter()
+    messages_sent = 0
+    for batch_start in range(0, len(payloads), arguments.producer_batch_size):
+        batch = payloads[batch_start:batch_start + arguments.producer_batch_size]
+        response = recorder.timed('execution_queue_producer', producer.lambda_handler,
+                                  {'customerId': customer_ids, 'payload': batch}, None)
+        messages_sent += sum(result['messages_sent_successfully'] for result in response['body'])
+    duration = time.perf_counter() - start_time
+    print('producer: {} messages queued in {:.2f}s, {:.1f} messages/s'.format(
+        messages_sent, duration, messages_sent / duration))
+    return messages_sent
+
+
+def run_drain_phase(consumer, sync, configs, queue_urls, simulator, sqs, arguments, recorder):
+    start_time = time.perf_counter()
+    submitted = 0
+    throttled_runs = 0
+    rounds = 0
+    while time.perf_counter() - start_time < arguments.timeout_seconds:
+        rounds += 1
+        for config in configs:
+            result = recorder.timed('process_queue', consumer.process_queue, config)
+            submitted += len(result['executionsSubmitted'])
+            throttled_runs += 1 if result['throttled'] else 0
+        for config in configs:
+            recorder.timed('sync_workflow_statuses', sync.sync_workflow_statuses, config)
+
+        queued_messages = sum(get_queued_messages(sqs, queue_url) for queue_url in queue_urls.values())
+        status_counts = simulator.get_execution_status_counts()
+        if queued_messages == 0 and status_counts.get('PENDING', 0) + status_counts.get('RUNNING', 0) == 0:
+            break
+        time.sleep(arguments.poll_seconds)
+    duration = time.perf_counter() - start_time
+    print('drain: {} executions submitted in {:.2f}s over {} rounds ({} throttled consumer runs), {:.1f} '
+          'executions/s, simulator statuses {}'.format(submitted, duration, rounds, throttled_runs,
+                                                       submitted / duration,
+                                                       json.dumps(simulator.get_execution_status_counts())))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load tests the WFM lambda functions against the AMC API simulator')
+    parser.add_argument('--customers', type=int, default=2)
+    parser.add_argument('--workflows', type=int, default=20)
+    parser.add_argument('--executions', type=int, default=200, help='execution requests queued per customer')
+    parser.add_argument('--producer-batch-size', type=int, default=50)
+    parser.add_argument('--workflow-workers', type=int, default=5)
+    parser.add_argument('--max-concurrent-executions', type=int, default=50)
+    parser.add_argument('--latency-ms', type=float, default=50)
+    parser.add_argument('--jitter-ms', type=float, default=20)
+    parser.add_argument('--requests-per-second', type=float, default=None,
+                        help='rate at which the simulator starts throttling, unlimited by default')
+    parser.add_argument('--client-requests-per-second', type=float, default=50,
+                        help='AMC_API_REQUESTS_PER_SECOND of the WFM AMC API client')
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--pending-seconds', type=float, default=0.5)
+    parser.add_argument('--running-seconds', type=float, default=2)
+    parser.add_argument('--failure-rate', type=float, default=0)
+    parser.add_argument('--poll-seconds', type=float, default=0.5)
+    parser.add_argument('--timeout-seconds', type=float, default=300)
+    parser.add_argument('--skip-workflows', action='store_true')
+    parser.add_argument('--seed', type=int, default=1)
+    arguments = parser.parse_args()
+
+    try:
+        from moto import mock_aws
+    except ImportError:
+        sys.exit('moto is required to run the load test: pip install "moto[dynamodb,sqs,sns]"')
+
+    # the handlers read their settings when they are loaded, the credentials are only used for the request signatures
+    os.environ.update({
+        'AWS_DEFAULT_REGION': REGION,
+        'AWS_ACCESS_KEY_ID': 'loadtest',
+        'AWS_SECRET_ACCESS_KEY': 'loadtest',
+        'CUSTOMERS_DYNAMODB_TABLE': CUSTOMERS_TABLE_NAME,
+        'AMC_API_REQUESTS_PER_SECOND': str(arguments.client_requests_per_second),
+        'AMC_API_METRICS_ENABLED': 'false',
+        'EXECUTION_QUEUE_MESSAGE_GROUP_STRATEGY': 'workflowHash'
+    })
+    os.environ.pop('ADMISSION_CONTROL_DYNAMODB_TABLE', None)
+    # only errors of the handlers are printed
+    logging.disable(logging.INFO)
+
+    simulator = AMCAPISimulator(
+        latency_seconds=arguments.latency_ms / 1000, latency_jitter_seconds=arguments.jitter_ms / 1000,
+        requests_per_second=arguments.requests_per_second,
+        max_concurrent_executions=arguments.max_concurrent_executions,
+        page_size=arguments.page_size, pending_seconds=arguments.pending_seconds,
+        running_seconds=arguments.running_seconds, failure_rate=arguments.failure_rate, seed=arguments.seed)
+    endpoint = simulator.start()
+
+    amc_api_recorder = LatencyRecorder()
+    handler_recorder = LatencyRecorder()
+    with mock_aws():
+        import boto3
+        from amc_api_interface import wfm_amc_api_metrics
+
+        record_request = wfm_amc_api_metrics.record_request
+
+        def record_amc_api_request(config, request_method, url, status, latency_seconds, *args):
+            amc_api_recorder.add('{} {}'.format(request_method.upper(), wfm_amc_api_metrics.get_operation(
+                config['AMC']['amcApiEndpoint'], url)), latency_seconds)
+            record_request(config, request_method, url, status, latency_seconds, *args)
+
+        wfm_amc_api_metrics.record_request = record_amc_api_request
+
+        configs, queue_urls = create_resources(boto3, endpoint, arguments)
+        producer = load_handler('execution_queue_producer')
+        consumer = load_handler('workflow_queue_consumer')
+        sync = load_handler('sync_workflow_status')
+
+        # moto does not lock FIFO message groups across concurrent ReceiveMessage calls, the receives are serialized
+        # so that they do not return messages of a group that is already in flight
+        receive_lock = threading.Lock()
+        receive_message = consumer.sqs_client.receive_message
+
+        def receive_message_serialized(**kwargs):
+            with receive_lock:
+                return receive_message(**kwargs)
+
+        consumer.sqs_client.receive_message = receive_message_serialized
+
+        if not arguments.skip_workflows:
+            run_workflow_phase(configs, arguments, handler_recorder, logging.getLogger('wfm_load_test'))
+        run_producer_phase(producer, configs, arguments, handler_recorder)
+        run_drain_phase(consumer, sync, configs, queue_urls, simulator, boto3.client('sqs', region_name=REGION),
+                        arguments, handler_recorder)
+
+    simulator.stop()
+    print()
+    handler_recorder.print_summary('handler invocations')
+    amc_api_recorder.print_summary('AMC API requests')
+    print('simulator responses {}'.format(json.dumps(
+        {'{} {} {}'.format(*key): count for key, count in sorted(simulator.request_counts.items(), key=str)})))
+
+
+if __name__ == '__main__':
+    main()